@@ -1,19 +1,78 @@
-import sys, glob, sqlite3, pathlib
+"""
+Applies the post-processing scripts (*.sql / *.sql.post of sql_dir) to a built
+database. Scripts that don't depend on each other run concurrently over
+'--workers' processes (default: CPU count; 1 = one after another in name
+order), see sql_scripts.py. '--dry-run' prints the dependency graph, the
+levels that can run together and the critical path (timed from the last
+build's _build_stats when there is one) without running anything.
 
-db_path           = pathlib.Path(sys.argv[1]).resolve()        # output.db
-sql_dir           = pathlib.Path(sys.argv[2]).resolve()        # sql/
-extension_path    = pathlib.Path(sys.argv[3]).resolve()        # /opt/projects/sqlite_ext/regexp
+Usage:
+    python apply_sql_scripts.py <sqlite_db> <sql_dir> [regexp_extension] [--workers N] [--dry-run] [--profile[=kinds]]
+"""
+import os
+import pathlib
+import sqlite3
+import sys
+import time
 
-conn = sqlite3.connect(db_path)
-conn.enable_load_extension(True)                               # allow .load :contentReference[oaicite:2]{index=2}
-conn.load_extension(str(extension_path))                       # REGEXP functions :contentReference[oaicite:3]{index=3}
-cur  = conn.cursor()
+from build_stats import BuildStats, profile_flag
+from sql_scripts import (analyze_script, critical_path, last_timings, list_scripts, print_dag,
+                         register_functions, run_parallel, run_serial, script_graph, script_seconds)
 
-print(f"Applying post-processing scripts...")
-for sql_file in sorted(sql_dir.glob("*.sql")):
-    print(f"→ {sql_file.name}")
-    cur.executescript(sql_file.read_text(encoding="utf-8"))
 
-conn.commit()
-conn.close()
-print("All post-processing scripts applied.")
+def main():
+    args = sys.argv[1:]
+    profile = profile_flag(args)                                   # --profile[=cprofile,tracemalloc] (build_stats.py)
+    workers = os.cpu_count() or 1
+    if "--workers" in args:
+        i = args.index("--workers")
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    dry_run = "--dry-run" in args
+    if dry_run:
+        args.remove("--dry-run")
+    if len(args) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    db_path        = pathlib.Path(args[0]).resolve()               # output.db
+    sql_dir        = pathlib.Path(args[1]).resolve()               # sql/
+    extension_path = args[2] if len(args) > 2 else None            # /opt/projects/sqlite_ext/regexp (optional)
+
+    conn = sqlite3.connect(db_path)
+    scripts = [analyze_script(p) for p in list_scripts(sql_dir)]
+    source_tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    deps = script_graph(scripts, source_tables)
+    if dry_run:
+        print_dag(scripts, deps, last_timings(conn))
+        conn.close()
+        return
+
+    stats = BuildStats(db_path, "apply_sql_scripts", profile)
+    register_functions(conn, extension_path)
+    parallel = workers > 1 and len(scripts) > 1
+    print(f"Applying post-processing scripts"
+          + (f" ({workers} workers, by dependency)..." if parallel else "..."))
+    t0 = time.perf_counter()
+    try:
+        if parallel:
+            run_parallel(conn, str(db_path), scripts, deps, workers, extension_path)
+        else:
+            run_serial(conn, scripts)
+    except RuntimeError as e:
+        conn.close()
+        print(f"FAILED {e}")
+        sys.exit(1)
+    wall = time.perf_counter() - t0
+    conn.close()
+
+    seconds = script_seconds(stats.records)
+    for s in scripts:
+        print(f"   {seconds.get(s['name'], 0.0):7.2f}s  {s['name']}")
+    total, path = critical_path(scripts, deps, seconds)
+    print(f"{wall:.2f}s wall, {sum(seconds.values()):.2f}s in scripts; critical path {total:.2f}s: {' -> '.join(path)}")
+    stats.save()
+    print("All post-processing scripts applied.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Load benchmark of the endpoint templates: a seeded mix of representative
+requests (range filters, topN, comma-list site_codes, search terms, paging)
+replayed by N concurrent clients through template_executor.py against a built
+database, e.g. one scaled by scale_database.py:
+
+    python benchmarks/scale_database.py output.db /tmp/x10.db --factor 10
+    python benchmarks/bench_endpoints_load.py /tmp/x10.db --clients 1,4,8 --out x10.json
+
+Per client count and template: p50/p95/p99/mean latency and throughput,
+printed and written as JSON ('--out'). With '--baseline previous.json' the
+p95 of every (clients, template) both runs have is compared; one worse by
+more than '--tolerance' percent is reported and the exit status is 1.
+
+The result cache is off unless '--result-cache' is given, so every request
+runs its query. combined runs up to combined_with_ownership: DuckDB can't plan
+its opex stage (see benchmarks/check_endpoint_parity.py).
+
+Usage:
+    python benchmarks/bench_endpoints_load.py <built.db> [--clients 1,4,8] [--requests 200] [--seed 7]
+        [--result-cache] [--out results.json] [--baseline previous.json] [--tolerance 25]
+"""
+import json
+import os
+import queue
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from template_executor import TemplateExecutor, build_id
+
+
+def site_code_list(rng, codes):
+    return ",".join(rng.sample(codes, min(len(codes), rng.randint(2, 10))))
+
+def name_term(rng, names):
+    words = [w for w in rng.choice(names).split() if len(w) >= 4]
+    return words[0][:rng.randint(3, 5)] if words else "park"
+
+# (template, CTE or None, weight, [parameter generator(rng, sample)])
+WORKLOAD = [
+    ("vf/sites/combined.sql", "combined_with_ownership", 3, [
+        lambda rng, s: {},
+        lambda rng, s: {"remaining_power_capacity_in_kw_minimum": rng.choice([10, 50, 100])},
+        lambda rng, s: {"free_sections_minimum": rng.randint(1, 20), "free_sections_percentage_maximum": 90},
+        lambda rng, s: {"site_codes": site_code_list(rng, s["codes"])},
+        lambda rng, s: {"network_domain": rng.choice(["mobile", "fixed"]), "running_load_in_kw_maximum": 200},
+        lambda rng, s: {"site_name": name_term(rng, s["names"])},
+        lambda rng, s: {"is_lease_at_risk": True},
+    ]),
+    ("vf/elements/capacity.sql", None, 3, [
+        lambda rng, s: {},
+        lambda rng, s: {"network_domain": rng.choice(["mobile", "fixed"])},
+        lambda rng, s: {"remaining_power_capacity_in_kw_minimum": rng.choice([5, 20, 50]),
+                        "total_allocated_in_kw_maximum": rng.choice([100, 500])},
+        lambda rng, s: {"site_codes": site_code_list(rng, s["codes"])},
+        lambda rng, s: {"page": rng.randint(2, 5), "page_size": 50},
+        lambda rng, s: {"cursor": "", "page_size": 50},
+    ]),
+    ("vf/sites/opex/monthly.sql", None, 2, [
+        lambda rng, s: {},
+        lambda rng, s: dict(zip(("year", "min_month", "max_month"),
+                                (rng.choice([2023, 2024, 2025]), *sorted(rng.sample(range(1, 13), 2))))),
+        lambda rng, s: {"site_codes": site_code_list(rng, s["codes"])},
+        lambda rng, s: {"network_domain": rng.choice(["mobile", "fixed"])},
+    ]),
+    ("vf/sites/opex/summary/forecast.sql", None, 1, [
+        lambda rng, s: {"topN": rng.choice([10, 20, 50])},
+        lambda rng, s: {"topN": 20, "forecast_years": rng.randint(1, 5), "annual_growth_percent": rng.choice([5, 10, 23])},
+        lambda rng, s: {"site_codes": site_code_list(rng, s["codes"])},
+    ]),
+    ("vf/sites/capacity.sql", None, 1, [
+        lambda rng, s: {"network_domain": "mobile"},
+        lambda rng, s: {"site_regions": rng.choice(s["regions"])},
+    ]),
+]
+
+
+def label(template, cte):
+    return f"{template} [{cte}]" if cte else template
+
+def sample_keys(db):
+    conn = sqlite3.connect(db)
+    sample = {
+        "codes": [c for (c,) in conn.execute("SELECT site_code FROM vfsites WHERE site_code IS NOT NULL")],
+        "names": [n for (n,) in conn.execute("SELECT site_name FROM vfsites WHERE site_name IS NOT NULL")],
+        "regions": [r for (r,) in conn.execute("SELECT DISTINCT region FROM vfsites WHERE region IS NOT NULL")],
+    }
+    conn.close()
+    return sample
+
+def make_requests(n, seed, sample):
+    """n (template, cte, params) drawn by WORKLOAD weight; the same list for the same seed and database."""
+    rng = random.Random(seed)
+    weights = [w for _t, _c, w, _g in WORKLOAD]
+    requests = []
+    for _ in range(n):
+        template, cte, _w, generators = rng.choices(WORKLOAD, weights=weights)[0]
+        requests.append((template, cte, rng.choice(generators)(rng, sample)))
+    return requests
+
+def replay(executor, requests, clients, use_cache):
+    """({label: [latency s]}, {label: errors}, first error per label, wall seconds)."""
+    work = queue.Queue()
+    for request in requests:
+        work.put(request)
+    latencies, errors, messages = {}, {}, {}
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            try:
+                template, cte, params = work.get_nowait()
+            except queue.Empty:
+                return
+            t0 = time.perf_counter()
+            try:
+                executor.execute(template, params, use_cache=use_cache, cte=cte)
+                failed = None
+            except Exception as e:
+                failed = str(e).splitlines()[0]
+            elapsed = time.perf_counter() - t0
+            with lock:
+                key = label(template, cte)
+                if failed is None:
+                    latencies.setdefault(key, []).append(elapsed)
+                else:
+                    errors[key] = errors.get(key, 0) + 1
+                    messages.setdefault(key, failed)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, messages, time.perf_counter() - t0
+
+def summarize(latencies, errors, wall_s):
+    templates = {}
+    for key in sorted(set(latencies) | set(errors)):
+        ms = np.array(latencies.get(key, []), dtype=float) * 1000
+        templates[key] = {
+            "requests": int(len(ms)),
+            "errors": errors.get(key, 0),
+            "p50_ms": float(np.percentile(ms, 50)) if len(ms) else None,
+            "p95_ms": float(np.percentile(ms, 95)) if len(ms) else None,
+            "p99_ms": float(np.percentile(ms, 99)) if len(ms) else None,
+            "mean_ms": float(ms.mean()) if len(ms) else None,
+            "throughput_rps": len(ms) / wall_s,
+        }
+    return templates
+
+def regressions(results, baseline, tolerance):
+    """['clients=N template: p95 a -> b ms (+x%)'] for every p95 worse than the baseline by more than tolerance %."""
+    before = {(run["clients"], key): s for run in baseline.get("runs", []) for key, s in run["templates"].items()}
+    found = []
+    for run in results["runs"]:
+        for key, s in run["templates"].items():
+            old = before.get((run["clients"], key))
+            if not old or old["p95_ms"] is None or s["p95_ms"] is None:
+                continue
+            change = (s["p95_ms"] / old["p95_ms"] - 1) * 100
+            if change > tolerance:
+                found.append(f"clients={run['clients']} {key}: p95 {old['p95_ms']:.1f} -> {s['p95_ms']:.1f} ms (+{change:.0f}%)")
+    return found
+
+def main():
+    args = sys.argv[1:]
+    clients_list, n_requests, seed = [1, 4, 8], 200, 7
+    out_path = baseline_path = None
+    tolerance, use_cache = 25.0, False
+    for flag in ("--clients", "--requests", "--seed", "--out", "--baseline", "--tolerance"):
+        if flag in args:
+            i = args.index(flag)
+            value = args[i + 1]
+            del args[i:i + 2]
+            if flag == "--clients":
+                clients_list = [int(c) for c in value.split(",")]
+            elif flag == "--requests":
+                n_requests = int(value)
+            elif flag == "--seed":
+                seed = int(value)
+            elif flag == "--out":
+                out_path = value
+            elif flag == "--baseline":
+                baseline_path = value
+            else:
+                tolerance = float(value)
+    if "--result-cache" in args:
+        args.remove("--result-cache")
+        use_cache = True
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    db = args[0]
+    sample = sample_keys(db)
+    requests = make_requests(n_requests, seed, sample)
+    executor = TemplateExecutor(db, pool_size=max(clients_list))
+    # warm-up: every template prepared on one connection, not measured
+    for template, cte, _w, _g in WORKLOAD:
+        executor.execute(template, {}, use_cache=False, cte=cte)
+    print(f"{db}: {len(sample['codes'])} sites, {n_requests} requests (seed {seed}), "
+          f"result cache {'on' if use_cache else 'off'}")
+
+    results = {"database": os.path.abspath(db), "build_id": build_id(db), "sites": len(sample["codes"]),
+               "requests": n_requests, "seed": seed, "result_cache": use_cache, "runs": []}
+    print(f"{'clients':>7} {'template':<52} {'n':>5} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>7}")
+    for clients in clients_list:
+        executor.reset_stats()
+        latencies, errors, messages, wall_s = replay(executor, requests, clients, use_cache)
+        templates = summarize(latencies, errors, wall_s)
+        results["runs"].append({"clients": clients, "wall_s": wall_s,
+                                "throughput_rps": sum(s["requests"] for s in templates.values()) / wall_s,
+                                "templates": templates})
+        for key, s in templates.items():
+            q = lambda v: f"{v:>8.1f}" if v is not None else f"{'-':>8}"
+            print(f"{clients:>7} {key:<52} {s['requests']:>5} {s['errors']:>4} "
+                  f"{q(s['p50_ms'])} {q(s['p95_ms'])} {q(s['p99_ms'])} {s['throughput_rps']:>7.1f}")
+        print(f"{clients:>7} {'all':<52} {sum(s['requests'] for s in templates.values()):>5} "
+              f"{sum(errors.values()):>4} {'':>26} {results['runs'][-1]['throughput_rps']:>7.1f}")
+        for key, message in messages.items():
+            print(f"        first error, {key}: {message}")
+    executor.close()
+
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {out_path}")
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            found = regressions(results, json.load(f), tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        print(f"{len(found)} p95 regression(s) over {tolerance:.0f}% against {baseline_path}")
+        sys.exit(1 if found else 0)
+
+if __name__ == "__main__":
+    main()
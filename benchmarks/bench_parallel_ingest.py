@@ -0,0 +1,72 @@
+"""
+Wall time of multi_excel_to_sqlite vs. worker count on the bundled
+directory configs. Each run loads into a fresh database; the resulting
+table is checksummed so every worker count must produce the same rows in
+the same order.
+
+Usage:
+    python benchmarks/bench_parallel_ingest.py [config.json ...] [--workers 1,2,4,8]
+"""
+import contextlib
+import hashlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from excel_to_sqlite import load_config, multi_excel_to_sqlite
+
+DEFAULT_CONFIGS = ["config_space.json", "config_historic_mtx_capacity.json",
+                   "config_historic_fixed_capacity.json"]
+
+def table_digest(conn, table_name):
+    h = hashlib.sha256()
+    for row in conn.execute(f'SELECT * FROM "{table_name}" ORDER BY rowid'):
+        h.update(repr(row).encode("utf-8"))
+    return h.hexdigest()[:12]
+
+def run(config, workers):
+    config = dict(config, workers=workers)
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(path)
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            multi_excel_to_sqlite(config, conn)
+        elapsed = time.perf_counter() - t0
+        digest = table_digest(conn, config["tableName"])
+        conn.close()
+        return elapsed, digest
+    finally:
+        os.remove(path)
+
+def main():
+    args = sys.argv[1:]
+    counts = sorted({1, 2, 4, os.cpu_count() or 1})
+    if "--workers" in args:
+        i = args.index("--workers")
+        counts = [int(x) for x in args[i + 1].split(",")]
+        del args[i:i + 2]
+    config_files = args or DEFAULT_CONFIGS
+
+    os.chdir(REPO_DIR)
+    print(f"CPUs: {os.cpu_count()}")
+    print(f"{'config':<44} " + " ".join(f"{f'w={w}':>8}" for w in counts) + "  (wall s)")
+    for config_file in config_files:
+        config = load_config(config_file)
+        times, digests = [], set()
+        for w in counts:
+            elapsed, digest = run(config, w)
+            times.append(elapsed)
+            digests.add(digest)
+        same = "same output" if len(digests) == 1 else f"** OUTPUT DIFFERS: {sorted(digests)}"
+        print(f"{config_file:<44} " + " ".join(f"{t:>8.2f}" for t in times) + f"  {same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Time of the post-processing step (every sqlite/*.sql.post script) on a copy
+of a built database, per regexp implementation:
+
+    naive      - plain re.search()/re.sub() per call, no memo
+    builtin    - sqlite_regexp.py (compiled-pattern LRU + (pattern, text) memo)
+    extension  - the nalgeon/regexp loadable extension, when '--extension PATH'
+                 is given and this Python's sqlite3 can load extensions
+
+Usage:
+    python benchmarks/bench_post_sql.py <built.db> [--extension /opt/projects/sqlite_ext/regexp] [--repeat 3]
+"""
+import os
+import pathlib
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import sqlite_regexp
+from site_codes import register_site_code_functions
+
+SQL_DIR = pathlib.Path(REPO_DIR) / "sqlite"
+
+def register_naive(conn):
+    def capture(text, pattern, n=0):
+        if text is None or pattern is None:
+            return None
+        m = re.search(pattern, str(text), re.ASCII)
+        return m.group(n) if m and 0 <= n <= m.re.groups else None
+
+    def replace(text, pattern, replacement):
+        if text is None or pattern is None or replacement is None:
+            return None
+        return re.sub(pattern, sqlite_regexp.python_replacement(replacement), str(text), flags=re.ASCII)
+
+    conn.create_function("regexp", 2, lambda p, x: None if p is None or x is None
+                         else int(re.search(p, str(x), re.ASCII) is not None))
+    conn.create_function("regexp_capture", 2, capture)
+    conn.create_function("regexp_capture", 3, capture)
+    conn.create_function("regexp_replace", 3, replace)
+
+def register_extension(conn, extension_path):
+    conn.enable_load_extension(True)
+    conn.load_extension(extension_path)
+
+def run(built_db, variant, extension_path=None):
+    """Seconds per script for one run on a fresh copy of built_db."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "post.db")
+        shutil.copyfile(built_db, db)
+        conn = sqlite3.connect(db)
+        register_site_code_functions(conn)
+        if variant == "naive":
+            register_naive(conn)
+        elif variant == "builtin":
+            sqlite_regexp.compile_pattern.cache_clear()
+            sqlite_regexp.search.cache_clear()
+            sqlite_regexp.register_regexp_functions(conn)
+        else:
+            register_extension(conn, extension_path)
+        timings = {}
+        for sql_file in sorted(SQL_DIR.glob("*.sql.post")):
+            t0 = time.perf_counter()
+            conn.executescript(sql_file.read_text(encoding="utf-8"))
+            timings[sql_file.name] = time.perf_counter() - t0
+        conn.commit()
+        conn.close()
+        return timings
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    extension_path, repeat = None, 3
+    if "--extension" in args:
+        i = args.index("--extension")
+        extension_path = args[i + 1]
+        del args[i:i + 2]
+    if "--repeat" in args:
+        i = args.index("--repeat")
+        repeat = int(args[i + 1])
+        del args[i:i + 2]
+    built_db = args[0]
+
+    variants = ["naive", "builtin"]
+    if extension_path:
+        try:
+            register_extension(sqlite3.connect(":memory:"), extension_path)
+            variants.append("extension")
+        except (AttributeError, sqlite3.OperationalError) as e:
+            print(f"(extension skipped: {e})")
+
+    best = {}
+    for variant in variants:
+        runs = [run(built_db, variant, extension_path) for _ in range(repeat)]
+        best[variant] = {name: min(r[name] for r in runs) for name in runs[0]}
+
+    names = list(best[variants[0]])
+    print(f"{'script':<22} " + " ".join(f"{v:>10}" for v in variants) + f"  (s, best of {repeat})")
+    for name in names + ["total"]:
+        vals = [sum(best[v].values()) if name == "total" else best[v][name] for v in variants]
+        print(f"{name:<22} " + " ".join(f"{x:>10.3f}" for x in vals))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+excel_to_postgres output formats: time, file size and peak memory of the
+write phase for the legacy path (all INSERT strings in a list, then one
+"\\n".join) vs. the streaming writers (insert / multi-insert / copy, plain
+and gzip).
+
+Rows are read once from a config's workbook(s) and replicated '--scale'
+times, so the memory column shows whether it grows with the row count.
+
+Usage:
+    python benchmarks/bench_postgres_output.py [config.json] [excel_file] [--scale 20]
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from excel_to_postgres import (
+    load_config, single_excel_to_rows, multi_excel_to_rows,
+    insert_statements, write_sql, open_output,
+)
+
+def legacy_write(path, ddl, config, columns_info, rows):
+    all_sql = [ddl] + list(insert_statements(config, columns_info, rows))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(all_sql))
+
+def streaming_write(path, ddl, config, columns_info, rows, output_format):
+    with open_output(path) as f:
+        write_sql(f, ddl, config, columns_info, rows, output_format)
+
+def measure(fn, path):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn(path)
+    elapsed = time.perf_counter() - t0
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, os.path.getsize(path)
+
+def main():
+    args = sys.argv[1:]
+    scale = 20
+    if "--scale" in args:
+        i = args.index("--scale")
+        scale = int(args[i + 1])
+        del args[i:i + 2]
+    config_file = args[0] if args else "config_historic_fixed_capacity.json"
+    excel_file = args[1] if len(args) > 1 else None
+
+    os.chdir(REPO_DIR)
+    config = load_config(config_file)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if "directory" in config:
+            ddl, columns_info, rows = multi_excel_to_rows(config)
+        else:
+            ddl, columns_info, rows = single_excel_to_rows(excel_file, config)
+    rows = list(rows) * scale
+    print(f"{config['tableName']}: {len(rows)} rows x {len(columns_info)} cols")
+
+    variants = [
+        ("legacy list+join", ".sql", lambda p: legacy_write(p, ddl, config, columns_info, rows)),
+    ]
+    for output_format in ("insert", "multi-insert", "copy"):
+        for ext in (".sql", ".sql.gz"):
+            variants.append((f"{output_format}{' (gzip)' if ext.endswith('gz') else ''}", ext,
+                             lambda p, fmt=output_format: streaming_write(p, ddl, config, columns_info, rows, fmt)))
+
+    print(f"{'variant':<22} {'seconds':>8} {'peak MB':>8} {'file MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, ext, fn in variants:
+            elapsed, peak, size = measure(fn, os.path.join(tmp, "out" + ext))
+            print(f"{label:<22} {elapsed:>8.2f} {peak / 1048576:>8.1f} {size / 1048576:>8.1f}")
+
+if __name__ == "__main__":
+    main()
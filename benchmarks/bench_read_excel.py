@@ -0,0 +1,80 @@
+"""
+Compare the two read_excel_content readers ('full' vs 'streaming') on the
+bundled workbooks.
+
+Every (workbook, config, mode) run happens in a fresh interpreter so the
+reported peak RSS (ru_maxrss) belongs to that run alone.
+
+Usage:
+    python benchmarks/bench_read_excel.py
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+DATA_DIR = os.path.join(REPO_DIR, "structured-data-poc")
+
+# (workbook, config) pairs - single-file configs from run_sqlite.sh plus one
+# file from each historic/space directory
+CASES = [
+    ("Network Site List Updated 240225.xlsx", "config_network_site.json"),
+    ("MTX Site Capacity (Dulux).xlsx", "config_mtx_capacity_dulux.json"),
+    ("MTX Site Capacity (Dulux).xlsx", "config_mtx_capacity_dulux_BKLN06_room_capability.json"),
+    ("Fixed Site Capacity (CROWN).xlsx", "config_fixed_capacity_crown.json"),
+    ("Fixed Site Capacity (CROWN).xlsx", "config_fixed_capacity_crown_cover.json"),
+    ("Opex Data/Book1 (1).xlsx", "config_bridge.json"),
+    ("Opex Data/Network Elec.xlsx", "config_opex.json"),
+    ("All_Network_Site_data_AO_02_12_24 sanitised.xlsx", "config_ownership.json"),
+    ("Capacity Data/Dulux - Power Plant Loading 2024/01 Jan 24 MTX Site Capacity (Dulux).xlsx",
+     "config_historic_mtx_capacity_dulux_XGL001_room_capability.json"),
+    ("Network Site Space Data/ABH 2025-02- 4 07-45 suite_lines_info.xlsx", "config_space.json"),
+]
+
+def run_one(excel_file, config_file, mode):
+    """Runs a single read in this process and prints a JSON result line."""
+    from excel_to_sqlite import load_config, read_excel_content
+
+    config = load_config(config_file)
+    config["readMode"] = mode
+    t0 = time.perf_counter()
+    header, rows, _ = read_excel_content(excel_file, config)
+    elapsed = time.perf_counter() - t0
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"seconds": elapsed, "peak_rss_mb": peak_kb / 1024.0,
+                      "rows": len(rows or []), "cols": len(header or [])}))
+
+def measure(excel_file, config_file, mode):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--one", excel_file, config_file, mode],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--one":
+        run_one(sys.argv[2], sys.argv[3], sys.argv[4])
+        return
+
+    print(f"{'workbook / config':<72} {'full s':>8} {'stream s':>9} {'full MB':>8} {'stream MB':>10}")
+    totals = {"full": 0.0, "streaming": 0.0}
+    for rel_path, config_file in CASES:
+        excel_file = os.path.join(DATA_DIR, rel_path)
+        full = measure(excel_file, config_file, "full")
+        stream = measure(excel_file, config_file, "streaming")
+        if (full["rows"], full["cols"]) != (stream["rows"], stream["cols"]):
+            print(f"** shape mismatch for {rel_path} / {config_file}: {full} vs {stream}")
+        totals["full"] += full["seconds"]
+        totals["streaming"] += stream["seconds"]
+        label = f"{os.path.basename(rel_path)[:40]} / {config_file[7:-5]}"
+        print(f"{label:<72} {full['seconds']:>8.2f} {stream['seconds']:>9.2f} "
+              f"{full['peak_rss_mb']:>8.1f} {stream['peak_rss_mb']:>10.1f}")
+    print(f"{'total':<72} {totals['full']:>8.2f} {totals['streaming']:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Golden check and timing of the site-code expansion: the recursive-CTE
+splitter that vfsites.sql.post / vfbridge.sql.post used to run (kept below as
+LEGACY_EXPANSION_SQL) vs. expand_site_codes() from site_codes.py.
+
+The keys are the ones the two scripts expand (sites.site_code and the bridge
+site_ref), read from a built database, plus EDGE_CASE_KEYS. Every key must
+expand to the same set of site codes both ways; mismatches are printed and
+the exit status is 1.
+
+The timing part also runs synthetic keys with a growing number of
+delimiters ('--pieces 1,10,50,200'), '--keys' of each.
+
+Usage:
+    python benchmarks/bench_site_codes.py <built.db> [--pieces 1,10,50,200] [--keys 200]
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import site_codes
+from site_codes import register_site_code_functions
+from sqlite_regexp import register_regexp_functions
+
+SOURCE_KEYS_SQL = {
+    "sites": "SELECT UPPER(TRIM(site_code)) FROM sites",
+    "bridge": """
+        SELECT CASE
+                 WHEN site_ref_additional IS NOT NULL
+                      AND site_ref_additional <> ''
+                      AND UPPER(TRIM(site_ref_additional)) <> 'N/A'
+                      AND UPPER(TRIM(site_ref)) NOT LIKE '%MTX'
+                 THEN UPPER(TRIM(site_ref_additional))
+                 ELSE UPPER(TRIM(site_ref))
+               END
+        FROM bridge""",
+}
+
+EDGE_CASE_KEYS = [
+    None, "", ";", ",", "ABC01", "ABC01-05", "ABC01 - 05", "ABC1-3", "ABC001-003",
+    "ABC8-12", "ABC45-60", "ABC0-2", "ABC5-1", "01-03", "X, Y & Z", "A,,B", "A, ", ", A",
+    "ABC01, 2, 3", "ABC01, 02-04, 7", "ABC01 & DEF5, 6", "1, ABC01, 2", "ABC8-12, 5",
+    "A1B01-03, 4", "ABC01/02/07", "ABC01 / DEF02", "ABC 01, 2", "ABC01;02", "MTX 12 - 14",
+    "99999999999999999999", "ABC99999999999999999999", "ABC01, 99999999999999999999",
+    "X12Y", "12X", "ABC-01", "ABC01-",
+]
+
+LEGACY_EXPANSION_SQL = r"""
+WITH RECURSIVE
+split_recursive AS (
+  SELECT
+    cid,
+    1 AS piece_index,
+    CASE WHEN instr(expanded, ';') > 0 THEN substr(expanded, 1, instr(expanded, ';') - 1) ELSE expanded END AS piece,
+    CASE WHEN instr(expanded, ';') > 0 THEN substr(expanded, instr(expanded, ';') + 1) ELSE '' END AS remainder
+  FROM (SELECT cid, regexp_replace(key, '\s*[,&/]+\s*', ';') AS expanded FROM keys)
+
+  UNION ALL
+
+  SELECT
+    cid,
+    piece_index + 1,
+    CASE WHEN instr(remainder, ';') > 0 THEN substr(remainder, 1, instr(remainder, ';') - 1) ELSE remainder END,
+    CASE WHEN instr(remainder, ';') > 0 THEN substr(remainder, instr(remainder, ';') + 1) ELSE '' END
+  FROM split_recursive
+  WHERE remainder <> ''
+),
+range_split AS (
+  SELECT
+    cid, piece_index, piece,
+    regexp_capture(piece, '^(.*?)(\d+)\s*[-/]\s*(\d+)$', 1) AS r_prefix,
+    regexp_capture(piece, '^(.*?)(\d+)\s*[-/]\s*(\d+)$', 2) AS r_start,
+    regexp_capture(piece, '^(.*?)(\d+)\s*[-/]\s*(\d+)$', 3) AS r_end
+  FROM split_recursive
+  UNION ALL
+  SELECT cid, piece_index, piece, NULL, NULL, NULL
+  FROM split_recursive
+  WHERE NOT (piece REGEXP '^(.*?)(\d+)\s*[-/]\s*(\d+)$')
+),
+all_nums(n) AS (
+  SELECT 1 UNION ALL SELECT n + 1 FROM all_nums WHERE n < 50
+),
+combined AS (
+  SELECT rs.cid, rs.piece_index, rs.r_prefix || printf('%0*d', LENGTH(rs.r_start), all_nums.n) AS expanded_piece
+  FROM range_split rs
+  JOIN all_nums ON all_nums.n BETWEEN CAST(rs.r_start AS INT) AND CAST(rs.r_end AS INT)
+  WHERE rs.r_prefix IS NOT NULL
+  UNION ALL
+  SELECT cid, piece_index, piece FROM range_split WHERE r_prefix IS NULL
+),
+extracted AS (
+  SELECT
+    cid, piece_index, expanded_piece,
+    regexp_capture(expanded_piece, '^([^0-9]+)(\d+)$', 1) AS prefix_found,
+    regexp_capture(expanded_piece, '^([^0-9]+)(\d+)$', 2) AS digits_found
+  FROM combined
+),
+filled AS (
+  SELECT
+    e.*,
+    (SELECT x2.prefix_found FROM extracted x2
+      WHERE x2.cid = e.cid AND x2.piece_index <= e.piece_index AND x2.prefix_found IS NOT NULL
+      ORDER BY x2.piece_index DESC LIMIT 1) AS active_prefix,
+    (SELECT LENGTH(x2.digits_found) FROM extracted x2
+      WHERE x2.cid = e.cid AND x2.piece_index <= e.piece_index AND x2.prefix_found IS NOT NULL
+      ORDER BY x2.piece_index DESC LIMIT 1) AS active_digit_len
+  FROM extracted e
+)
+SELECT DISTINCT
+  cid,
+  CASE
+    WHEN prefix_found IS NOT NULL AND prefix_found != '' THEN
+      prefix_found || printf('%0*d', LENGTH(digits_found), CAST(digits_found AS INT))
+    WHEN (expanded_piece REGEXP '^[0-9]+$') = 1 AND active_prefix IS NOT NULL THEN
+      active_prefix || printf('%0*d', active_digit_len, CAST(expanded_piece AS INT))
+    ELSE expanded_piece
+  END
+FROM filled
+"""
+
+STAGE_EXPANSION_SQL = """
+SELECT DISTINCT keys.cid, codes.value
+FROM keys, json_each(expand_site_codes(keys.key)) codes
+"""
+
+def source_keys(built_db):
+    conn = sqlite3.connect(built_db)
+    keys = []
+    for table, sql in SOURCE_KEYS_SQL.items():
+        try:
+            keys += [row[0] for row in conn.execute(sql)]
+        except sqlite3.OperationalError as e:
+            print(f"(no {table} keys: {e})")
+    conn.close()
+    return keys
+
+def synthetic_keys(pieces, n_keys):
+    return [", ".join(f"S{k:03d}{i:02d}" if i % 3 else f"{i % 50 + 1:02d}-{i % 50 + 3:02d}"
+                      for i in range(pieces))
+            for k in range(n_keys)]
+
+def expand(keys, sql):
+    """({cid: set of site codes}, seconds) for keys expanded by one SQL statement."""
+    conn = sqlite3.connect(":memory:")
+    register_regexp_functions(conn)
+    register_site_code_functions(conn)
+    site_codes.site_codes.cache_clear()
+    conn.execute("CREATE TABLE keys (cid INTEGER PRIMARY KEY, key TEXT)")
+    conn.executemany("INSERT INTO keys VALUES (?, ?)", enumerate(keys))
+    t0 = time.perf_counter()
+    rows = conn.execute(sql).fetchall()
+    elapsed = time.perf_counter() - t0
+    conn.close()
+    out = {cid: set() for cid in range(len(keys))}
+    for cid, code in rows:
+        out[cid].add(code)
+    return out, elapsed
+
+def golden_check(keys):
+    legacy, _ = expand(keys, LEGACY_EXPANSION_SQL)
+    stage, _ = expand(keys, STAGE_EXPANSION_SQL)
+    mismatches = [cid for cid in legacy if legacy[cid] != stage[cid]]
+    for cid in mismatches[:20]:
+        print(f"  MISMATCH {json.dumps(keys[cid])}: legacy {sorted(legacy[cid], key=str)} "
+              f"stage {sorted(stage[cid], key=str)}")
+    return mismatches
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    pieces, n_keys = [1, 10, 50, 200], 200
+    if "--pieces" in args:
+        i = args.index("--pieces")
+        pieces = [int(p) for p in args[i + 1].split(",")]
+        del args[i:i + 2]
+    if "--keys" in args:
+        i = args.index("--keys")
+        n_keys = int(args[i + 1])
+        del args[i:i + 2]
+
+    keys = source_keys(args[0]) + EDGE_CASE_KEYS
+    mismatches = golden_check(keys)
+    print(f"Golden check: {len(keys) - len(mismatches)}/{len(keys)} keys identical")
+
+    print(f"{'keys':<24} {'legacy CTE':>10} {'stage':>10}  (s)")
+    workloads = [("built db", source_keys(args[0]))]
+    workloads += [(f"{n_keys} x {p} pieces", synthetic_keys(p, n_keys)) for p in pieces]
+    for label, workload in workloads:
+        _, legacy_s = expand(workload, LEGACY_EXPANSION_SQL)
+        _, stage_s = expand(workload, STAGE_EXPANSION_SQL)
+        print(f"{label:<24} {legacy_s:>10.3f} {stage_s:>10.3f}")
+
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Read latency of a published database (db_snapshot.py) by how it is opened:
+
+    rw              sqlite3.connect(path), as the loaders did before
+    ro              file:...?mode=ro
+    ro_immutable    file:...?mode=ro&immutable=1 (no locks, no change checks)
+    ro_immutable_mmap  the same with PRAGMA mmap_size = VF_MMAP_SIZE (what
+                    open_snapshot() serves with)
+
+Per mode: warm p50/p95 of each query on one long-lived connection (point
+lookup of a site, a year of monthly Opex per site, a trigram site-name
+search, a full scan), and p50/p95 of open + point lookup + close, the cost a
+request pays when it doesn't keep a connection. Modes are interleaved per
+round so the OS page cache is equally warm for all of them.
+
+Usage:
+    python benchmarks/bench_snapshot_reads.py <published.db> [--repeat 500] [--seed 7] [--out results.json]
+"""
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from db_snapshot import mmap_size_setting, open_snapshot
+from site_search import register_search_functions
+
+QUERIES = {
+    "point_lookup": ("SELECT * FROM vfsites WHERE site_code = ?",
+                     lambda rng, s: (rng.choice(s["codes"]),)),
+    "opex_year": ("SELECT site_code, SUM(cost_k_gbp), SUM(imputed) FROM vf_site_month_opex "
+                  "WHERE year = ? GROUP BY site_code",
+                  lambda rng, s: (rng.choice(s["years"]),)),
+    "trigram_search": ("SELECT v.site_code, v.site_name FROM vfsites v WHERE v.site_code IN ("
+                       "  SELECT tg.site_code FROM vfsites_trigram tg"
+                       "  WHERE tg.field = 'site_name' AND tg.trigram IN (SELECT value FROM json_each(search_trigrams(?1)))"
+                       "  GROUP BY tg.site_code HAVING COUNT(*) = json_array_length(search_trigrams(?1)))"
+                       " AND upper(v.site_name) LIKE '%' || upper(?1) || '%'",
+                       lambda rng, s: (rng.choice(s["terms"]),)),
+    "scan": ("SELECT COUNT(*), SUM(cost_k_gbp), MAX(yoy_delta_k_gbp) FROM vf_site_opex_month",
+             lambda rng, s: ()),
+}
+MODES = ["rw", "ro", "ro_immutable", "ro_immutable_mmap"]
+
+
+def open_mode(path, mode):
+    if mode == "rw":
+        conn = sqlite3.connect(path)
+    elif mode == "ro":
+        conn = open_snapshot(path, mmap_size=0, immutable=False)
+    elif mode == "ro_immutable":
+        conn = open_snapshot(path, mmap_size=0)
+    else:
+        conn = open_snapshot(path)
+    register_search_functions(conn)
+    return conn
+
+def sample(path):
+    conn = sqlite3.connect(path)
+    codes = [c for (c,) in conn.execute("SELECT site_code FROM vfsites")]
+    years = [y for (y,) in conn.execute("SELECT DISTINCT year FROM vf_site_month_opex")]
+    names = [n for (n,) in conn.execute("SELECT site_name FROM vfsites WHERE site_name IS NOT NULL")]
+    conn.close()
+    terms = [w[:4] for n in names for w in n.split() if len(w) >= 4] or ["PARK"]
+    return {"codes": codes, "years": years, "terms": terms}
+
+def percentiles(times):
+    ms = np.array(times) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 4), "p95_ms": round(float(np.percentile(ms, 95)), 4),
+            "mean_ms": round(float(ms.mean()), 4)}
+
+def main():
+    args = sys.argv[1:]
+    options = {"--repeat": "500", "--seed": "7", "--out": None}
+    for key in list(options):
+        if key in args:
+            i = args.index(key)
+            options[key] = args[i + 1]
+            del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    path, repeat = args[0], int(options["--repeat"])
+    rng = random.Random(int(options["--seed"]))
+    s = sample(path)
+
+    conns = {mode: open_mode(path, mode) for mode in MODES}
+    for mode, conn in conns.items():                              # first touch outside the timings
+        for sql, params in QUERIES.values():
+            conn.execute(sql, params(rng, s)).fetchall()
+    warm = {mode: {name: [] for name in QUERIES} for mode in MODES}
+    cold = {mode: [] for mode in MODES}
+    point_sql = QUERIES["point_lookup"][0]
+    for _ in range(repeat):
+        bound = {name: params(rng, s) for name, (sql, params) in QUERIES.items()}
+        for mode in rng.sample(MODES, len(MODES)):
+            conn = conns[mode]
+            for name, (sql, _params) in QUERIES.items():
+                t0 = time.perf_counter()
+                conn.execute(sql, bound[name]).fetchall()
+                warm[mode][name].append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            fresh = open_mode(path, mode)
+            fresh.execute(point_sql, bound["point_lookup"]).fetchall()
+            fresh.close()
+            cold[mode].append(time.perf_counter() - t0)
+    for conn in conns.values():
+        conn.close()
+
+    results = {"database": os.path.abspath(path), "bytes": os.path.getsize(path), "repeat": repeat,
+               "mmap_size": mmap_size_setting(), "sqlite_version": sqlite3.sqlite_version, "modes": {}}
+    print(f"{path}: {results['bytes'] / 1024 / 1024:.1f} MB, {repeat} rounds, mmap_size {results['mmap_size']}")
+    print(f"{'query':<22}" + "".join(f"{m:>20}" for m in MODES) + "   (p50 / p95 ms)")
+    for name in list(QUERIES) + ["open_per_request"]:
+        row = []
+        for mode in MODES:
+            stats = percentiles(cold[mode] if name == "open_per_request" else warm[mode][name])
+            results["modes"].setdefault(mode, {})[name] = stats
+            row.append(f"{stats['p50_ms']:.3f} / {stats['p95_ms']:.3f}")
+        print(f"{name:<22}" + "".join(f"{r:>20}" for r in row))
+    if options["--out"]:
+        with open(options["--out"], "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {options['--out']}")
+
+if __name__ == "__main__":
+    main()
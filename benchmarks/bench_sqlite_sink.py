@@ -0,0 +1,105 @@
+"""
+Rows/sec of the SQLite sink: the legacy per-row conn.execute() loop vs.
+insert_into_sqlite (executemany batches + compiled converters), with and
+without the load-time PRAGMAs. With '--approach auto' the sink variants also
+pay for the whole-column type inference (infer_column_types).
+
+Rows are taken from tables of an already built database and replicated
+'--scale' times, then loaded into a fresh database file per run.
+
+Usage:
+    python benchmarks/bench_sqlite_sink.py <built.db> [table ...] [--scale 10] [--repeat 5] [--approach auto]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from excel_to_sqlite import (
+    convert_sqlite_value, create_sqlite_table, insert_into_sqlite,
+    load_pragmas, table_transaction, infer_column_types, compile_sqlite_converters,
+)
+
+DEFAULT_TABLES = ["historic_fixed_capacity", "historic_fixed_capacity_cover",
+                  "historic_mtx_capacity", "space"]
+
+def legacy_insert(conn, table_name, columns_info, row_dicts, approach):
+    """The pre-sink loop: one conn.execute() and one convert_sqlite_value() per cell."""
+    col_names = [col for (col, _) in columns_info]
+    placeholders = ", ".join(["?"] * len(col_names))
+    col_list_str = ", ".join(f'"{cn}"' for cn in col_names)
+    insert_sql = f'INSERT INTO "{table_name}" ({col_list_str}) VALUES ({placeholders})'
+    for row_dict in row_dicts:
+        row_values = []
+        for col_name, _sample in columns_info:
+            row_values.append(convert_sqlite_value(row_dict.get(col_name), approach))
+        conn.execute(insert_sql, row_values)
+
+def run_variant(variant, table_name, columns_info, rows, approach="stringAll"):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(path)
+        t0 = time.perf_counter()
+        if variant == "legacy":
+            create_sqlite_table(conn, table_name, columns_info)
+            legacy_insert(conn, table_name, columns_info, rows, approach)
+            conn.commit()
+        else:
+            col_types = converters = None
+            if approach == "auto":
+                types = infer_column_types([c for c, _ in columns_info], rows)
+                col_types = [types[c] or "TEXT" for c, _ in columns_info]
+                converters = compile_sqlite_converters(columns_info, approach, col_types)
+            with load_pragmas(conn, variant == "sink+pragmas"):
+                with table_transaction(conn):
+                    create_sqlite_table(conn, table_name, columns_info, col_types=col_types)
+                    insert_into_sqlite(conn, table_name, columns_info, rows, approach,
+                                       converters=converters)
+        elapsed = time.perf_counter() - t0
+        conn.close()
+        return elapsed
+    finally:
+        os.remove(path)
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    scale, repeat = 10, 5
+    if "--scale" in args:
+        i = args.index("--scale")
+        scale = int(args[i + 1])
+        del args[i:i + 2]
+    approach = "stringAll"
+    if "--approach" in args:
+        i = args.index("--approach")
+        approach = args[i + 1]
+        del args[i:i + 2]
+    if "--repeat" in args:
+        i = args.index("--repeat")
+        repeat = int(args[i + 1])
+        del args[i:i + 2]
+
+    src = sqlite3.connect(args[0])
+    tables = args[1:] or DEFAULT_TABLES
+
+    print(f"{'table':<32} {'rows':>7} {'cols':>5} {'legacy':>12} {'sink':>12} {'sink+pragmas':>14}  (rows/s, best of {repeat})")
+    for table_name in tables:
+        cols = [r[1] for r in src.execute(f'PRAGMA table_info("{table_name}")')]
+        rows = [dict(zip(cols, r)) for r in src.execute(f'SELECT * FROM "{table_name}"')] * scale
+        columns_info = [(c, None) for c in cols]
+        rates = []
+        for variant in ("legacy", "sink", "sink+pragmas"):
+            best = min(run_variant(variant, table_name, columns_info, rows, approach) for _ in range(repeat))
+            rates.append(len(rows) / best)
+        print(f"{table_name:<32} {len(rows):>7} {len(cols):>5} {rates[0]:>12,.0f} {rates[1]:>12,.0f} {rates[2]:>14,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Substring filters on synthetic sites: the endpoints' scan
+('upper(col) LIKE %term%' on every vfsites row) vs. the trigram lookup the
+templates now do first (vfsites_trigram from sqlite/vfsites_search.sql.post,
+then the LIKE on the candidates only), and the FTS5 trigram tokenizer for
+reference when this SQLite has it.
+
+Every term must return the same site codes all ways; mismatches are printed
+and the exit status is 1. The query plan of the lookup is printed once, it
+must not scan vfsites.
+
+Usage:
+    python benchmarks/bench_substring_search.py [--sites 100000] [--repeat 5]
+"""
+import os
+import pathlib
+import random
+import sqlite3
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import site_search
+from site_search import register_search_functions
+
+SEARCH_SQL = pathlib.Path(REPO_DIR) / "sqlite" / "vfsites_search.sql.post"
+
+WORDS = ["PARK", "ROAD", "FARM", "HOUSE", "STREET", "HILL", "TOWER", "COURT", "MILL",
+         "BRIDGE", "GREEN", "CHURCH", "STATION", "LANE", "WOOD", "EXCHANGE", "CROSS",
+         "MANOR", "QUAY", "HEATH", "LONDON", "BUDE", "LEEDS", "BRISTOL", "NEWBURY"]
+COMMENTS = ["GIS checked", "roof access only", "shared with BT", "no generator",
+            "landlord notice 3 months", "", "key safe at gate"]
+RESILIENCE = ["N", "N+1", "N+N (Dual A&B Feeds)", "N+N (Single Feed)", None]
+
+# (field, term)
+TERMS = [
+    ("site_name", "park"),
+    ("site_name", "creathorne"),
+    ("site_name", "station road"),
+    ("address", "london"),
+    ("address", "ex23 0"),
+    ("comments", "gis"),
+    ("power_resilience", "n+n ("),
+    ("site_name", "no such site"),
+]
+
+SCAN_SQL = "SELECT site_code FROM vfsites WHERE upper({field}) LIKE '%' || upper(?) || '%'"
+
+# the templates' search_trigrams / search_sites CTEs, in SQLite
+LOOKUP_SQL = """
+WITH search_trigrams AS (
+  SELECT DISTINCT ? AS field, t.value AS trigram FROM json_each(search_trigrams(?)) t
+),
+search_sites AS (
+  SELECT tg.site_code
+  FROM search_trigrams q
+    INNER JOIN vfsites_trigram tg ON tg.field = q.field AND tg.trigram = q.trigram
+  GROUP BY tg.site_code
+  HAVING COUNT(*) = (SELECT COUNT(*) FROM search_trigrams)
+)
+SELECT site_code FROM vfsites
+WHERE site_code IN (SELECT site_code FROM search_sites)
+  AND upper({field}) LIKE '%' || upper(?) || '%'
+"""
+
+FTS_SQL = "SELECT site_code FROM vfsites_fts WHERE {field} LIKE '%' || ? || '%'"
+
+def synthetic_sites(n):
+    rnd = random.Random(42)
+    for i in range(n):
+        name = " ".join(rnd.choice(WORDS).title() for _ in range(rnd.randint(2, 4)))
+        if i % 5000 == 0:
+            name += " Creathorne"
+        postcode = f"{rnd.choice(['EX', 'LS', 'BS', 'RG', 'SW'])}{rnd.randint(1, 40)} {rnd.randint(0, 9)}{rnd.choice('ABDEFGHJ')}{rnd.choice('LNPQRSTU')}"
+        address = f"{rnd.randint(1, 200)} {rnd.choice(WORDS).title()} {rnd.choice(['Road', 'Street', 'Lane'])},\n{rnd.choice(WORDS).title()} {postcode}"
+        yield (f"S{i:06d}", name, address, rnd.choice(COMMENTS), rnd.choice(RESILIENCE))
+
+def build(n_sites):
+    conn = sqlite3.connect(":memory:")
+    register_search_functions(conn)
+    conn.execute("CREATE TABLE vfsites (site_code TEXT, site_name TEXT, address TEXT, "
+                 "comments TEXT, power_resilience TEXT)")
+    conn.executemany("INSERT INTO vfsites VALUES (?, ?, ?, ?, ?)", synthetic_sites(n_sites))
+    conn.execute("CREATE INDEX idx_vfsites_site_code ON vfsites (site_code)")
+
+    t0 = time.perf_counter()
+    conn.executescript(SEARCH_SQL.read_text(encoding="utf-8"))
+    conn.execute("CREATE INDEX idx_vfsites_trigram ON vfsites_trigram (field, trigram, site_code)")
+    conn.execute("ANALYZE")
+    trigram_s = time.perf_counter() - t0
+
+    fts_s = None
+    try:
+        t0 = time.perf_counter()
+        conn.execute("CREATE VIRTUAL TABLE vfsites_fts USING fts5(site_code UNINDEXED, site_name, "
+                     "address, comments, power_resilience, tokenize='trigram')")
+        conn.execute("INSERT INTO vfsites_fts SELECT * FROM vfsites")
+        fts_s = time.perf_counter() - t0
+    except sqlite3.OperationalError as e:
+        print(f"(no FTS5 trigram tokenizer: {e})")
+    return conn, trigram_s, fts_s
+
+def timed(conn, sql, params, repeat):
+    best, rows = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        rows = conn.execute(sql, params).fetchall()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return {r[0] for r in rows}, best
+
+def main():
+    args = sys.argv[1:]
+    n_sites, repeat = 100000, 5
+    if "--sites" in args:
+        i = args.index("--sites")
+        n_sites = int(args[i + 1])
+        del args[i:i + 2]
+    if "--repeat" in args:
+        i = args.index("--repeat")
+        repeat = int(args[i + 1])
+        del args[i:i + 2]
+
+    conn, trigram_s, fts_s = build(n_sites)
+    trigram_rows = conn.execute("SELECT COUNT(*) FROM vfsites_trigram").fetchone()[0]
+    print(f"{n_sites} sites: vfsites_trigram {trigram_rows} rows built in {trigram_s:.2f}s"
+          + (f", FTS5 in {fts_s:.2f}s" if fts_s is not None else ""))
+
+    print("Lookup plan:")
+    field, term = TERMS[0]
+    for row in conn.execute("EXPLAIN QUERY PLAN " + LOOKUP_SQL.format(field=field), (field, term, term)):
+        print(f"  {row[-1]}")
+
+    mismatches = 0
+    print(f"{'field':<17} {'term':<14} {'rows':>6} {'scan':>9} {'trigram':>9} {'fts5':>9}  (ms)")
+    for field, term in TERMS:
+        scan, scan_s = timed(conn, SCAN_SQL.format(field=field), (term,), repeat)
+        lookup, lookup_s = timed(conn, LOOKUP_SQL.format(field=field), (field, term, term), repeat)
+        fts, fts_q = (timed(conn, FTS_SQL.format(field=field), (term,), repeat)
+                      if fts_s is not None else (scan, None))
+        if lookup != scan or fts != scan:
+            mismatches += 1
+            print(f"  MISMATCH {field} {term!r}: scan {len(scan)}, trigram {len(lookup)}, fts5 {len(fts)}")
+        fts_ms = f"{fts_q * 1000:>9.2f}" if fts_q is not None else f"{'-':>9}"
+        print(f"{field:<17} {term:<14} {len(scan):>6} {scan_s * 1000:>9.2f} {lookup_s * 1000:>9.2f} {fts_ms}")
+
+    print(f"trigram memo: {site_search.cache_info()['texts']}")
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Parity check of the endpoint templates before and after a change: runs the
+vf/*.sql templates of a git revision ('--rev', default HEAD) and of the
+working tree on the same built database, and compares their rows.
+
+The database (post-processed, so it has the build-time tables the new
+templates read) is copied into DuckDB, see endpoint_sql.py. DuckDB can't
+plan subqueries in outer-join conditions: combined is compared stage by stage
+up to combined_with_space (its capacity and space parts), and walked whole
+with PLANNABLE_COMBINED, its outer joins rewritten; the old trend templates
+run with LEGACY_CTES, an equivalent form of their cost CTE.
+
+Rows are compared as multisets, numbers as floats rounded to ROUND_DIGITS;
+columns a change added (ADDED_COLUMNS) are left out. The paged templates of
+the working tree are also walked page by page, by cursor and by page number,
+and must return their unpaged rows exactly once. Mismatches are printed and
+the exit status is 1.
+
+Usage:
+    python benchmarks/check_endpoint_parity.py <built.db> [--rev HEAD] [--only vf/sites/opex]
+"""
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from decimal import Decimal
+
+import duckdb
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from endpoint_sql import cte_query, cte_span, load_sqlite_database, prepare_duckdb, replace_cte, run_template
+
+ROUND_DIGITS = 9
+SHOW_ROW_CHARS = 160
+BLACKLISTED_USER = "parity-check-user"
+
+CAPACITY_CASES = {
+    "defaults": {},
+    "mobile": {"network_domain": "mobile"},
+    "fixed": {"network_domain": "fixed"},
+    "remaining >= 50kW": {"remaining_power_capacity_in_kw_minimum": 50},
+    "running load 10..200kW": {"running_load_in_kw_minimum": 10, "running_load_in_kw_maximum": 200},
+    "allocated <= 100kW": {"total_allocated_in_kw_maximum": 100},
+    "80% of N >= 0": {"remaining_power_80_of_n_in_kw_minimum": 0},
+    "free sections >= 5": {"free_sections_minimum": 5},
+    "free sections 10..90%": {"free_sections_percentage_minimum": 10, "free_sections_percentage_maximum": 90},
+    "occupied area <= 100": {"occupied_sections_area_maximum": 100},
+    "site type MTX": {"site_types": "MTX"},
+    "capacity blacklisted": {"userid": BLACKLISTED_USER},
+}
+
+OPEX_CASES = {
+    "defaults": {},
+    "2023, months 4..9": {"year": 2023, "min_month": 4, "max_month": 9},
+    "2024, months 1..3": {"year": 2024, "min_month": 1, "max_month": 3},
+    "2024, months 11..12": {"year": 2024, "min_month": 11, "max_month": 12},
+    "2025, month 2": {"year": 2025, "min_month": 2, "max_month": 2},
+    "2022 (no data), month 1": {"year": 2022, "min_month": 1, "max_month": 1},
+    "mobile": {"network_domain": "mobile"},
+    "top 20": {"topN": 20},
+    "cost 10..500": {"min_cost": 10, "max_cost": 500},
+    "forecast 3 years at 5%": {"forecast_years": 3, "annual_growth_percent": 5},
+    "opex blacklisted": {"userid": BLACKLISTED_USER},
+}
+
+# no paging case: vf/sites/capacity/trends.sql pages without an ORDER BY
+CAPACITY_TREND_CASES = {
+    "defaults": {},
+    "site codes": {"site_codes": "FMYN31, CHMN21,BKLN06 , XGL001 (BMGMTX),MTX999"},
+    "capacity blacklisted": {"userid": BLACKLISTED_USER},
+}
+
+TREND_CASES = dict(OPEX_CASES, **{
+    "2023, months 6..8": {"year": 2023, "min_month": 6, "max_month": 8},
+    "2024, month 7": {"year": 2024, "min_month": 7, "max_month": 7},
+    "2024, months 5..4": {"year": 2024, "min_month": 5, "max_month": 4},
+})
+
+# the old vf/sites/opex/monthly.sql takes about a minute per run on DuckDB
+MONTHLY_CASES = {name: OPEX_CASES[name] for name in ("defaults", "2023, months 4..9", "mobile")}
+
+# the substring filters: trigram lookups, and terms left to the ILIKE alone
+SEARCH_CASES = {
+    "no search": {},
+    "site name 'park'": {"site_name": "park"},
+    "site name 'Road', address 'london'": {"site_name": "Road", "site_address": "london"},
+    "address 'ex23 0'": {"site_address": "ex23 0"},
+    "comments 'gis'": {"comments": "gis"},
+    "power resilience 'n+n ('": {"power_resilience": "n+n ("},
+    "site name 'ab' (short)": {"site_name": "ab"},
+    "site name 'a_b%' (wildcards)": {"site_name": "a_b%"},
+    "site name 'no such site'": {"site_name": "no such site"},
+}
+
+# compared without these when the --rev template doesn't have them
+ADDED_COLUMNS = ("next_cursor",)
+
+# combined.sql's outer joins on subqueries, which DuckDB can't plan, rewritten
+# to join subqueries that apply the same conditions (they only read the joined
+# side) so the whole template can be walked: (text, replacement), each found once
+PLANNABLE_COMBINED = [
+    ("""    LEFT OUTER JOIN combined_with_ownership_codes_unique_records c
+      ON s.site_code=c.site_code
+        AND c.tenancy_reference=(SELECT MIN(tenancy_reference) FROM combined_with_ownership_codes_unique_records ow WHERE ow.site_code=c.site_code)
+        AND NOT EXISTS(SELECT * FROM user_blacklist_lease) -- redact all non-lease users""",
+     """    LEFT OUTER JOIN (
+      SELECT * FROM combined_with_ownership_codes_unique_records c
+      WHERE c.tenancy_reference=(SELECT MIN(tenancy_reference) FROM combined_with_ownership_codes_unique_records ow WHERE ow.site_code=c.site_code)
+        AND NOT EXISTS(SELECT * FROM user_blacklist_lease)
+    ) c ON s.site_code=c.site_code"""),
+    ("""        left outer join vdf.vfbridge on""",
+     """        left outer join (
+          SELECT *, postcode IN (SELECT postcode FROM unique_postal_codes) AS unique_postcode FROM vdf.vfbridge
+        ) vfbridge on"""),
+    ("""vfbridge.postcode IN (
+                select postcode from unique_postal_codes)""",
+     "vfbridge.unique_postcode"),
+    ("""        left outer join filtered_vfopex on upper(trim(vfbridge.bridge_site_code))=upper(trim(filtered_vfopex.sitecode))
+            AND NOT EXISTS(SELECT * FROM user_blacklist_opex) -- redact all non-opex users""",
+     """        left outer join (
+          SELECT * FROM filtered_vfopex WHERE NOT EXISTS(SELECT * FROM user_blacklist_opex)
+        ) filtered_vfopex on upper(trim(vfbridge.bridge_site_code))=upper(trim(filtered_vfopex.sitecode))"""),
+]
+
+# (template, cases) walked page by page. combined is walked in its plannable
+# form: sites there can have several rows (one per lease, bridge or opex match),
+# which a cursor page must return whole.
+PAGED_TARGETS = [
+    ("vf/sites.sql", {"defaults": {}, "site name 'park'": {"site_name": "park"}}),
+    ("vf/sites/capacity.sql", {"defaults": {}, "mobile": {"network_domain": "mobile"}}),
+    ("vf/elements/capacity.sql", {"defaults": {}, "fixed": {"network_domain": "fixed"}}),
+    ("vf/sites/space.sql", {"defaults": {}}),
+    ("vf/sites/space/trends.sql", {"defaults": {}}),
+    ("vf/sites/capacity/trends.sql", {"defaults": {}}),
+    ("vf/sites/opex/summary/forecast.sql", {"defaults": {}, "top 20": {"topN": 20}}),
+    ("vf/sites/combined.sql", {"defaults": {}, "top 200": {"topN": 200}, "mobile": {"network_domain": "mobile"}}),
+]
+WALK_PAGE_SIZE = 37
+
+# (template, CTE to stop at or None for the whole query, cases)
+TARGETS = [
+    ("vf/sites/capacity.sql", None, CAPACITY_CASES),
+    ("vf/elements/capacity.sql", None, CAPACITY_CASES),
+    ("vf/sites/combined.sql", "combined_with_capacity", CAPACITY_CASES),
+    ("vf/sites/combined.sql", "combined_with_space", CAPACITY_CASES),
+    ("vf/sites/capacity/trends.sql", None, CAPACITY_TREND_CASES),
+    ("vf/sites/opex/positive_trends.sql", None, TREND_CASES),
+    ("vf/sites/opex/negative_trends.sql", None, TREND_CASES),
+    ("vf/sites/opex/summary.sql", None, OPEX_CASES),
+    ("vf/sites/opex/summary/forecast.sql", None, OPEX_CASES),
+    ("vf/sites/opex/monthly.sql", None, MONTHLY_CASES),
+    ("vf/sites.sql", None, SEARCH_CASES),
+    ("vf/sites/summary.sql", None, SEARCH_CASES),
+    ("vf/sites/space.sql", None, SEARCH_CASES),
+    # vf/sites/opex.sql is left out: DuckDB cannot plan its correlated
+    # subquery in the vfbridge LEFT JOIN condition (before and after)
+    ("vf/sites/capacity.sql", None, SEARCH_CASES),
+    ("vf/elements/capacity.sql", None, SEARCH_CASES),
+    ("vf/sites/combined.sql", "combined_with_space", SEARCH_CASES),
+    ("vf/sites/opex/positive_trends.sql", None, SEARCH_CASES),
+    ("vf/sites/opex/negative_trends.sql", None, SEARCH_CASES),
+    ("vf/sites/opex/summary.sql", None, SEARCH_CASES),
+    ("vf/sites/opex/summary/forecast.sql", None, SEARCH_CASES),
+    ("vf/sites/opex/monthly.sql", None, SEARCH_CASES),
+]
+
+# The trend templates' site_month_costs (before vf_site_month_opex) LEFT JOINs
+# vfbridge on subqueries, which DuckDB can't plan. The same rows, with the
+# bridge join moved into an inner join:
+LEGACY_SITE_MONTH_COSTS = r"""
+  SELECT sm.site_code, sm.month_num, COALESCE(SUM(m.cost_k_gbp), 0) AS cost_k_gbp
+  FROM site_months sm
+  LEFT JOIN (
+    SELECT fs.site_code,
+      DATE_PART('month', CAST(o.reading_date AS DATE)) AS month_num,
+      CASE WHEN o.reading_value IS NOT NULL
+           THEN CAST(o.reading_value AS DECIMAL)*0.25/1000
+           ELSE 0
+      END AS cost_k_gbp
+    FROM filtered_sites fs
+    JOIN vdf.vfbridge b
+      ON UPPER(TRIM(b.site_code))=UPPER(TRIM(fs.site_code))
+      OR (
+        b.postcode IN (SELECT postcode FROM unique_postal_codes)
+        AND b.postcode=fs.postcode
+      )
+      OR (
+        b.site_code IS NOT NULL
+        AND (
+          TRIM(fs.site_code) LIKE CONCAT('%(', UPPER(TRIM(b.site_code)), ')%')
+        )
+        OR (UPPER(TRIM(b.site_code)) ~ CONCAT(fs.site_code,'\\s*[,&].*'))
+        OR (UPPER(TRIM(b.site_code)) ~ CONCAT('.*[,&]\\s*',fs.site_code))
+      )
+    JOIN vdf.vfopex o
+      ON UPPER(TRIM(b.bridge_site_code))=UPPER(TRIM(o.sitecode))
+      AND DATE_PART('year', CAST(o.reading_date AS DATE)) = :year
+  ) m ON m.site_code=sm.site_code AND m.month_num=sm.month_num
+  GROUP BY sm.site_code, sm.month_num
+"""
+
+# {CTE name: (text its old body has, replacement)}, applied to the --rev templates
+LEGACY_CTES = {
+    "site_month_costs": ("JOIN vdf.vfbridge", LEGACY_SITE_MONTH_COSTS),
+}
+
+
+def template_at(rev, path):
+    if rev is None:
+        with open(os.path.join(REPO_DIR, path), "r", encoding="utf-8") as f:
+            return f.read()
+    return subprocess.run(["git", "show", f"{rev}:{path}"], cwd=REPO_DIR, check=True,
+                          capture_output=True, text=True).stdout
+
+def with_legacy_ctes(sql):
+    for cte, (marker, body) in LEGACY_CTES.items():
+        try:
+            start, end = cte_span(sql, cte)
+        except ValueError:
+            continue
+        if marker in sql[start:end]:
+            sql = replace_cte(sql, cte, body)
+    return sql
+
+def plannable(path, sql):
+    """The template with the PLANNABLE_COMBINED rewrites applied (combined.sql only)."""
+    if path != "vf/sites/combined.sql":
+        return sql
+    for text, replacement in PLANNABLE_COMBINED:
+        if sql.count(text) != 1:
+            raise ValueError(f"{path}: expected one {text.strip().splitlines()[0]!r}")
+        sql = sql.replace(text, replacement)
+    return sql
+
+def normalized_value(v):
+    # DECIMAL and DOUBLE columns serialise to the same JSON number
+    if isinstance(v, (float, Decimal)):
+        return round(float(v), ROUND_DIGITS)
+    if isinstance(v, list):
+        return tuple(normalized_value(x) for x in v)
+    return v
+
+def normalized(rows):
+    return Counter(tuple(normalized_value(v) for v in row) for row in rows)
+
+def run(duck, sql, cte, values, drop=()):
+    """(columns, row multiset, seconds) or (None, error, 0), without the columns in drop."""
+    t0 = time.perf_counter()
+    try:
+        columns, rows = run_template(duck, cte_query(sql, cte) if cte else sql, values)
+    except duckdb.Error as e:
+        return None, str(e).splitlines()[0], 0.0
+    keep = [i for i, c in enumerate(columns) if c not in drop]
+    return [columns[i] for i in keep], normalized([row[i] for i in keep] for row in rows), time.perf_counter() - t0
+
+def walk_pages(duck, sql, values, by_cursor):
+    """(row multiset, pages, sites seen on more than one page) of a template walked to the end."""
+    rows, pages, sites_before, split_sites = Counter(), 0, set(), set()
+    cursor, page = "", 1
+    while True:
+        paging = {"cursor": cursor} if by_cursor else {"page": page}
+        columns, page_rows = run_template(duck, sql, dict(values, page_size=WALK_PAGE_SIZE, **paging))
+        if not page_rows:
+            return rows, pages, split_sites
+        pages += 1
+        site = columns.index("site_code")
+        page_sites = {row[site] for row in page_rows}
+        split_sites |= page_sites & sites_before
+        sites_before |= page_sites
+        rows += normalized(row[:-1] for row in page_rows)
+        cursor, page = page_rows[-1][-1], page + 1
+
+def check_paging(duck, only):
+    """Number of paged cases whose walks don't return the unpaged rows."""
+    failures = 0
+    for path, cases in PAGED_TARGETS:
+        if only and only not in path:
+            continue
+        sql = plannable(path, template_at(None, path))
+        for case, values in cases.items():
+            _cols, expected, _s = run(duck, sql, None, dict(values, page_size=1000000), drop=ADDED_COLUMNS)
+            for by_cursor in (True, False):
+                t0 = time.perf_counter()
+                rows, pages, split_sites = walk_pages(duck, sql, values, by_cursor)
+                label = f"{case}, by {'cursor' if by_cursor else 'page'}"
+                if rows != expected:
+                    status = (f"ROWS differ: {sum((expected - rows).values())} missing, "
+                              f"{sum((rows - expected).values())} extra")
+                elif by_cursor and split_sites:
+                    status = f"SITES on two pages: {sorted(split_sites)[:5]}"
+                else:
+                    print(f"{path:<44} {label:<24} {sum(rows.values()):>6} {pages:>7} pages "
+                          f"{time.perf_counter() - t0:>6.3f}")
+                    continue
+                failures += 1
+                print(f"{path:<44} {label:<24} {status}")
+    return failures
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    rev, only = "HEAD", None
+    if "--rev" in args:
+        i = args.index("--rev")
+        rev = args[i + 1]
+        del args[i:i + 2]
+    if "--only" in args:
+        i = args.index("--only")
+        only = args[i + 1]
+        del args[i:i + 2]
+
+    duck = duckdb.connect()
+    t0 = time.perf_counter()
+    tables = load_sqlite_database(args[0], duck)
+    prepare_duckdb(duck)
+    duck.execute("INSERT INTO environment.secrets VALUES ('user-blacklist-capacity', ?), ('user-blacklist-space', ?), "
+                 "('user-blacklist-opex', ?)", [BLACKLISTED_USER] * 3)
+    print(f"Loaded {len(tables)} tables into DuckDB in {time.perf_counter() - t0:.2f}s")
+
+    failures = 0
+    print(f"{'template':<44} {'case':<24} {'rows':>6} {rev + ' (s)':>10} {'tree (s)':>10}")
+    for path, cte, cases in TARGETS:
+        if only and only not in path:
+            continue
+        before, after = with_legacy_ctes(template_at(rev, path)), template_at(None, path)
+        label = f"{path}" + (f" [{cte}]" if cte else "")
+        for case, values in cases.items():
+            old_cols, old_rows, old_s = run(duck, before, cte, values)
+            added = [c for c in ADDED_COLUMNS if old_cols is not None and c not in old_cols]
+            new_cols, new_rows, new_s = run(duck, after, cte, values, drop=added)
+            if old_cols is None or new_cols is None:
+                status = f"ERROR {old_rows if old_cols is None else new_rows}"
+            elif old_cols != new_cols:
+                status = f"COLUMNS differ: {old_cols} vs {new_cols}"
+            elif old_rows != new_rows:
+                only_old, only_new = old_rows - new_rows, new_rows - old_rows
+                status = f"ROWS differ: {sum(only_old.values())} only in {rev}, {sum(only_new.values())} only in tree"
+                for row in list(only_old)[:3]:
+                    status += f"\n      {rev}: {str(row)[:SHOW_ROW_CHARS]}"
+                for row in list(only_new)[:3]:
+                    status += f"\n      tree: {str(row)[:SHOW_ROW_CHARS]}"
+            else:
+                print(f"{label:<44} {case:<24} {sum(new_rows.values()):>6} {old_s:>10.3f} {new_s:>10.3f}")
+                continue
+            failures += 1
+            print(f"{label:<44} {case:<24} {status}")
+
+    print(f"\n{'template':<44} {'walk':<24} {'rows':>6}")
+    failures += check_paging(duck, only)
+
+    print("Parity OK" if not failures else f"{failures} case(s) differ")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
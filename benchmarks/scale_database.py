@@ -0,0 +1,144 @@
+"""
+Synthetic scale-up of a built database for the load benchmarks: every
+extracted source table is replicated '--factor' times, then the
+post-processing steps of build_everything.sh (apply_sql_scripts.py,
+opex_analytics.py, capacity_series.py, build_indexes.py) rebuild vfsites,
+vfbridge, vfopex, vfspace and the vf_* tables from them.
+
+Replica k is the original rows with their join keys tagged, so each replica
+has the original's shape (sites per type and region, elements and meters per
+site, months of history, bridge and lease links) and links only within itself:
+
+    site codes, names, MTX and equipment area codes   letter prefix per
+        list piece: 'BDEN01, 04 & IPW' => 'QBBDEN01, 04 & QBIPW'
+    bridge / opex / lease references                 digit prefix on the
+        first number: 'F_60196' => 'F_900260196', '60196' => '900260196'
+
+Not tagged: postcodes (so the unique-postcode bridge fallback only links the
+original sites), and the XGL001 / BKLN06 room tables the templates special-case.
+
+Usage:
+    python benchmarks/scale_database.py <built.db> <scaled.db> [--factor 10]
+"""
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# {source table: (columns tagged as site keys, columns tagged as references)}
+SCALE_COLUMNS = {
+    "sites": (["site_code", "site_name"], []),
+    "bridge": (["site_ref", "site_ref_additional", "site_name"], ["site_code"]),
+    "opex": (["sitename"], ["sitecode"]),
+    "vfopex_tmp": (["sitename"], ["sitecode"]),
+    "ownership": ([], ["tenancy_reference", "property_reference", "property_reference_2", "property_reference_3"]),
+    "space": (["site_code"], []),
+    "mtx_capacity": (["mtx"], []),
+    "historic_mtx_capacity": (["mtx"], []),
+    "fixed_capacity": (["general_equipment_area_code", "general_system_name"], []),
+    "historic_fixed_capacity": (["general_equipment_area_code", "general_system_name"], []),
+    "fixed_capacity_cover": (["brag_0_black_0_10_red_10_25_amber_25_green"], []),
+    "historic_fixed_capacity_cover": (["brag_0_black_0_10_red_10_25_amber_25_green"], []),
+}
+
+NOT_KEYS = ("", "N/A", "NA", "-")
+KEY_PIECE_RX = re.compile(r"([,&/]\s*)(?=[A-Za-z])")
+FIRST_NUMBER_RX = re.compile(r"\d")
+
+# build_everything.sh after step 1
+POST_STEPS = [
+    ["apply_sql_scripts.py", "{db}", "sqlite"],
+    ["opex_analytics.py", "{db}"],
+    ["capacity_series.py", "{db}"],
+    ["build_indexes.py", "{db}", "indexes.json"],
+]
+
+
+def letter_tag(k):
+    """'QB', 'QC', ... 'QZ', 'QBA', ... for replica k >= 1."""
+    letters = ""
+    while True:
+        k, r = divmod(k, 26)
+        letters = chr(ord("A") + r) + letters
+        if not k:
+            return "Q" + letters
+
+def tag_key(value, k):
+    if value is None or str(value).strip().upper() in NOT_KEYS:
+        return value
+    tag = letter_tag(k)
+    return tag + KEY_PIECE_RX.sub(lambda m: m.group(1) + tag, str(value))
+
+def tag_reference(value, k):
+    if value is None or str(value).strip().upper() in NOT_KEYS:
+        return value
+    text = str(value)
+    if not FIRST_NUMBER_RX.search(text):
+        return tag_key(text, k)
+    return FIRST_NUMBER_RX.sub(lambda m: f"9{k:03d}{m.group(0)}", text, count=1)
+
+def scale_tables(conn, factor):
+    """Appends factor - 1 tagged replicas of every SCALE_COLUMNS table. Returns {table: rows after}."""
+    conn.create_function("tag_key", 2, tag_key, deterministic=True)
+    conn.create_function("tag_reference", 2, tag_reference, deterministic=True)
+    existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    counts = {}
+    for table, (keys, references) in SCALE_COLUMNS.items():
+        if table not in existing:
+            print(f"(no {table} table)")
+            continue
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+        conn.execute(f'CREATE TEMP TABLE scale_src AS SELECT * FROM "{table}"')
+        for k in range(1, factor):
+            select = ", ".join(
+                f'tag_key("{c}", {k})' if c in keys else f'tag_reference("{c}", {k})' if c in references else f'"{c}"'
+                for c in columns)
+            conn.execute(f'INSERT INTO "{table}" SELECT {select} FROM scale_src')
+        conn.execute("DROP TABLE scale_src")
+        counts[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    conn.commit()
+    return counts
+
+def main():
+    args = sys.argv[1:]
+    factor = 10
+    if "--factor" in args:
+        i = args.index("--factor")
+        factor = int(args[i + 1])
+        del args[i:i + 2]
+    if len(args) < 2 or factor < 1:
+        print(__doc__)
+        sys.exit(1)
+
+    src, dst = args
+    t0 = time.perf_counter()
+    shutil.copyfile(src, dst)
+    conn = sqlite3.connect(dst)
+    counts = scale_tables(conn, factor)
+    conn.close()
+    for table, rows in counts.items():
+        print(f"{table:<32} {rows:>9} rows")
+    print(f"Source tables scaled x{factor} in {time.perf_counter() - t0:.2f}s")
+
+    # one BUILD_ID for all the steps, as build_everything.sh exports it, so
+    # they share one <scaled.db>.build.json report (build_stats.py)
+    env = dict(os.environ, BUILD_ID=os.environ.get("BUILD_ID") or datetime.now().strftime("%Y%m%d_%H%M%S"))
+    for step in POST_STEPS:
+        t1 = time.perf_counter()
+        subprocess.run([sys.executable] + [a.format(db=os.path.abspath(dst)) for a in step],
+                       cwd=REPO_DIR, check=True, stdout=subprocess.DEVNULL, env=env)
+        print(f"{step[0]:<32} {time.perf_counter() - t1:>8.2f}s")
+
+    conn = sqlite3.connect(dst)
+    sites = conn.execute("SELECT COUNT(*) FROM vfsites").fetchone()[0]
+    conn.close()
+    print(f"{dst}: {sites} sites, built in {time.perf_counter() - t0:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -6,25 +6,74 @@ set -euo pipefail
 #    • 1st CLI arg → SQLite file (defaults to output_<timestamp>.db)
 #    • 2nd CLI arg → folder with .sql scripts   (defaults to sql/)
 #    • 3rd CLI arg → path to regexp extension   (defaults to /opt/projects/sqlite_ext/regexp)
+#    • INCREMENTAL=1 → start from a copy of the published "$DB_FILE" and only
+#      re-read the workbooks that changed since it was built (README-ETL 6.2)
 ###############################################################################
 DB_FILE=${1:-output_$(date '+%Y%m%d_%H%M%S').db}
 SQL_DIR=${2:-sqlite}
 EXT_PATH=${3:-/opt/projects/sqlite_ext/regexp}
+INCREMENTAL=${INCREMENTAL:-0}
+
+# every step records its stages into "$DB_FILE.build.json" and the _build_stats
+# table under this id (build_stats.py); BUILD_PROFILE=cprofile,tracemalloc profiles them
+export BUILD_ID=${BUILD_ID:-$(date '+%Y%m%d_%H%M%S')}
+
+# every step works on a scratch file next to the target; db_snapshot.py
+# publishes it over "$DB_FILE" only once it is complete and checked, so
+# readers never see a half-built database
+BUILD_DB="$(dirname "$DB_FILE")/.$(basename "$DB_FILE").building"
+rm -f "$BUILD_DB" "$BUILD_DB.build.json"
+LOAD_MODE=""
+if [[ "$INCREMENTAL" == 1 && -f "$DB_FILE" ]]; then
+  cp "$DB_FILE" "$BUILD_DB"
+  LOAD_MODE="--incremental"
+elif [[ "$INCREMENTAL" == 1 ]]; then
+  echo "INCREMENTAL=1 but $DB_FILE doesn't exist yet – full build"
+fi
 
 echo "═══════════════════════════════════════════════════════"
-echo "SQLite database : $DB_FILE"
+echo "SQLite database : $DB_FILE (built in $BUILD_DB)"
 echo "SQL scripts dir : $SQL_DIR"
 echo "REGEXP extension: $EXT_PATH"
+echo "Load mode       : ${LOAD_MODE:-full}"
 echo "═══════════════════════════════════════════════════════"
 
 ###############################################################################
 # 1 . Extract raw tables from XLSX --------------------------------------------
 ###############################################################################
-bash run_sqlite.sh "$DB_FILE"
+#    build_sqlite.py runs every job of build_manifest.json in one process,
+#    parsing each workbook once (run_sqlite.sh is the per-config equivalent)
+python build_sqlite.py "$BUILD_DB" build_manifest.json $LOAD_MODE
 
 ###############################################################################
 # 2 . Apply post-processing SQL with the extension ----------------------------
+#    independent scripts run concurrently (--workers N, default CPU count);
+#    --dry-run prints their dependency graph and critical path instead
+###############################################################################
+python apply_sql_scripts.py  "$BUILD_DB"  "$SQL_DIR"  "$EXT_PATH"
+
+###############################################################################
+# 2b. Opex trend / run-length / forecast tables (NumPy, over vf_site_month_opex)
+###############################################################################
+python opex_analytics.py  "$BUILD_DB"
+
+###############################################################################
+# 2c. Packed monthly capacity series (float64 blobs, from vf_capacity_snapshot)
 ###############################################################################
-python apply_sql_scripts.py  "$DB_FILE"  "$SQL_DIR"  "$EXT_PATH"
+python capacity_series.py  "$BUILD_DB"
+
+###############################################################################
+# 3 . Indexes + ANALYZE, once all tables are built ------------------------------
+#    (add --suggest "$SQL_DIR" for the EXPLAIN QUERY PLAN scan / index report)
+###############################################################################
+python build_indexes.py  "$BUILD_DB"  indexes.json
+
+###############################################################################
+# 4 . Publish: stamp _build_metadata, quick_check, VACUUM INTO a compact image,
+#     atomic rename over "$DB_FILE" (add --full-check for integrity_check)
+###############################################################################
+python db_snapshot.py  "$BUILD_DB"  "$DB_FILE"  build_manifest.json
+
+python build_stats.py  "$DB_FILE"
 
 echo "All done – refreshed $(basename "$DB_FILE")"
@@ -0,0 +1,215 @@
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from build_stats import BuildStats, stage
+from site_codes import register_site_code_functions
+from site_search import register_search_functions
+from sqlite_regexp import register_regexp_functions
+
+DEFAULT_INDEX_MANIFEST = "indexes.json"
+
+TABLE_REF_RX = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?", re.IGNORECASE)
+PLAN_TABLE_RX = re.compile(r"^(SCAN|SEARCH) (\w+)")
+AUTOMATIC_INDEX_RX = re.compile(r"USING AUTOMATIC (COVERING )?INDEX \(([^)]*)\)")
+LEADING_COMMENTS_RX = re.compile(r"^(?:\s+|--[^\n]*|/\*.*?\*/)*", re.DOTALL)
+NOT_ALIASES = {"on", "where", "join", "left", "inner", "outer", "cross", "group", "order",
+               "limit", "union", "using", "natural", "as", "set", "values"}
+
+
+def load_index_manifest(manifest_path):
+    """
+    indexes.json:
+        {"indexes": [{"table": "vfsites", "columns": ["site_code"]},
+                     {"table": "vfopex", "columns": ["sitecode", "reading_date"],
+                      "name": "...", "unique": false, "where": "..."}],
+         "analyze": true, "optimize": true}
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def index_name(spec):
+    return spec.get("name") or f"ix_{spec['table']}_{'_'.join(spec['columns'])}"
+
+def index_sizes(conn):
+    """{index or table name: bytes}, from the dbstat virtual table (None if it isn't compiled in)."""
+    try:
+        return dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+    except sqlite3.OperationalError:
+        return None
+
+def create_indexes(conn, specs):
+    """
+    (Re)creates the declared indexes, after the data is in. A spec whose
+    table doesn't exist is skipped with a warning. Returns [(name, table, seconds)].
+    """
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    built = []
+    for spec in specs:
+        name, table = index_name(spec), spec["table"]
+        if table not in tables:
+            print(f"Warning: index {name}: no table '{table}', skipped.")
+            continue
+        col_list_str = ", ".join(f'"{c}"' for c in spec["columns"])
+        where = f" WHERE {spec['where']}" if spec.get("where") else ""
+        unique = "UNIQUE " if spec.get("unique") else ""
+        t0 = time.perf_counter()
+        try:
+            conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+            conn.execute(f'CREATE {unique}INDEX "{name}" ON "{table}" ({col_list_str}){where}')
+        except sqlite3.OperationalError as e:
+            print(f"Warning: index {name}: {e}, skipped.")
+            continue
+        built.append((name, table, time.perf_counter() - t0))
+    conn.commit()
+    return built
+
+def analyze(conn, optimize=True):
+    """ANALYZE (+ PRAGMA optimize) so the planner has statistics for the new indexes."""
+    t0 = time.perf_counter()
+    conn.execute("ANALYZE")
+    if optimize:
+        conn.execute("PRAGMA optimize")
+    conn.commit()
+    return time.perf_counter() - t0
+
+def report_indexes(conn, built, analyze_seconds=None):
+    sizes = index_sizes(conn)
+    row_counts = {}
+    print(f"{'index':<48} {'table':<32} {'rows':>7} {'seconds':>8} {'KB':>8}")
+    for name, table, seconds in built:
+        if table not in row_counts:
+            row_counts[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        size = f"{sizes.get(name, 0) / 1024:8.1f}" if sizes is not None else f"{'?':>8}"
+        print(f"{name:<48} {table:<32} {row_counts[table]:>7} {seconds:>8.3f} {size}")
+    total_kb = sum(sizes.get(name, 0) for name, _t, _s in built) / 1024 if sizes is not None else None
+    total = f", {total_kb:.1f} KB" if total_kb is not None else ""
+    print(f"{len(built)} index(es) in {sum(s for _n, _t, s in built):.3f}s{total}")
+    if analyze_seconds is not None:
+        print(f"ANALYZE / PRAGMA optimize in {analyze_seconds:.3f}s")
+
+def split_statements(sql_text):
+    """[(first line number, statement)] of a script, cut where sqlite3.complete_statement() says."""
+    statements, buf, start = [], [], None
+    for line_no, line in enumerate(sql_text.splitlines(keepends=True), 1):
+        if start is None and line.strip() and not line.strip().startswith("--"):
+            start = line_no
+        buf.append(line)
+        if sqlite3.complete_statement("".join(buf)):
+            statements.append((start or line_no, "".join(buf)))
+            buf, start = [], None
+    return statements
+
+def table_aliases(statement):
+    """{alias or name: table name} of the FROM / JOIN references in a statement."""
+    aliases = {}
+    for table, alias in TABLE_REF_RX.findall(statement):
+        aliases[table] = table
+        if alias and alias.lower() not in NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+def plan_findings(conn, statement):
+    """(scans, automatic) of a statement's query plan: [table] and [(table, columns, covering)]."""
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"
+                                               " UNION SELECT name FROM sqlite_temp_master WHERE type = 'table'")}
+    aliases = table_aliases(statement)
+    scans, automatic = [], []
+    for _id, _parent, _unused, detail in conn.execute("EXPLAIN QUERY PLAN " + statement):
+        m = PLAN_TABLE_RX.match(detail)
+        if not m:
+            continue
+        table = aliases.get(m.group(2), m.group(2))
+        if table not in tables:
+            continue  # CTE / subquery
+        auto = AUTOMATIC_INDEX_RX.search(detail)
+        if auto:
+            columns = tuple(part.split("=")[0].strip() for part in auto.group(2).split(" AND "))
+            automatic.append((table, columns, bool(auto.group(1))))
+        elif m.group(1) == "SCAN" and " USING " not in detail:
+            scans.append(table)
+    return scans, automatic
+
+def suggest_indexes(db_path, sql_files, declared=()):
+    """
+    Re-runs the post-processing scripts on an in-memory copy of the database and
+    prints, per statement, the full table scans and automatic indexes of its
+    EXPLAIN QUERY PLAN, then the indexes SQLite had to build on the fly
+    (candidates for the manifest) that aren't declared yet.
+    """
+    source = sqlite3.connect(db_path)
+    conn = sqlite3.connect(":memory:")
+    source.backup(conn)
+    source.close()
+    register_regexp_functions(conn)
+    register_site_code_functions(conn)
+    register_search_functions(conn)
+
+    declared = {(spec["table"], tuple(spec["columns"])) for spec in declared}
+    suggestions = {}
+    print("Query plan report:")
+    for sql_file in sql_files:
+        for line_no, statement in split_statements(Path(sql_file).read_text(encoding="utf-8")):
+            body = LEADING_COMMENTS_RX.sub("", statement, count=1)
+            first = body.split(None, 1)[0].upper() if body.strip() else ""
+            if first in ("SELECT", "WITH", "CREATE", "INSERT", "UPDATE", "DELETE"):
+                try:
+                    scans, automatic = plan_findings(conn, statement)
+                except sqlite3.Error as e:
+                    scans, automatic = [], []
+                    print(f"  {Path(sql_file).name}:{line_no}: no plan ({e})")
+                if scans or automatic:
+                    print(f"  {Path(sql_file).name}:{line_no}")
+                for table in scans:
+                    print(f"      SCAN {table}")
+                for table, columns, covering in automatic:
+                    print(f"      AUTOMATIC {'COVERING ' if covering else ''}INDEX {table} ({', '.join(columns)})")
+                    suggestions.setdefault((table, columns), []).append(f"{Path(sql_file).name}:{line_no}")
+            conn.executescript(statement)  # later statements may read what this one creates
+    conn.close()
+
+    missing = {key: where for key, where in suggestions.items() if key not in declared}
+    if not missing:
+        print("No index suggestions.")
+        return {}
+    print("Suggested indexes (built automatically at run time, not declared):")
+    for (table, columns), where in sorted(missing.items()):
+        print(f'  {{"table": "{table}", "columns": {json.dumps(list(columns))}}}   # {", ".join(where)}')
+    return missing
+
+def main():
+    args = sys.argv[1:]
+    suggest_dir = None
+    if "--suggest" in args:
+        i = args.index("--suggest")
+        suggest_dir = args[i + 1]
+        del args[i:i + 2]
+    if not args:
+        print("Usage: python build_indexes.py <sqlite_db> [indexes.json] [--suggest <sql_dir>]")
+        sys.exit(1)
+
+    db_path = args[0]
+    manifest = load_index_manifest(args[1] if len(args) > 1 else DEFAULT_INDEX_MANIFEST)
+    specs = manifest.get("indexes", [])
+
+    stats = BuildStats(db_path, "build_indexes")
+    conn = sqlite3.connect(db_path)
+    with stage("create_indexes", rows_in=len(specs)) as s:
+        built = create_indexes(conn, specs)
+        s["rows_out"] = len(built)
+    with stage("analyze"):
+        analyze_seconds = analyze(conn, manifest.get("optimize", True)) if manifest.get("analyze", True) else None
+    report_indexes(conn, built, analyze_seconds)
+    conn.close()
+    stats.save()
+
+    if suggest_dir:
+        sql_dir = Path(suggest_dir)
+        sql_files = sorted(list(sql_dir.glob("*.sql")) + list(sql_dir.glob("*.sql.post")), key=lambda p: p.name)
+        suggest_indexes(db_path, sql_files, specs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+
+from build_stats import BuildStats, adopt, profile_flag, recording, stage
+from sheet_cache import sheet_cache_from_config
+from excel_to_sqlite import (
+    load_config, parse_region, read_regions, rows_to_content,
+    directory_files, plan_table_load, apply_table_load,
+    load_pragmas, map_in_workers,
+)
+
+
+def load_manifest(manifest_path):
+    """
+    Reads the build manifest:
+      {"jobs": [{"excel": ..., "config": ...}, ...], "loadPragmas": ..., "workers": ...}
+    'excel' is only needed for single-file configs; directory configs
+    ('directory' in the config) find their own files.
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def plan_jobs(manifest):
+    """
+    Expands the manifest into one job per config:
+      {"config_file", "config", "files": [(excel_path, extra_col_value), ...]}
+    Directory configs list their matching files here, so every workbook the
+    build needs is known before any of them is opened.
+    """
+    jobs = []
+    for entry in manifest["jobs"]:
+        config_file = entry["config"]
+        config = load_config(config_file)
+        if "directory" in config:
+            files = directory_files(config)
+        else:
+            files = [(entry["excel"], None)]
+        jobs.append({"config_file": config_file, "config": config, "files": files})
+    return jobs
+
+def group_by_workbook(jobs):
+    """
+    Returns {excel_path: [(job_index, file_index), ...]} in first-seen order,
+    i.e. every (config, file) pair that has to be read from the same workbook
+    (job["read"] - all files, or only the changed ones in an incremental build).
+    """
+    by_workbook = OrderedDict()
+    for j, job in enumerate(jobs):
+        for f, (excel_path, extra_val) in enumerate(job["files"]):
+            if (excel_path, extra_val) in job["read"]:
+                by_workbook.setdefault(os.path.normpath(excel_path), []).append((j, f))
+    return by_workbook
+
+def read_workbook_regions(excel_path, requests):
+    """
+    Opens one workbook and reads all requested regions from it in one go.
+    requests = [(key, config), ...]; returns {key: all_rows or None (no such sheet)}.
+    Regions on the same sheet are read in a single pass (read_regions), and
+    regions already in the sheet cache aren't parsed at all.
+    The workbook is opened read-only unless one of the configs asks for readMode 'full'.
+    """
+    configs = [config for _key, config in requests]
+    read_mode = "full" if any(c.get("readMode", "streaming") == "full" for c in configs) else "streaming"
+    verbose_merges = any(c.get("logMergedRanges", False) for c in configs)
+    caches = [sheet_cache_from_config(c) for c in configs]
+    cache = None if None in caches else caches[0]
+
+    by_sheet = OrderedDict()
+    for key, config in requests:
+        by_sheet.setdefault(config.get("sheetName", "Sheet1"), []).append(
+            (key, parse_region(config.get("region")))
+        )
+
+    sheet_rows = read_regions(
+        excel_path, {ws_name: [r for _k, r in reqs] for ws_name, reqs in by_sheet.items()},
+        read_mode, verbose_merges, cache
+    )
+    results = {}
+    for ws_name, reqs in by_sheet.items():
+        regions = sheet_rows[ws_name]
+        for i, (key, _region) in enumerate(reqs):
+            results[key] = None if regions is None else regions[i]
+    return results
+
+def job_reader(jobs, j, regions):
+    """
+    read_files callback for apply_table_load(): builds each file's content from
+    the regions parsed up front; a file that wasn't (incremental fallback to a
+    full rebuild) is parsed on demand.
+    """
+    job = jobs[j]
+    config = job["config"]
+    filename_col = config.get("filenameColumnName")
+    index = {path: f for f, (path, _val) in enumerate(job["files"])}
+
+    def read_files(files):
+        contents = []
+        for excel_path, extra_val in files:
+            key = (j, index[excel_path])
+            if key not in regions:
+                regions.update(read_workbook_regions(excel_path, [(key, config)]))
+            all_rows = regions[key]
+            if all_rows is None:
+                print(f"Warning: File '{excel_path}' has no sheet '{config.get('sheetName', 'Sheet1')}'; skipping.")
+                contents.append(None)
+                continue
+            header_for_file, dict_rows, col_samples = rows_to_content(
+                all_rows, config, excel_path, filename_col, extra_val
+            )
+            contents.append((header_for_file, dict_rows, col_samples) if header_for_file is not None else None)
+        return contents
+    return read_files
+
+def parse_workbook(task):
+    """
+    Process-pool worker: read_workbook_regions + its wall time and build stages.
+    task = (excel_path, requests); returns (results, seconds, stages).
+    """
+    excel_path, requests = task
+    t0 = time.perf_counter()
+    with recording() as stages:
+        with stage("workbook", file=excel_path, bytes_in=os.path.getsize(excel_path), regions=len(requests)) as s:
+            results = read_workbook_regions(excel_path, requests)
+            s["rows_out"] = sum(len(rows) for rows in results.values() if rows)
+    return results, time.perf_counter() - t0, stages
+
+def build(conn, jobs, workers=None, incremental=False):
+    """
+    Parses every workbook once, then builds each config's table from the
+    regions read. Prints per-workbook parse time and per-config extract time.
+    Workbooks are parsed over 'workers' processes (default: CPU count).
+    With incremental=True only workbooks new/changed since the last build
+    are parsed (see plan_table_load).
+    """
+    # 0) plan: which files each table needs read
+    plans = []
+    with stage("plan", incremental=incremental):
+        for job in jobs:
+            plan = plan_table_load(conn, job["config"], job["files"], incremental)
+            job["read"] = set(plan["read"])
+            plans.append(plan)
+
+    # 1) parse: one open per workbook, all configs' regions at once
+    tasks = [
+        (excel_path, [((j, f), jobs[j]["config"]) for j, f in keys])
+        for excel_path, keys in group_by_workbook(jobs).items()
+    ]
+    regions = {}
+    parse_total = 0.0
+    print(f"\n== Parsing workbooks ({len(tasks)})")
+    t_parse = time.perf_counter()
+    with stage("parse", workbooks=len(tasks)):
+        for (excel_path, requests), (results, elapsed, stages) in zip(tasks, map_in_workers(parse_workbook, tasks, workers)):
+            regions.update(results)
+            parse_total += elapsed
+            adopt(stages)
+            print(f"   {elapsed:7.2f}s  {excel_path}  ({len(requests)} region(s))")
+    parse_wall = time.perf_counter() - t_parse
+
+    # 2) extract + load, in manifest order
+    extract_total = 0.0
+    print("\n== Extracting tables")
+    with stage("extract", tables=len(jobs)):
+        for j, (job, plan) in enumerate(zip(jobs, plans)):
+            t0 = time.perf_counter()
+            with stage("table", config=job["config_file"], table=job["config"]["tableName"], files_read=len(job["read"])):
+                apply_table_load(conn, job["config"], job["files"], plan, job_reader(jobs, j, regions))
+            elapsed = time.perf_counter() - t0
+            extract_total += elapsed
+            print(f"   {elapsed:7.2f}s  {job['config_file']}  ({len(job['read'])}/{len(job['files'])} file(s) read)")
+
+    print(f"\nParse total: {parse_total:.2f}s ({parse_wall:.2f}s wall), extract total: {extract_total:.2f}s")
+
+def main():
+    args = [a for a in sys.argv[1:] if a != "--incremental"]
+    incremental = len(args) != len(sys.argv) - 1
+    profile = profile_flag(args)
+    if len(args) < 1:
+        print("Usage: python build_sqlite.py <sqlite_db_path> [manifest.json] [--incremental] [--profile[=cprofile,tracemalloc]]")
+        sys.exit(1)
+
+    db_path = args[0]
+    manifest_path = args[1] if len(args) > 1 else "build_manifest.json"
+
+    stats = BuildStats(db_path, "build_sqlite", profile)
+    manifest = load_manifest(manifest_path)
+    jobs = plan_jobs(manifest)
+
+    # One connection for the whole build
+    conn = sqlite3.connect(db_path)
+    with load_pragmas(conn, manifest.get("loadPragmas")):
+        build(conn, jobs, manifest.get("workers"), incremental)
+
+    conn.commit()
+    conn.close()
+    stats.save()
+    print(f"Done. Data loaded into SQLite database: {db_path}")
+
+if __name__ == "__main__":
+    main()
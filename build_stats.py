@@ -0,0 +1,388 @@
+"""
+Per-stage build instrumentation. Every step of build_everything.sh records its
+stages (workbook parse, extract, each *.sql.post script, ...) with wall and
+CPU time, rows in / out, bytes read and peak RSS, into a JSON build report next
+to the database (<db>.build.json) and into its _build_stats table.
+
+    stats = BuildStats(db_path, "apply_sql_scripts")
+    with stage("vfsites.sql.post") as s:
+        ...
+        s["rows_out"] = rows_written
+    stats.save()
+
+stage() records into the BuildStats of the process (a no-op without one), so
+library code like excel_to_sqlite.py is instrumented without threading a
+recorder through every call. Stages nest; a stage's parent is the one open
+around it. Worker processes record with recording() and hand their stages back
+to the parent (adopt()).
+
+  wall_s / cpu_s   perf_counter / process_time over the stage
+  rows_in/out      set by the stage itself (rows parsed, rows inserted, ...)
+  bytes_read       bytes the process read meanwhile (/proc/self/io rchar)
+  peak_rss_kb      the process' peak resident set at the end of the stage
+
+The steps of one build share the report: build_everything.sh exports BUILD_ID,
+and a step whose BUILD_ID differs from the report's starts a new one. The
+_build_stats table keeps the rows of every build, so builds can be compared.
+
+Profiling (BUILD_PROFILE=cprofile,tracemalloc or a step's --profile=...):
+  cprofile      one <db>.profile/<step>.<stage>.prof per top-level stage
+  tracemalloc   each top-level stage's peak traced allocation and top lines
+
+Usage:
+    python build_stats.py <db or report.json> [--all] [--baseline <db or report.json>] [--tolerance 25]
+"""
+import cProfile
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+BUILD_STATS_TABLE = "_build_stats"
+PROFILE_KINDS = ("cprofile", "tracemalloc")
+TRACEMALLOC_TOP = 5
+
+STAGE_FIELDS = ("wall_s", "cpu_s", "rows_in", "rows_out", "bytes_read", "peak_rss_kb")
+
+_recorder = None    # the BuildStats stage() records into
+_profiling = False  # a cProfile / tracemalloc stage is open (they don't nest)
+
+
+def report_path(db_path):
+    return f"{db_path}.build.json"
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # kB on Linux
+
+def bytes_read_so_far():
+    try:
+        with open("/proc/self/io", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def profile_kinds():
+    """The BUILD_PROFILE kinds that are on, e.g. {'cprofile'}."""
+    kinds = {k.strip() for k in os.environ.get("BUILD_PROFILE", "").split(",") if k.strip()}
+    unknown = kinds - set(PROFILE_KINDS)
+    if unknown:
+        raise ValueError(f"BUILD_PROFILE: unknown kind(s) {sorted(unknown)}; use {', '.join(PROFILE_KINDS)}")
+    return kinds
+
+def profile_flag(args):
+    """Removes '--profile' / '--profile=kinds' from args and returns the kinds ('cprofile' by default) or None."""
+    for a in list(args):
+        if a == "--profile" or a.startswith("--profile="):
+            args.remove(a)
+            return a.partition("=")[2] or "cprofile"
+    return None
+
+def safe_name(text):
+    return re.sub(r"[^\w.-]+", "_", text).strip("_")[:80]
+
+
+class BuildStats:
+    """
+    The stages of one build step. Creating it makes it the process' recorder
+    for stage(); save() writes the report and the _build_stats rows.
+    'profile' (e.g. 'cprofile,tracemalloc') overrides BUILD_PROFILE, for this
+    process and the workers it starts.
+    """
+
+    def __init__(self, db_path=None, step=None, profile=None):
+        global _recorder
+        self.db_path = os.path.abspath(db_path) if db_path else None
+        self.step = step
+        self.build_id = os.environ.get("BUILD_ID") or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.records = []
+        self.open = []  # names of the stages being recorded, outermost first
+        if profile:
+            os.environ["BUILD_PROFILE"] = profile
+        if self.db_path and "cprofile" in profile_kinds():
+            os.environ.setdefault("BUILD_PROFILE_DIR", f"{self.db_path}.profile")
+        self.t0, self.cpu0, self.io0 = time.perf_counter(), time.process_time(), bytes_read_so_far()
+        _recorder = self
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Records the block as stage 'name'; yields its dict, so the block can set rows_in / rows_out / extra keys."""
+        global _profiling
+        record = {"stage": name, "parent": self.open[-1] if self.open else None, "depth": len(self.open),
+                  "rows_in": None, "rows_out": None}
+        record.update(fields)
+        profiler = traced = None
+        if not self.open and not _profiling:
+            kinds = profile_kinds()
+            if "cprofile" in kinds:
+                profiler = cProfile.Profile()
+            if "tracemalloc" in kinds and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                traced = True
+            _profiling = bool(profiler or traced)
+        self.records.append(record)
+        self.open.append(name)
+        t0, cpu0, io0 = time.perf_counter(), time.process_time(), bytes_read_so_far()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record["wall_s"] = time.perf_counter() - t0
+            record["cpu_s"] = time.process_time() - cpu0
+            io1 = bytes_read_so_far()
+            record["bytes_read"] = io1 - io0 if io0 is not None and io1 is not None else None
+            record["peak_rss_kb"] = peak_rss_kb()
+            self.open.pop()
+            if profiler:
+                profile_dir = os.environ.get("BUILD_PROFILE_DIR", "build.profile")
+                os.makedirs(profile_dir, exist_ok=True)
+                record["profile"] = os.path.join(profile_dir, f"{safe_name(f'{self.step}.{name}')}.prof")
+                profiler.dump_stats(record["profile"])
+            if traced:
+                snapshot = tracemalloc.take_snapshot()
+                record["tracemalloc_peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+                record["tracemalloc_top"] = [str(s) for s in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]]
+                tracemalloc.stop()
+            if profiler or traced:
+                _profiling = False
+
+    def adopt(self, records):
+        """Adds stages recorded elsewhere (a worker's recording()) under the stage open here."""
+        for record in records:
+            record = dict(record)
+            if record["depth"] == 0:
+                record["parent"] = self.open[-1] if self.open else None
+            record["depth"] += len(self.open)
+            self.records.append(record)
+
+    def summary(self):
+        """This step as it goes into the report."""
+        io1 = bytes_read_so_far()
+        return {
+            "started_at": self.started_at,
+            "wall_s": time.perf_counter() - self.t0,
+            "cpu_s": time.process_time() - self.cpu0,
+            "bytes_read": io1 - self.io0 if self.io0 is not None and io1 is not None else None,
+            "peak_rss_kb": peak_rss_kb(),
+            "stages": self.records,
+        }
+
+    def save(self, table=True):
+        """
+        Writes this step into <db>.build.json and, with table=True, _build_stats
+        (replacing an earlier run of it in the same build). table=False leaves
+        the database alone (a published snapshot, see db_snapshot.py).
+        """
+        summary = self.summary()
+        path = report_path(self.db_path)
+        report = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                report = json.load(f)
+        if not report or report.get("build_id") != self.build_id:
+            report = {"build_id": self.build_id, "database": self.db_path, "steps": {}}
+        report["steps"][self.step] = summary
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+        if table:
+            conn = sqlite3.connect(self.db_path)
+            write_build_stats(conn, self.build_id, self.step, summary)
+            conn.close()
+        print(f"Build stats: {self.step} {summary['wall_s']:.2f}s, {len(self.records)} stage(s) -> {path}")
+
+
+def stage(name, **fields):
+    """BuildStats.stage() of the process' recorder, or a block that records nothing."""
+    if _recorder is None:
+        return _unrecorded(name, fields)
+    return _recorder.stage(name, **fields)
+
+@contextmanager
+def _unrecorded(name, fields):
+    yield dict(fields, stage=name)
+
+def adopt(records):
+    """BuildStats.adopt() of the process' recorder, if any."""
+    if _recorder is not None:
+        _recorder.adopt(records)
+
+@contextmanager
+def recording():
+    """A fresh recorder for the block (e.g. in a worker process); yields its list of stages."""
+    global _recorder
+    previous = _recorder
+    stats = BuildStats()
+    try:
+        yield stats.records
+    finally:
+        _recorder = previous
+
+def write_build_stats(conn, build_id, step, summary):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{BUILD_STATS_TABLE}" (
+            build_id    TEXT NOT NULL,
+            step        TEXT NOT NULL,
+            stage       TEXT NOT NULL,   -- '' for the step as a whole
+            parent      TEXT,
+            depth       INTEGER,
+            started_at  TEXT,
+            wall_s      REAL,
+            cpu_s       REAL,
+            rows_in     INTEGER,
+            rows_out    INTEGER,
+            bytes_read  INTEGER,
+            peak_rss_kb INTEGER,
+            detail      TEXT             -- JSON of any other keys (profile file, tracemalloc, ...)
+        )""")
+    conn.execute(f'DELETE FROM "{BUILD_STATS_TABLE}" WHERE build_id = ? AND step = ?', (build_id, step))
+    rows = [(build_id, step, "", None, None, summary["started_at"], summary["wall_s"], summary["cpu_s"],
+             None, None, summary["bytes_read"], summary["peak_rss_kb"], None)]
+    for r in summary["stages"]:
+        detail = {k: v for k, v in r.items() if k not in STAGE_FIELDS + ("stage", "parent", "depth")}
+        rows.append((build_id, step, r["stage"], r["parent"], r["depth"], None, r["wall_s"], r["cpu_s"],
+                     r["rows_in"], r["rows_out"], r["bytes_read"], r["peak_rss_kb"],
+                     json.dumps(detail, default=str) if detail else None))
+    conn.executemany(f'INSERT INTO "{BUILD_STATS_TABLE}" VALUES ({", ".join(["?"] * 13)})', rows)
+    conn.commit()
+
+def load_report(path):
+    """A build report from a report JSON, or the latest build in a database's _build_stats."""
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    conn = sqlite3.connect(path)
+    try:
+        row = conn.execute(f'SELECT build_id FROM "{BUILD_STATS_TABLE}" ORDER BY rowid DESC LIMIT 1').fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    if row is None:
+        conn.close()
+        return {"build_id": None, "database": path, "steps": {}}
+    report = {"build_id": row[0], "database": path, "steps": {}}
+    for step, stage_name, parent, depth, started_at, wall_s, cpu_s, rows_in, rows_out, bytes_read, peak, detail in conn.execute(
+            f'SELECT step, stage, parent, depth, started_at, wall_s, cpu_s, rows_in, rows_out, bytes_read, '
+            f'peak_rss_kb, detail FROM "{BUILD_STATS_TABLE}" WHERE build_id = ? ORDER BY rowid', (row[0],)):
+        if stage_name == "":
+            report["steps"][step] = {"started_at": started_at, "wall_s": wall_s, "cpu_s": cpu_s,
+                                     "bytes_read": bytes_read, "peak_rss_kb": peak, "stages": []}
+            continue
+        record = {"stage": stage_name, "parent": parent, "depth": depth, "wall_s": wall_s, "cpu_s": cpu_s,
+                  "rows_in": rows_in, "rows_out": rows_out, "bytes_read": bytes_read, "peak_rss_kb": peak}
+        record.update(json.loads(detail) if detail else {})
+        report["steps"][step]["stages"].append(record)
+    conn.close()
+    return report
+
+def aggregate(summary):
+    """
+    {stage path: totals} of one step, in first-seen order: stages with the same
+    path ('parse / workbook' for every workbook) are summed, with their count in 'n'.
+    """
+    totals = {}
+    path = []
+    for r in summary["stages"]:
+        del path[r["depth"]:]
+        path.append(r["stage"])
+        key = " / ".join(path)
+        t = totals.setdefault(key, {"depth": r["depth"], "n": 0, "wall_s": 0.0, "cpu_s": 0.0, "rows_in": None,
+                                    "rows_out": None, "bytes_read": None, "peak_rss_kb": None})
+        t["n"] += 1
+        t["wall_s"] += r["wall_s"]
+        t["cpu_s"] += r["cpu_s"]
+        for field in ("rows_in", "rows_out", "bytes_read"):
+            if r[field] is not None:
+                t[field] = (t[field] or 0) + r[field]
+        if r["peak_rss_kb"] is not None:
+            t["peak_rss_kb"] = max(t["peak_rss_kb"] or 0, r["peak_rss_kb"])
+    return totals
+
+def stage_times(report):
+    """{(step, stage path): wall_s}; a step's own total is under stage path ''."""
+    times = {}
+    for step, summary in report["steps"].items():
+        times[(step, "")] = summary["wall_s"]
+        for key, t in aggregate(summary).items():
+            times[(step, key)] = t["wall_s"]
+    return times
+
+def print_report(report, every_stage=False):
+    """One line per step and stage path (per stage with every_stage)."""
+    print(f"Build {report['build_id']} ({report['database']})")
+    print(f"{'stage':<56} {'n':>5} {'wall s':>8} {'cpu s':>8} {'rows in':>9} {'rows out':>9} {'MB read':>8} {'peak MB':>8}")
+    mb = lambda v: f"{v / 1024 / 1024:>8.1f}" if v is not None else f"{'-':>8}"
+    n = lambda v: f"{v:>9}" if v is not None else f"{'-':>9}"
+    for step, summary in report["steps"].items():
+        print(f"{step:<56} {'':>5} {summary['wall_s']:>8.2f} {summary['cpu_s']:>8.2f} {n(None)} {n(None)} "
+              f"{mb(summary['bytes_read'])} {mb((summary['peak_rss_kb'] or 0) * 1024)}")
+        if every_stage:
+            lines = [(r["depth"], r["stage"] + (f" {r.get('file') or r.get('config')}" if r.get("file") or r.get("config") else ""),
+                      dict(r, n=1)) for r in summary["stages"]]
+        else:
+            lines = [(t["depth"], key.rsplit(" / ", 1)[-1], t) for key, t in aggregate(summary).items()]
+        for depth, name, t in lines:
+            name = ("  " * (depth + 1) + name)[:56]
+            print(f"{name:<56} {t['n']:>5} {t['wall_s']:>8.2f} {t['cpu_s']:>8.2f} {n(t['rows_in'])} {n(t['rows_out'])} "
+                  f"{mb(t['bytes_read'])} {mb((t['peak_rss_kb'] or 0) * 1024)}")
+
+def main():
+    args = sys.argv[1:]
+    baseline_path, tolerance = None, 25.0
+    if "--baseline" in args:
+        i = args.index("--baseline")
+        baseline_path = args[i + 1]
+        del args[i:i + 2]
+    if "--tolerance" in args:
+        i = args.index("--tolerance")
+        tolerance = float(args[i + 1])
+        del args[i:i + 2]
+    every_stage = "--all" in args
+    if every_stage:
+        args.remove("--all")
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    path = args[0]
+    if not path.endswith(".json") and os.path.exists(report_path(path)):
+        path = report_path(path)
+    report = load_report(path)
+    print_report(report, every_stage)
+    if not baseline_path:
+        return
+
+    before, after = stage_times(load_report(baseline_path)), stage_times(report)
+    slower = []
+    for key, wall_s in after.items():
+        old = before.get(key)
+        # sub-0.1s stages are noise
+        if old and max(old, wall_s) >= 0.1 and (wall_s / old - 1) * 100 > tolerance:
+            slower.append((key, old, wall_s))
+    for (step, stage_path), old, new in slower:
+        print(f"SLOWER {step} {stage_path or '(total)'}: {old:.2f}s -> {new:.2f}s (+{(new / old - 1) * 100:.0f}%)")
+    new_stages = [key for key in after if key not in before]
+    if new_stages:
+        print(f"{len(new_stages)} stage(s) not in the baseline, e.g. {new_stages[0][0]} {new_stages[0][1]}")
+    print(f"{len(slower)} stage(s) slower than the baseline by more than {tolerance:.0f}%")
+    sys.exit(1 if slower else 0)
+
+if __name__ == "__main__":
+    main()
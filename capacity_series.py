@@ -0,0 +1,127 @@
+"""
+Packed capacity time series, built from vf_capacity_snapshot
+(sqlite/vfsummary_capacity_history.sql.post):
+
+    vf_capacity_series   one row per domain, series_key and metric: the
+                         monthly values as a float64 blob, date-aligned from
+                         start_month (months since 1970-01) for 'months'
+                         months; NaN where there is no snapshot or no value
+
+read_series() slices one series by date without touching the other months:
+
+    dates, values = read_series(conn, "fixed", "CHMN21", "running_load_in_kw",
+                                "2024-03-01", "2024-08-01")
+
+Usage:
+    python capacity_series.py <sqlite_db>
+"""
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from build_stats import BuildStats, stage
+
+METRICS = (
+    "remaining_power_capacity_in_kw",
+    "running_load_in_kw",
+    "total_allocated_in_kw",
+    "reserved_load_in_kw",
+    "forecasted_load_in_kw",
+    "remaining_power_80_of_n_in_kw",
+)
+
+VALUE_DTYPE = np.dtype("<f8")
+
+TABLE_SQL = """
+DROP TABLE IF EXISTS vf_capacity_series;
+CREATE TABLE vf_capacity_series (
+    domain       TEXT    NOT NULL,
+    series_key   TEXT    NOT NULL,
+    metric       TEXT    NOT NULL,
+    start_month  INTEGER NOT NULL,   -- months since 1970-01 of values[0]
+    start_date   TEXT    NOT NULL,   -- the same as 'YYYY-MM-01'
+    months       INTEGER NOT NULL,
+    values_f64   BLOB    NOT NULL,   -- little-endian float64 x months
+    PRIMARY KEY (domain, series_key, metric)
+);
+"""
+
+
+def epoch_month(iso_date):
+    """'2024-03-01' => months since 1970-01."""
+    return (int(iso_date[:4]) - 1970) * 12 + int(iso_date[5:7]) - 1
+
+def month_date(month):
+    """Months since 1970-01 => 'YYYY-MM-01'."""
+    return f"{1970 + month // 12:04d}-{month % 12 + 1:02d}-01"
+
+def pack_series(conn):
+    """[(domain, series_key, metric, start_month, start_date, months, blob)] from vf_capacity_snapshot."""
+    rows = conn.execute(f"""
+        SELECT domain, series_key, file_date, {", ".join(METRICS)}
+        FROM vf_capacity_snapshot
+        WHERE series_key IS NOT NULL
+        ORDER BY domain, series_key, file_date""").fetchall()
+    by_series = {}
+    for domain, key, file_date, *values in rows:
+        by_series.setdefault((domain, key), []).append((epoch_month(file_date), values))
+
+    packed = []
+    for (domain, key), snapshots in by_series.items():
+        months = np.array([m for m, _v in snapshots])
+        start = int(months.min())
+        grid = np.full((len(METRICS), int(months.max()) - start + 1), np.nan, dtype=VALUE_DTYPE)
+        # None => NaN; a month with two snapshots keeps the last one
+        grid[:, months - start] = np.array([v for _m, v in snapshots], dtype=float).T
+        for metric, series in zip(METRICS, grid):
+            packed.append((domain, key, metric, start, month_date(start), len(series), series.tobytes()))
+    return packed
+
+def build_capacity_series(conn):
+    """(Re)creates vf_capacity_series. Returns its row count."""
+    with stage("pack_series") as s:
+        packed = pack_series(conn)
+        s["rows_out"] = len(packed)
+    with stage("insert", rows_in=len(packed)) as s:
+        conn.executescript(TABLE_SQL)
+        conn.executemany("INSERT INTO vf_capacity_series VALUES (?, ?, ?, ?, ?, ?, ?)", packed)
+        conn.commit()
+        s["rows_out"] = len(packed)
+    return len(packed)
+
+def read_series(conn, domain, series_key, metric, from_date=None, to_date=None):
+    """
+    (['YYYY-MM-01', ...], float64 array) of one series between two dates
+    (inclusive, either may be None); empty when there is no such series.
+    """
+    row = conn.execute("SELECT start_month, values_f64 FROM vf_capacity_series "
+                       "WHERE domain = ? AND series_key = ? AND metric = ?",
+                       (domain, series_key, metric)).fetchone()
+    if row is None:
+        return [], np.empty(0, dtype=VALUE_DTYPE)
+    start, blob = row
+    values = np.frombuffer(blob, dtype=VALUE_DTYPE)
+    lo = max(epoch_month(from_date) - start, 0) if from_date else 0
+    hi = min(epoch_month(to_date) - start + 1, len(values)) if to_date else len(values)
+    if hi <= lo:
+        return [], np.empty(0, dtype=VALUE_DTYPE)
+    return [month_date(start + i) for i in range(lo, hi)], values[lo:hi]
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    stats = BuildStats(sys.argv[1], "capacity_series")
+    conn = sqlite3.connect(sys.argv[1])
+    t0 = time.perf_counter()
+    rows = build_capacity_series(conn)
+    conn.close()
+    stats.save()
+    print(f"vf_capacity_series       {rows:>8} rows")
+    print(f"Capacity series built in {time.perf_counter() - t0:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Atomic publish of a freshly built database, and read-only opening of the
+published snapshot for serving.
+
+build_everything.sh builds into a scratch file next to the target; publish()
+then:
+
+  1. stamps _build_metadata (build id, time, build manifest, source files from
+     _ingest_manifest, row count per table) and carries the _build_stats rows
+     of earlier builds over from the current target
+  2. checks the build (PRAGMA quick_check, or integrity_check with --full-check)
+  3. VACUUMs it INTO a compact image next to the target (journal_mode DELETE,
+     no free pages) and quick_checks the image
+  4. fsyncs the image and os.replace()s it over the target (atomic on one
+     filesystem), moving the build report along
+
+so a reader opens either the old or the new image, never a half-loaded one. A
+reader that already has the old file open keeps reading it (its inode lives
+until closed). Nothing writes to a published image again, which is what makes
+open_snapshot()'s immutable=1 safe: SQLite then takes no locks and doesn't
+check the file for changes. mmap_size (env VF_MMAP_SIZE, bytes, default
+256 MB; 0 = off) maps the image instead of copying pages into the page cache.
+
+Usage:
+    python db_snapshot.py <building.db> <target.db> [build_manifest.json] [--full-check] [--keep]
+    python db_snapshot.py --info <target.db>
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+import urllib.parse
+from datetime import datetime
+
+from build_stats import BUILD_STATS_TABLE, BuildStats, report_path, stage
+
+METADATA_TABLE = "_build_metadata"
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+
+
+def snapshot_uri(path, immutable=True):
+    uri = f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+    return uri + "&immutable=1" if immutable else uri
+
+def mmap_size_setting():
+    return int(os.environ.get("VF_MMAP_SIZE", DEFAULT_MMAP_SIZE))
+
+def open_snapshot(path, mmap_size=None, immutable=True, check_same_thread=True):
+    """
+    Read-only connection to a published database (mode=ro, immutable=1 unless
+    immutable=False) with PRAGMA mmap_size = mmap_size (default: mmap_size_setting()).
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    conn = sqlite3.connect(snapshot_uri(path, immutable), uri=True, check_same_thread=check_same_thread)
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_size if mmap_size is not None else mmap_size_setting())}")
+    return conn
+
+def source_files(conn):
+    """[{table, path, size, mtime, content_hash}] of the loaded source files ([] without _ingest_manifest)."""
+    try:
+        rows = conn.execute('SELECT table_name, source_path, size, mtime, content_hash FROM "_ingest_manifest" '
+                            "ORDER BY table_name, source_path").fetchall()
+    except sqlite3.OperationalError:
+        return []
+    return [dict(zip(("table", "path", "size", "mtime", "content_hash"), row)) for row in rows]
+
+def stamp_metadata(conn, build_id, manifest_path=None):
+    """(Re)creates _build_metadata: one row describing this build. Returns it as a dict."""
+    manifest = None
+    if manifest_path:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    tables = [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    metadata = {
+        "build_id": build_id,
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+        "sqlite_version": sqlite3.sqlite_version,
+        "manifest": json.dumps(manifest) if manifest is not None else None,
+        "sources": json.dumps(source_files(conn)),
+        "table_rows": json.dumps({t: conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0]
+                                  for t in tables if t != METADATA_TABLE}),
+    }
+    conn.execute(f'DROP TABLE IF EXISTS "{METADATA_TABLE}"')
+    conn.execute(f'CREATE TABLE "{METADATA_TABLE}" ({", ".join(f"{k} TEXT" for k in metadata)})')
+    conn.execute(f'INSERT INTO "{METADATA_TABLE}" VALUES ({", ".join("?" * len(metadata))})', list(metadata.values()))
+    conn.commit()
+    return metadata
+
+def read_metadata(conn):
+    """The _build_metadata row as a dict (None for a database built before it existed)."""
+    try:
+        cur = conn.execute(f'SELECT * FROM "{METADATA_TABLE}"')
+    except sqlite3.OperationalError:
+        return None
+    row = cur.fetchone()
+    return dict(zip([d[0] for d in cur.description], row)) if row else None
+
+def carry_build_stats(conn, target_path, build_id):
+    """
+    Copies the _build_stats rows of earlier builds from the current target, so
+    its history survives the swap; builds already here (a build seeded from a
+    copy of the target) are not copied twice.
+    """
+    if not os.path.exists(target_path):
+        return 0
+    conn.execute("ATTACH DATABASE ? AS previous", (snapshot_uri(target_path, immutable=False),))
+    try:
+        has = conn.execute("SELECT 1 FROM previous.sqlite_master WHERE name = ?", (BUILD_STATS_TABLE,)).fetchone()
+        here = conn.execute("SELECT 1 FROM main.sqlite_master WHERE name = ?", (BUILD_STATS_TABLE,)).fetchone()
+        if not has or not here:
+            return 0
+        cur = conn.execute(f'INSERT INTO main."{BUILD_STATS_TABLE}" SELECT * FROM previous."{BUILD_STATS_TABLE}" '
+                           f"WHERE build_id != ? AND build_id NOT IN (SELECT build_id FROM main.\"{BUILD_STATS_TABLE}\")",
+                           (build_id,))
+        conn.commit()
+        return cur.rowcount
+    finally:
+        conn.execute("DETACH DATABASE previous")
+
+def check_database(conn, full=False):
+    """[] if PRAGMA quick_check (integrity_check with full=True) is clean, else its messages."""
+    result = [row[0] for row in conn.execute("PRAGMA integrity_check" if full else "PRAGMA quick_check")]
+    return [] if result == ["ok"] else result
+
+def fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def publish(build_path, target_path, manifest_path=None, full_check=False, keep=False):
+    """
+    Steps 1-4 above. Raises RuntimeError (target untouched) when a check fails.
+    Returns {'metadata', 'build_bytes', 'image_bytes'}.
+    """
+    build_path, target_path = os.path.abspath(build_path), os.path.abspath(target_path)
+    if os.path.exists(report_path(build_path)):
+        # the id the build steps recorded under, when BUILD_ID isn't exported
+        with open(report_path(build_path), "r", encoding="utf-8") as f:
+            os.environ.setdefault("BUILD_ID", json.load(f)["build_id"])
+    stats = BuildStats(target_path, "publish")
+    image_path = f"{target_path}.publish-{os.getpid()}"
+    build_bytes = os.path.getsize(build_path)
+    conn = sqlite3.connect(build_path)
+    try:
+        with stage("stamp") as s:
+            s["rows_in"] = carry_build_stats(conn, target_path, stats.build_id)
+            metadata = stamp_metadata(conn, stats.build_id, manifest_path)
+        with stage("full_check" if full_check else "quick_check"):
+            problems = check_database(conn, full_check)
+        if problems:
+            raise RuntimeError(f"{build_path} failed {'integrity' if full_check else 'quick'}_check: "
+                               + "; ".join(problems[:10]))
+        with stage("vacuum_into", bytes_in=build_bytes) as s:
+            if os.path.exists(image_path):
+                os.remove(image_path)
+            conn.execute("VACUUM INTO ?", (image_path,))
+            s["bytes_out"] = os.path.getsize(image_path)
+    except sqlite3.DatabaseError as e:
+        if os.path.exists(image_path):
+            os.remove(image_path)
+        raise RuntimeError(f"{build_path}: {e}") from e
+    finally:
+        conn.close()
+
+    try:
+        with stage("image_check"):
+            image = open_snapshot(image_path, mmap_size=0)
+            try:
+                problems = check_database(image)
+            except sqlite3.DatabaseError as e:
+                problems = [str(e)]
+            image.close()
+        if problems:
+            raise RuntimeError(f"{image_path} failed quick_check: " + "; ".join(problems[:10]))
+        with stage("swap"):
+            fsync_path(image_path)
+            os.replace(image_path, target_path)
+            fsync_path(os.path.dirname(target_path))
+    except BaseException:
+        if os.path.exists(image_path):
+            os.remove(image_path)
+        raise
+
+    # the build report and profiles follow the database
+    if os.path.exists(report_path(build_path)):
+        with open(report_path(build_path), "r", encoding="utf-8") as f:
+            report = json.load(f)
+        report["database"] = target_path
+        with open(report_path(target_path), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        os.remove(report_path(build_path))
+    if os.path.isdir(f"{build_path}.profile"):
+        os.replace(f"{build_path}.profile", f"{target_path}.profile")
+    if not keep:
+        os.remove(build_path)
+    stats.save(table=False)
+    return {"metadata": metadata, "build_bytes": build_bytes, "image_bytes": os.path.getsize(target_path)}
+
+def main():
+    args = sys.argv[1:]
+    if "--info" in args:
+        args.remove("--info")
+        conn = open_snapshot(args[0])
+        metadata = read_metadata(conn)
+        conn.close()
+        if metadata is None:
+            print(f"{args[0]}: no {METADATA_TABLE} (not published by db_snapshot.py)")
+            sys.exit(1)
+        for key, value in metadata.items():
+            if key in ("manifest", "sources", "table_rows") and value:
+                value = json.loads(value)
+                if key == "manifest":
+                    value = value.get("jobs", value)
+                value = f"{len(value)} entries"
+            print(f"{key:<16} {value}")
+        return
+    full_check = "--full-check" in args
+    keep = "--keep" in args
+    args = [a for a in args if a not in ("--full-check", "--keep")]
+    if len(args) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    try:
+        result = publish(args[0], args[1], args[2] if len(args) > 2 else None, full_check, keep)
+    except RuntimeError as e:
+        print(f"NOT PUBLISHED: {e}")
+        sys.exit(1)
+    print(f"Published {args[1]} (build {result['metadata']['build_id']}): "
+          f"{result['build_bytes'] / 1024 / 1024:.1f} MB built -> {result['image_bytes'] / 1024 / 1024:.1f} MB image "
+          f"in {time.perf_counter() - t0:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Runs the vf/*.sql endpoint templates outside the RAW gateway, on DuckDB,
+against a database built by build_everything.sh.
+
+The templates are Postgres SQL with ':name' parameters declared in their
+header comments:
+
+    -- @param site_codes A comma-separated list of site codes.
+    -- @type site_codes varchar
+    -- @default site_codes null
+
+bind_template() substitutes typed literals for the parameters (declared
+default unless a value is given; parameterize_template() makes them $n
+placeholders to PREPARE instead), to_duckdb() rewrites the few Postgres
+spellings DuckDB reads differently, and load_sqlite_database() copies the
+SQLite tables into a DuckDB schema ('vdf', as the templates expect).
+"""
+import re
+
+import numpy as np
+
+from db_snapshot import open_snapshot
+
+PARAM_DECL_RX = re.compile(r"^--\s*@(param|type|default)\s+(\w+)\s*(.*?)\s*$", re.MULTILINE)
+PARAM_REF_RX = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)\b")
+
+# template @type => DuckDB type of the bound literal. Postgres DECIMAL/NUMERIC
+# are arbitrary precision; DuckDB's default DECIMAL is (18,3), so DOUBLE is
+# the closer stand-in.
+PARAM_TYPES = {
+    "varchar": "VARCHAR", "text": "VARCHAR", "integer": "INTEGER", "int": "INTEGER",
+    "bigint": "BIGINT", "boolean": "BOOLEAN", "decimal": "DOUBLE", "numeric": "DOUBLE",
+    "float": "DOUBLE", "double": "DOUBLE", "date": "DATE", "timestamp": "TIMESTAMP",
+}
+
+# A cast to unconstrained DECIMAL / NUMERIC: Postgres keeps 15 significant
+# digits of a float (so round(CAST(5.4499999999999 AS DECIMAL), 1) = 5.5);
+# a fixed scale of POSTGRES_FLOAT_SCALE does the same for this data's range.
+POSTGRES_FLOAT_SCALE = 10
+DUCKDB_REWRITES = [
+    # Postgres FLOAT is double precision, DuckDB's is single
+    (re.compile(r"::\s*float\b(?!\s*\()", re.IGNORECASE), "::DOUBLE"),
+    (re.compile(r"\bAS\s+FLOAT\s*\)", re.IGNORECASE), "AS DOUBLE)"),
+    (re.compile(r"::\s*(?:decimal|numeric)\b(?!\s*\()", re.IGNORECASE), f"::DECIMAL(38,{POSTGRES_FLOAT_SCALE})"),
+    (re.compile(r"\bAS\s+(?:DECIMAL|NUMERIC)\s*\)", re.IGNORECASE), f"AS DECIMAL(38,{POSTGRES_FLOAT_SCALE}))"),
+]
+
+# The user_blacklist_* CTEs only read environment.secrets; their NOT EXISTS
+# guards are resolved to a constant before the query runs (DuckDB can't put a
+# subquery in an outer join's ON clause, which is where most guards sit).
+BLACKLIST_GUARD_RX = re.compile(r"NOT\s+EXISTS\s*\(\s*SELECT\s+\*\s+FROM\s+user_blacklist_(\w+)\s*\)", re.IGNORECASE)
+
+# generate_series() in a SELECT list is a set of rows in Postgres, one list in
+# DuckDB; 'FROM generate_series(...) AS g' names a column g in Postgres, a table
+# in DuckDB. See rewrite_generate_series().
+SERIES_RX = re.compile(r"\b(SELECT|FROM|JOIN)(\s+)generate_series\s*\(", re.IGNORECASE)
+ALIAS_RX = re.compile(r"\s+AS\s+(\w+)\b(?!\s*\()", re.IGNORECASE)
+
+# Postgres functions DuckDB lacks or reads differently, as macros
+DUCKDB_MACROS = [
+    # Postgres '~' matches anywhere in the string; DuckDB's must match all of it
+    "CREATE OR REPLACE MACRO regexp_full_match(s, p) AS regexp_matches(s, p)",
+    "CREATE OR REPLACE MACRO regexp_split_to_table(s, p) AS TABLE "
+    "SELECT unnest(regexp_split_to_array(s, p)) AS x",
+    # the two to_date() formats of the historic capacity snapshots' file_date
+    "CREATE OR REPLACE MACRO to_date(s, fmt) AS CASE fmt "
+    "WHEN 'YYMM01' THEN CAST(strptime(substr(s, 1, 4), '%y%m') AS DATE) "
+    "WHEN '01 MON YY' THEN CAST(strptime(substr(s, 4), '%b %y') AS DATE) END",
+]
+
+
+def parse_params(sql):
+    """{name: {'type': ..., 'default': ...}} from a template's @param/@type/@default lines."""
+    params = {}
+    for kind, name, rest in PARAM_DECL_RX.findall(sql):
+        entry = params.setdefault(name, {"type": "varchar", "default": None})
+        if kind == "type":
+            entry["type"] = rest.split()[0].lower() if rest else "varchar"
+        elif kind == "default":
+            entry["default"] = None if rest.strip().lower() in ("", "null") else rest.strip()
+    return params
+
+def sql_literal(value, param_type):
+    """A typed DuckDB literal for a parameter value (None => typed NULL)."""
+    duck_type = PARAM_TYPES.get(param_type, "VARCHAR")
+    if value is None:
+        return f"CAST(NULL AS {duck_type})"
+    if isinstance(value, bool):
+        return f"CAST({'true' if value else 'false'} AS BOOLEAN)"
+    text = str(value)
+    if duck_type in ("VARCHAR", "DATE", "TIMESTAMP"):
+        text = "'" + text.replace("'", "''") + "'"
+    return f"CAST({text} AS {duck_type})"
+
+def bind_template(sql, values=None, params=None):
+    """The template with every :name replaced by its value (or declared default) as a literal."""
+    values = values or {}
+    params = params if params is not None else parse_params(sql)
+
+    def literal(m):
+        name = m.group(1)
+        if name not in params and name not in values:
+            return m.group(0)
+        param = params.get(name, {"type": "varchar", "default": None})
+        return sql_literal(values[name] if name in values else param["default"], param["type"])
+
+    # comment lines hold ':' too (e.g. "-- note: ...") => only bind outside '--' comments
+    lines = []
+    for line in sql.splitlines(keepends=True):
+        code, sep, comment = line.partition("--")
+        lines.append(PARAM_REF_RX.sub(literal, code) + sep + comment)
+    return "".join(lines)
+
+def parameterize_template(sql, params=None):
+    """
+    (sql, names) with every declared :name replaced by a typed positional
+    parameter, CAST($n AS type), for PREPARE; names[n - 1] is the parameter
+    of $n, each bound once however often the template repeats it.
+    """
+    params = params if params is not None else parse_params(sql)
+    names = []
+
+    def placeholder(m):
+        name = m.group(1)
+        if name not in params:
+            return m.group(0)
+        if name not in names:
+            names.append(name)
+        return f"CAST(${names.index(name) + 1} AS {PARAM_TYPES.get(params[name]['type'], 'VARCHAR')})"
+
+    lines = []
+    for line in sql.splitlines(keepends=True):
+        code, sep, comment = line.partition("--")
+        lines.append(PARAM_REF_RX.sub(placeholder, code) + sep + comment)
+    return "".join(lines), names
+
+def rewrite_generate_series(sql):
+    out, pos = [], 0
+    for m in SERIES_RX.finditer(sql):
+        if m.start() < pos:
+            continue
+        end = matching_paren(sql, m.end() - 1) + 1
+        call = sql[m.end() - 1 - len("generate_series"):end]
+        if m.group(1).upper() == "SELECT":
+            out.append(sql[pos:m.start()] + f"{m.group(1)}{m.group(2)}unnest({call})")
+        else:
+            alias = ALIAS_RX.match(sql, end)
+            out.append(sql[pos:m.start()] + f"{m.group(1)}{m.group(2)}{call}")
+            if alias:
+                out.append(f"{alias.group(0)}({alias.group(1)})")
+                end = alias.end()
+        pos = end
+    out.append(sql[pos:])
+    return "".join(out)
+
+def to_duckdb(sql):
+    """The Postgres spellings DuckDB reads differently, rewritten."""
+    sql = rewrite_generate_series(sql)
+    for rx, replacement in DUCKDB_REWRITES:
+        sql = rx.sub(replacement, sql)
+    return sql.rstrip().rstrip(";")
+
+def column_array(values):
+    """
+    (numpy array, null mask) of one column for DuckDB: int64 / float64 when
+    every value is numeric, else text. DuckDB reads NumPy arrays without
+    pandas, but not object arrays, hence the separate mask for NULLs.
+    """
+    kinds = {type(v) for v in values if v is not None}
+    nulls = np.array([v is None for v in values], dtype=bool)
+    if kinds == {int}:
+        return np.array([0 if v is None else v for v in values], dtype=np.int64), nulls
+    if kinds and kinds <= {int, float}:
+        return np.array([0.0 if v is None else v for v in values], dtype=np.float64), nulls
+    return np.array(["" if v is None else str(v) for v in values], dtype=str), nulls
+
+def load_sqlite_database(sqlite_path, duck, schema="vdf", skip_prefixes=("sqlite_", "_")):
+    """
+    Copies every table of a SQLite database into DuckDB schema 'schema'. Returns the table names.
+    The database is opened as a read-only snapshot (db_snapshot.open_snapshot).
+    """
+    src = open_snapshot(sqlite_path)
+    duck.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+    tables = [name for (name,) in src.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")
+              if not name.startswith(skip_prefixes)]
+    for table in tables:
+        cur = src.execute(f'SELECT * FROM "{table}"')
+        columns = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+        data, select = {}, []
+        for i, col in enumerate(columns):
+            data[f"c{i}"], data[f"n{i}"] = column_array([row[i] for row in rows])
+            col_name = col.replace('"', '""')
+            select.append(f'CASE WHEN n{i} THEN NULL ELSE c{i} END AS "{col_name}"')
+        duck.register("_sqlite_rows", data)
+        duck.execute(f'CREATE OR REPLACE TABLE "{schema}"."{table}" AS SELECT {", ".join(select)} FROM _sqlite_rows')
+        duck.unregister("_sqlite_rows")
+    src.close()
+    return tables
+
+def prepare_duckdb(duck):
+    """Macros plus an empty environment.secrets (no user blacklists)."""
+    for macro in DUCKDB_MACROS:
+        duck.execute(macro)
+    duck.execute("CREATE SCHEMA IF NOT EXISTS environment")
+    duck.execute("CREATE TABLE IF NOT EXISTS environment.secrets (name VARCHAR, secret VARCHAR)")
+
+def blacklisted(duck, kind, userid):
+    """True if 'userid' is in the user-blacklist-<kind> secret."""
+    if userid is None:
+        return False
+    row = duck.execute("SELECT count(*) FROM environment.secrets, unnest(string_split(secret, ',')) t(id) "
+                       "WHERE name = ? AND id = ?", [f"user-blacklist-{kind}", str(userid)]).fetchone()
+    return row[0] > 0
+
+def resolve_blacklists(duck, sql, userid=None):
+    return BLACKLIST_GUARD_RX.sub(lambda m: "false" if blacklisted(duck, m.group(1), userid) else "true", sql)
+
+def matching_paren(sql, open_at):
+    """Index of the ')' closing the '(' at 'open_at', skipping strings and comments."""
+    depth, i = 0, open_at
+    while i < len(sql):
+        c = sql[i]
+        if c == "'":
+            i = sql.index("'", i + 1)
+        elif sql.startswith("--", i):
+            i = sql.find("\n", i)
+            if i < 0:
+                break
+        elif sql.startswith("/*", i):
+            i = sql.index("*/", i) + 1
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ValueError("unbalanced parentheses")
+
+def cte_span(sql, cte_name):
+    """(start, end) of the body of one of the template's CTEs: sql[start:end] is between its parentheses."""
+    m = re.search(rf"(?<![\w.]){re.escape(cte_name)}\s+AS\s*\(", sql, re.IGNORECASE)
+    if not m:
+        raise ValueError(f"no CTE '{cte_name}'")
+    return m.end(), matching_paren(sql, m.end() - 1)
+
+def cte_query(sql, cte_name):
+    """
+    The template cut after one of its CTEs, selecting that CTE's rows, e.g. to
+    compare a stage of vf/sites/combined.sql whose later stages DuckDB can't run.
+    """
+    _start, end = cte_span(sql, cte_name)
+    return f"{sql[:end + 1]}\nSELECT * FROM {cte_name}"
+
+def replace_cte(sql, cte_name, body):
+    """The template with the body of one of its CTEs replaced."""
+    start, end = cte_span(sql, cte_name)
+    return f"{sql[:start]}\n{body}\n{sql[end:]}"
+
+def run_template(duck, sql, values=None):
+    """(column names, rows) of one endpoint template run with the given parameter values."""
+    values = values or {}
+    sql = resolve_blacklists(duck, sql, values.get("userid"))
+    cur = duck.execute(to_duckdb(bind_template(sql, values)))
+    return [d[0] for d in cur.description], cur.fetchall()
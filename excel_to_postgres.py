@@ -1,13 +1,17 @@
-import openpyxl
 import json
 import sys
 import re
 import os
 import hashlib
+import gzip
+from contextlib import contextmanager
 from datetime import datetime
-from openpyxl.worksheet.worksheet import Worksheet
+from itertools import chain, islice
+
+from sheet_reader import iter_sheet_region, open_workbook
 
 MAX_IDENTIFIER_LENGTH = 63  # Postgres limit for identifiers
+DEFAULT_INSERT_BATCH_ROWS = 1000  # rows per statement in --format multi-insert
 
 def finalize_column_name(raw_name, used_names):
     """
@@ -88,29 +92,6 @@ def letters_to_index(col_letters):
         result = result * 26 + (ord(c) - ord('A') + 1)
     return result - 1
 
-def unmerge_worksheet(ws: Worksheet):
-    """
-    For every merged cell range, copy the top-left cell’s value into all cells 
-    within that range, then unmerge it so each cell can be read or written 
-    individually without triggering the read-only 'MergedCell' error.
-    """
-    merged_ranges = list(ws.merged_cells.ranges)  # snapshot of ranges
-    for merged_range in merged_ranges:
-        # merged_range.bounds -> (min_col, min_row, max_col, max_row)
-        min_col, min_row, max_col, max_row = merged_range.bounds
-
-        # The top-left cell is (min_row, min_col) in openpyxl's row-col format
-        top_left_value = ws.cell(row=min_row, column=min_col).value
-
-        # First unmerge the cells in this range
-        ws.unmerge_cells(str(merged_range))
-
-        # Now fill every cell in that former merged region with the top-left value
-        for r in range(min_row, max_row + 1):
-            for c in range(min_col, max_col + 1):
-                ws.cell(row=r, column=c).value = top_left_value
-
-
 def generate_ddl(table_name, column_names, approach='stringAll'):
     """
     Create a CREATE TABLE statement for Postgres.
@@ -175,167 +156,161 @@ def convert_value(raw_val, approach):
         esc = text_val.replace("'", "''")
         return f"'{esc}'"
 
-def read_excel_content(excel_file, config, extra_col_name=None, extra_col_value=None):
+@contextmanager
+def region_reader(excel_file, config):
     """
-    Loads the Excel file, unmerges (filling each cell),
-    reads the specified sheet, identifies headers, and returns:
-      (headerList, dataRows, colSamples)
-
-    The "region" from config (if any) bounds the reading.
-    'headerRows' is how many rows define the column names.
-    We combine them to produce a single name per column.
-    This version uses name-based alignment for subsequent merges:
-
-    - We'll produce a dictionary: finalColName -> columnIndex
-      for the CURRENT file, then return data as a list of dicts
-      so that missing columns can be recognized later.
-
-    If extra_col_name/extra_col_value is set, every data dict will
-    include { extra_col_name: extra_col_value }.
+    Opens the workbook and yields an iterator over the configured sheet region
+    (see sheet_reader.iter_sheet_region: rows are parsed as they are taken),
+    or None if the sheet is missing. The workbook is closed on exit.
+
+    'readMode' selects the loader: 'streaming' (default, read-only + early stop)
+    or 'full' (legacy edit-mode load, kept as a fallback for workbooks the
+    read-only parser can't size). 'logMergedRanges' prints one line per
+    merged range while resolving.
     """
-    wb = openpyxl.load_workbook(excel_file, data_only=True)
     ws_name = config.get("sheetName", "Sheet1")
-    if ws_name not in wb.sheetnames:
-        # Return None to signal "skip this file"
-        print(f"Warning: File '{excel_file}' has no sheet '{ws_name}'; skipping.")
-        return None, None, None
-
-    ws = wb[ws_name]
-
-    # unmerge all cells so each has correct value
-    unmerge_worksheet(ws)
+    wb = open_workbook(excel_file, config.get("readMode", "streaming"))
+    try:
+        if ws_name not in wb.sheetnames:
+            yield None
+        else:
+            yield iter_sheet_region(wb[ws_name], parse_region(config.get("region")),
+                                    config.get("logMergedRanges", False))
+    finally:
+        wb.close()
 
-    region_tuple = parse_region(config.get("region"))
-    approach = config.get("typeApproach", "stringAll")
-    header_rows = config.get("headerRows", 1)
-    header_joiner = config.get("headerJoiner", " - ")
+def split_header(rows, header_rows, header_joiner):
+    """
+    Takes the top 'headerRows' rows off a region's row iterator and combines
+    them into one name per column, deduplicated/truncated => final col names
+    for one file. Returns (names, data row iterator), or None when the region
+    has fewer rows than that.
+    """
+    header_part = list(islice(rows, header_rows))
+    if len(header_part) < header_rows:
+        return None
+    first = next(rows, None)
+    width_row = header_part[0] if header_part else first
+    if width_row is None:
+        return None
 
-    # figure out row/col bounds
-    # We'll read the entire region, but interpret columns by header text
-    if region_tuple:
-        sc, sr, ec, er = region_tuple
-    else:
-        sc = ws.min_column - 1
-        sr = ws.min_row - 1
-        ec = ws.max_column - 1
-        er = ws.max_row - 1
-
-    # read all rows in that region
-    all_rows = []
-    for row_idx in range(sr, er + 1):
-        row_cells = []
-        for col_idx in range(sc, ec + 1):
-            cell_val = ws.cell(row=row_idx + 1, column=col_idx + 1).value
-            row_cells.append(cell_val)
-        all_rows.append(row_cells)
-
-    if len(all_rows) < header_rows:
-        print(f"Warning: Not enough rows for 'headerRows' in file {excel_file}, skipping.")
-        return None, None, None
-
-    # Build combined header from the top 'headerRows'
-    num_cols = len(all_rows[0])
     header_labels = []
-    for col_i in range(num_cols):
+    for col_i in range(len(width_row)):
         parts = []
-        for hr_i in range(header_rows):
-            val = all_rows[hr_i][col_i]
+        for hr_i, header_row in enumerate(header_part):
+            val = header_row[col_i]
             if val is None or str(val).strip() == "":
                 val = f"col{hr_i+1}_c{col_i+1}"
             else:
                 val = str(val).strip()
             parts.append(val)
-        combined_name = header_joiner.join(parts)
-        header_labels.append(combined_name)
+        header_labels.append(header_joiner.join(parts))
 
-    # Deduplicate/truncate them => produce final col names for THIS file
     used = set()
-    final_header_for_file = []
-    for raw_col_name in header_labels:
-        safe_name = finalize_column_name(raw_col_name, used)
-        final_header_for_file.append(safe_name)
-
-    # Data rows => skip the 'headerRows'
-    data_part = all_rows[header_rows:]
-
-    # Convert data_part to a list of dictionaries: {colName: cellValue}
-    # (by position for this single file)
-    all_dicts = []
-    for row in data_part:
-        row_dict = {}
-        for c_idx, raw_val in enumerate(row):
-            col_name = final_header_for_file[c_idx]
-            row_dict[col_name] = raw_val
-        # If extra col was requested, add it
-        if extra_col_name:
-            if extra_col_name not in final_header_for_file:
-                final_header_for_file.append(extra_col_name)
-            row_dict[extra_col_name] = extra_col_value
-        all_dicts.append(row_dict)
-
-    # For auto approach => find sample for each column in this file
-    col_samples = {}
-    if approach == "auto":
-        for row_dict in all_dicts:
-            for col_name, val in row_dict.items():
-                if col_name not in col_samples and val is not None:
-                    col_samples[col_name] = val
+    names = [finalize_column_name(raw_col_name, used) for raw_col_name in header_labels]
+    return names, (chain([first], rows) if first is not None else iter(()))
 
-    return final_header_for_file, all_dicts, col_samples
+def iter_excel_rows(excel_file, config, extra_col_name=None, extra_col_value=None):
+    """
+    Reads one file as the rows are consumed - nothing is collected. The first
+    item yielded is final_header_for_file (None, and nothing after it, when
+    the file is skipped: no such sheet / not enough rows for 'headerRows'),
+    then one {colName: cellValue} dict per data row.
 
-def single_excel_to_sql_inserts(excel_file, config):
+    The header gets extra_col_name appended when the file has data rows (every
+    row then carries { extra_col_name: extra_col_value }).
     """
-    Processes a single Excel file -> returns (ddl, [insert statements]).
-    The script uses name-based reading but there's only 1 file, so there's
-    no "merging of columns" from multiple sources.
+    with region_reader(excel_file, config) as rows:
+        if rows is None:
+            print(f"Warning: File '{excel_file}' has no sheet '{config.get('sheetName', 'Sheet1')}'; skipping.")
+            yield None
+            return
+        split = split_header(rows, config.get("headerRows", 1), config.get("headerJoiner", " - "))
+        if split is None:
+            print(f"Warning: Not enough rows for 'headerRows' in file {excel_file}, skipping.")
+            yield None
+            return
+        sheet_columns, data = split
+        first = next(data, None)
+        if first is None:
+            yield list(sheet_columns)
+            return
+        extra = [extra_col_name] if extra_col_name and extra_col_name not in sheet_columns else []
+        yield sheet_columns + extra
+
+        for row in chain([first], data):
+            row_dict = dict(zip(sheet_columns, row))
+            if extra_col_name:
+                row_dict[extra_col_name] = extra_col_value
+            yield row_dict
+
+def read_excel_header(excel_file, config, extra_col_name=None, extra_col_value=None, col_samples=None):
+    """
+    Header pass over one file => final_header_for_file, or None to skip it
+    (see iter_excel_rows). With a col_samples dict ('typeApproach': 'auto'),
+    the first non-null value of each column not in it yet is added; rows are
+    only read until every column of this file has a sample.
+    """
+    rows = iter_excel_rows(excel_file, config, extra_col_name, extra_col_value)
+    try:
+        final_header_for_file = next(rows)
+        if col_samples is not None and final_header_for_file is not None:
+            wanted = [c for c in final_header_for_file if c not in col_samples]
+            for row_dict in rows:
+                if not wanted:
+                    break
+                for col_name in [c for c in wanted if row_dict[c] is not None]:
+                    col_samples[col_name] = row_dict[col_name]
+                    wanted.remove(col_name)
+    finally:
+        rows.close()
+    return final_header_for_file
+
+def columns_with_samples(column_order, col_samples, approach):
+    """[(colName, sampleVal)] in column order; the samples only matter for 'auto'."""
+    return [(col_name, col_samples.get(col_name) if approach == "auto" else None)
+            for col_name in column_order]
+
+def single_excel_to_rows(excel_file, config):
+    """
+    Processes a single Excel file -> returns (ddl, columns_info, row_dicts).
+    row_dicts is a generator that keeps reading the file as it is consumed, so
+    memory doesn't grow with the row count. The header comes off the same
+    read; only 'typeApproach': 'auto' needs a first pass for the column samples.
+    columns_info is [] when the file was skipped (ddl is then a comment).
     """
     approach = config.get("typeApproach", "stringAll")
     table_name = config["tableName"]
 
-    final_header_for_file, all_dicts, col_samples_dict = read_excel_content(excel_file, config)
+    skipped = f"-- Skipped file {excel_file}, no sheet or not enough rows.\n", [], []
+    col_samples = {}
+    if approach == "auto" and read_excel_header(excel_file, config, col_samples=col_samples) is None:
+        return skipped
+    row_dicts = iter_excel_rows(excel_file, config)
+    final_header_for_file = next(row_dicts)
     if final_header_for_file is None:
         # means "skip" => just return empty
-        return f"-- Skipped file {excel_file}, no sheet or not enough rows.\n", []
-
-    # If approach == auto => pick sample from col_samples_dict
-    # We'll produce columns_info in the order of final_header_for_file
-    if col_samples_dict is None:
-        col_samples_dict = {}
-
-    columns_info = []
-    for col_name in final_header_for_file:
-        sample_val = col_samples_dict.get(col_name, None) if approach == "auto" else None
-        columns_info.append((col_name, sample_val))
+        return skipped
 
+    columns_info = columns_with_samples(final_header_for_file, col_samples, approach)
     ddl = generate_ddl(table_name, columns_info, approach)
+    return ddl, columns_info, row_dicts
 
-    # build insert statements
-    insert_statements = []
-    for row_dict in all_dicts:
-        col_list = []
-        val_list = []
-        for col_name, sample_val in columns_info:
-            raw_val = row_dict.get(col_name)
-            val_str = convert_value(raw_val, approach)
-            col_list.append(f'"{col_name}"')
-            val_list.append(val_str)
-        ins_sql = f'INSERT INTO "{table_name}" ({", ".join(col_list)}) VALUES ({", ".join(val_list)});'
-        insert_statements.append(ins_sql)
-
-    return ddl, insert_statements
+def single_excel_to_sql_inserts(excel_file, config):
+    """
+    Processes a single Excel file -> returns (ddl, [insert statements]).
+    """
+    ddl, columns_info, row_dicts = single_excel_to_rows(excel_file, config)
+    return ddl, list(insert_statements(config, columns_info, row_dicts))
 
-def multi_excel_to_sql_inserts(config):
+def directory_files(config):
     """
-    Scans a directory for Excel files, merges them into one table.
-    Variation: If a file has no 'sheetName', skip it.
-               If columns are missing, fill with NULL.
-               If columns are extra, ignore them.
+    [(full_path, filename column value or None)] of the .xlsx files of
+    config['directory'] matching 'filenamePattern' (all of them without one).
     """
     directory = config["directory"]
     pattern = config.get("filenamePattern")
     filename_col = config.get("filenameColumnName")
-    approach = config.get("typeApproach", "stringAll")
-    table_name = config["tableName"]
 
     if not os.path.isdir(directory):
         raise ValueError(f"Directory '{directory}' not found or not a directory.")
@@ -353,131 +328,195 @@ def multi_excel_to_sql_inserts(config):
             continue
         if rx:
             match = rx.match(fname)
-            if match:
-                all_files.append((full_path, match))
+            if not match:
+                continue
         else:
             # no pattern => accept all .xlsx
-            all_files.append((full_path, None))
-
-    if not all_files:
-        raise ValueError(f"No Excel files matched in directory '{directory}' with pattern '{pattern}'.")
-
-    # We'll parse each file => produce:
-    #   (header_for_file, [dictRows], colSamples)
-    # Then unify the column sets and produce final DDL + inserts.
-    master_col_samples = {}  # colName => sampleVal
-    file_data = []           # each entry => list of rowDict
-    all_colnames_seen = set()  # to unify columns across files
-
-    # We'll define a "master order" of columns from the FIRST file that yields data
-    master_column_order = []  # we will union further columns as we go
-
-    first_data_file_used = False
+            match = None
 
-    for full_path, fmatch in all_files:
         # Extract the capturing group if any
         extra_val = None
         if filename_col:
-            if fmatch and fmatch.lastindex == 1:
-                extra_val = fmatch.group(1)
+            if match and match.lastindex == 1:
+                extra_val = match.group(1)
             else:
                 # fallback => entire filename
                 extra_val = os.path.basename(full_path)
+        all_files.append((full_path, extra_val))
 
-        header_for_file, dict_rows, col_samples_dict = read_excel_content(
-            full_path,
-            config,
-            extra_col_name=filename_col,
-            extra_col_value=extra_val
-        )
-        print(dict_rows)
-        if header_for_file is None or dict_rows is None:
+    if not all_files:
+        raise ValueError(f"No Excel files matched in directory '{directory}' with pattern '{pattern}'.")
+    return all_files
+
+def multi_excel_to_rows(config):
+    """
+    Scans a directory for Excel files, merges them into one table.
+    Returns (ddl, columns_info, row_dicts).
+    Variation: If a file has no 'sheetName', skip it.
+               If columns are missing, fill with NULL.
+               If columns are extra, ignore them.
+
+    A header pass over every file unifies the column sets (and, for 'auto',
+    finds the column samples) for the DDL; row_dicts is a generator that then
+    reads the files one by one as it is consumed, so no file's rows are kept.
+    """
+    filename_col = config.get("filenameColumnName")
+    approach = config.get("typeApproach", "stringAll")
+    table_name = config["tableName"]
+
+    # We'll define a "master order" of columns from the FIRST file that yields data
+    # and union further columns as we go
+    master_column_order = []
+    all_colnames_seen = set()
+    master_col_samples = {}  # colName => sampleVal
+    data_files = []          # (full_path, extra_val) of the files not skipped
+
+    for full_path, extra_val in directory_files(config):
+        header_for_file = read_excel_header(full_path, config, filename_col, extra_val,
+                                            master_col_samples if approach == "auto" else None)
+        if header_for_file is None:
             # means skip
             continue
-
-        # Now unify columns
-        # If it's the first data-producing file, define the initial master_column_order
-        if not first_data_file_used:
-            master_column_order = header_for_file[:]  # copy
-            for c in master_column_order:
+        for c in header_for_file:
+            if c not in all_colnames_seen:
+                master_column_order.append(c)
                 all_colnames_seen.add(c)
-            first_data_file_used = True
-        else:
-            # Add any new columns from this file that are not in master_column_order
-            for c in header_for_file:
-                if c not in all_colnames_seen:
-                    master_column_order.append(c)
-                    all_colnames_seen.add(c)
-
-        # Merge col_samples
-        if approach == "auto" and col_samples_dict:
-            for c_name, c_val in col_samples_dict.items():
-                if c_name not in master_col_samples and c_val is not None:
-                    master_col_samples[c_name] = c_val
-                    print(c_name+":"+c_val)
-
-        file_data.append(dict_rows)
-
-    if not first_data_file_used:
-        return f"-- No valid Excel data found in directory '{directory}'", []
-
-    # Now we have a union of all columns in master_column_order.
-    # We produce final columns_info => (colName, sampleVal)
-    columns_info = []
-    for col_name in master_column_order:
-        if approach == "auto":
-            sample_val = master_col_samples.get(col_name, None)
-        else:
-            sample_val = None
-        columns_info.append((col_name, sample_val))
+        data_files.append((full_path, extra_val))
+
+    if not data_files:
+        return f"-- No valid Excel data found in directory '{config['directory']}'", [], []
 
+    columns_info = columns_with_samples(master_column_order, master_col_samples, approach)
     ddl = generate_ddl(table_name, columns_info, approach)
 
-    # Build inserts from file_data
-    insert_statements = []
-    # Flatten file_data => array of arrays of dicts
-    for dict_rows in file_data:
-        for row_dict in dict_rows:
-            col_list = []
-            val_list = []
-            for (col_name, _) in columns_info:
-                raw_val = row_dict.get(col_name, None)  # Missing => None
-                val_str = convert_value(raw_val, approach)
-                col_list.append(f'"{col_name}"')
-                val_list.append(val_str)
-            ins_sql = f'INSERT INTO "{table_name}" ({", ".join(col_list)}) VALUES ({", ".join(val_list)});'
-            insert_statements.append(ins_sql)
-
-    return ddl, insert_statements
+    row_dicts = (row_dict for full_path, extra_val in data_files
+                 for row_dict in islice(iter_excel_rows(full_path, config, filename_col, extra_val), 1, None))
+    return ddl, columns_info, row_dicts
+
+def multi_excel_to_sql_inserts(config):
+    """
+    Directory version of single_excel_to_sql_inserts -> (ddl, [insert statements]).
+    """
+    ddl, columns_info, row_dicts = multi_excel_to_rows(config)
+    return ddl, list(insert_statements(config, columns_info, row_dicts))
+
+def insert_statements(config, columns_info, row_dicts):
+    """
+    One 'INSERT INTO ... VALUES (...);' string per row (generator).
+    """
+    approach = config.get("typeApproach", "stringAll")
+    table_name = config["tableName"]
+    col_list_str = ", ".join(f'"{col_name}"' for col_name, _ in columns_info)
+    for row_dict in row_dicts:
+        val_list = [convert_value(row_dict.get(col_name), approach) for col_name, _ in columns_info]
+        yield f'INSERT INTO "{table_name}" ({col_list_str}) VALUES ({", ".join(val_list)});'
+
+def multirow_insert_statements(config, columns_info, row_dicts, batch_rows=DEFAULT_INSERT_BATCH_ROWS):
+    """
+    'INSERT INTO ... VALUES (...),(...),...;' with up to batch_rows rows per
+    statement (generator), for targets that can't take COPY.
+    """
+    approach = config.get("typeApproach", "stringAll")
+    table_name = config["tableName"]
+    col_list_str = ", ".join(f'"{col_name}"' for col_name, _ in columns_info)
+    row_dicts = iter(row_dicts)
+    while True:
+        batch = list(islice(row_dicts, batch_rows))
+        if not batch:
+            break
+        values = ",\n".join(
+            "(" + ", ".join(convert_value(row_dict.get(col_name), approach) for col_name, _ in columns_info) + ")"
+            for row_dict in batch
+        )
+        yield f'INSERT INTO "{table_name}" ({col_list_str}) VALUES\n{values};'
+
+# COPY text format: backslash, tab, newline and CR must be escaped; NULL is \N
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+def copy_value(raw_val):
+    if raw_val is None:
+        return "\\N"
+    return str(raw_val).translate(COPY_ESCAPES)
+
+def copy_block(config, columns_info, row_dicts):
+    """
+    'COPY table (cols) FROM stdin;' + one tab-separated line per row + '\\.'
+    (generator of lines, without trailing newlines). psql runs it from a script.
+    """
+    table_name = config["tableName"]
+    col_names = [col_name for col_name, _ in columns_info]
+    col_list_str = ", ".join(f'"{c}"' for c in col_names)
+    yield f'COPY "{table_name}" ({col_list_str}) FROM stdin;'
+    for row_dict in row_dicts:
+        yield "\t".join([copy_value(row_dict.get(c)) for c in col_names])
+    yield "\\."
+
+OUTPUT_FORMATS = ("insert", "multi-insert", "copy")
+
+def write_sql(out, ddl, config, columns_info, row_dicts, output_format="insert",
+              batch_rows=DEFAULT_INSERT_BATCH_ROWS):
+    """
+    Streams the DDL and the rows to 'out' (a text file object) in the chosen
+    format, one statement/line at a time - nothing is collected in memory.
+    """
+    out.write(ddl)
+    if not columns_info:
+        return
+    if output_format == "copy":
+        lines = copy_block(config, columns_info, row_dicts)
+    elif output_format == "multi-insert":
+        lines = multirow_insert_statements(config, columns_info, row_dicts, batch_rows)
+    else:
+        lines = insert_statements(config, columns_info, row_dicts)
+    for line in lines:
+        out.write("\n")
+        out.write(line)
+    out.write("\n")
+
+def open_output(output_sql):
+    """Text file for the SQL script; gzip-compressed when the name ends in .gz."""
+    if output_sql.endswith(".gz"):
+        return gzip.open(output_sql, "wt", encoding="utf-8", newline="\n")
+    return open(output_sql, "w", encoding="utf-8", newline="\n")
 
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: python excel_to_postgres.py <excel_file> <config_file> [output_sql]")
+    args = sys.argv[1:]
+    output_format = "insert"
+    batch_rows = DEFAULT_INSERT_BATCH_ROWS
+    if "--format" in args:
+        i = args.index("--format")
+        output_format = args[i + 1]
+        del args[i:i + 2]
+    if "--batch-rows" in args:
+        i = args.index("--batch-rows")
+        batch_rows = int(args[i + 1])
+        del args[i:i + 2]
+
+    if len(args) < 2 or output_format not in OUTPUT_FORMATS:
+        print("Usage: python excel_to_postgres.py <excel_file> <config_file> [output_sql[.gz]]"
+              " [--format insert|multi-insert|copy] [--batch-rows N]")
         print("Note: <excel_file> can be ignored if config['directory'] is used.")
         sys.exit(1)
 
-    excel_file = sys.argv[1]
-    config_file = sys.argv[2]
-    output_sql = sys.argv[3] if len(sys.argv) > 3 else None
+    excel_file = args[0]
+    config_file = args[1]
+    output_sql = args[2] if len(args) > 2 else None
 
     config = load_config(config_file)
-    table_name = config["tableName"]
 
     # Decide single-file or multi-file
     if "directory" in config:
-        ddl, inserts = multi_excel_to_sql_inserts(config)
+        ddl, columns_info, row_dicts = multi_excel_to_rows(config)
     else:
         # single-file usage
-        ddl, inserts = single_excel_to_sql_inserts(excel_file, config)
-
-    all_sql = [ddl] + inserts
+        ddl, columns_info, row_dicts = single_excel_to_rows(excel_file, config)
 
     if output_sql:
-        with open(output_sql, "w", encoding="utf-8") as f:
-            f.write("\n".join(all_sql))
+        with open_output(output_sql) as f:
+            write_sql(f, ddl, config, columns_info, row_dicts, output_format, batch_rows)
         print(f"SQL script saved to {output_sql}")
     else:
-        print("\n".join(all_sql))
+        write_sql(sys.stdout, ddl, config, columns_info, row_dicts, output_format, batch_rows)
 
 if __name__ == "__main__":
     main()
@@ -1,13 +1,20 @@
-import openpyxl
 import json
 import sys
 import re
 import os
 import hashlib
 import sqlite3
-from datetime import datetime
-from openpyxl.worksheet.worksheet import Worksheet
-from openpyxl.cell.cell import MergedCell
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
+from datetime import datetime, date
+
+from build_stats import stage
+from sheet_cache import SHEET_GRID, SHEET_MISSING, SHEET_SEEN, SheetGrid, sheet_cache_from_config
+from sheet_reader import open_workbook, read_sheet_region, read_sheet_regions, sheet_bounds
 
 
 MAX_IDENTIFIER_LENGTH = 63  # This was for Postgres, but we'll still use it for safe column naming in SQLite
@@ -93,72 +100,6 @@ def letters_to_index(col_letters):
         result = result * 26 + (ord(c) - ord('A') + 1)
     return result - 1
 
-from openpyxl.utils import range_boundaries
-from openpyxl.cell.cell import MergedCell
-from openpyxl.worksheet.worksheet import Worksheet
-
-def unmerge_worksheet(ws: Worksheet):
-    """
-    For every merged cell range, parse the range string via range_boundaries()
-    to get consistent numeric row/col indices, unmerge it, and fill all cells
-    with the top-left value. Logs debug info and raises on error.
-    """
-    # Snapshot of merged ranges to avoid modifying while iterating
-    merged_ranges = list(ws.merged_cells.ranges)
-
-    for merged_range in merged_ranges:
-        range_str = merged_range.coord  # e.g. 'P17:P19' from openpyxl
-
-        print(f"\nProcessing merged range '{range_str}'")
-
-        # Instead of merged_range.bounds, parse the range string:
-        min_colA1, min_rowA1, max_colA1, max_rowA1 = range_boundaries(range_str)
-        print(f"  => range_boundaries gave: cols=({min_colA1}..{max_colA1}), rows=({min_rowA1}..{max_rowA1})")
-
-        # If needed, swap to ensure min <= max
-        if min_colA1 > max_colA1:
-            min_colA1, max_colA1 = max_colA1, min_colA1
-        if min_rowA1 > max_rowA1:
-            min_rowA1, max_rowA1 = max_rowA1, min_rowA1
-
-        # Now reorder them into the normal openpyxl "row, col" approach
-        min_row, min_col, max_row, max_col = min_rowA1, min_colA1, max_rowA1, max_colA1
-        print(f"  => Interpreted as (min_row={min_row}, min_col={min_col}, max_row={max_row}, max_col={max_col})")
-
-        # Grab the top-left cell's value
-        top_left_cell = ws.cell(row=min_row, column=min_col)
-        try:
-            top_left_value = top_left_cell.value
-            print(f"  => top-left cell {top_left_cell.coordinate} has value {top_left_value!r}")
-        except Exception as e:
-            print(f"** Error reading cell {top_left_cell.coordinate}: {e}")
-            continue
-
-        # Unmerge using the original coordinate string
-        try:
-            ws.unmerge_cells(range_str)
-        except Exception as e:
-            print(f"** Error unmerging '{range_str}': {e}")
-            continue
-
-        # Fill each formerly merged cell with top_left_value
-        for r in range(min_row, max_row + 1):
-            for c in range(min_col, max_col + 1):
-                cell_obj = ws.cell(row=r, column=c)
-                cell_coord = cell_obj.coordinate
-
-                if isinstance(cell_obj, MergedCell):
-                    print(f"** Warning: {cell_coord} is still MergedCell somehow?!")
-
-                try:
-                    cell_obj.value = top_left_value
-                except Exception as e:
-                    print(f"** Error writing value to {cell_coord}: {e}")
-                    raise
-
-
-
-
 #
 # For SQLite, let's define a simple type-guessing approach:
 #   If approach='stringAll' => always TEXT
@@ -210,49 +151,250 @@ def convert_sqlite_value(raw_val, approach):
         pass
     return text_val
 
+def _text_or_none(raw_val):
+    return None if raw_val is None else str(raw_val)
+
+def _auto_value(raw_val):
+    return convert_sqlite_value(raw_val, "auto")
+
+# typeApproach 'auto': values treated as NULL (compared stripped, case-insensitive)
+DEFAULT_NULL_TOKENS = ("", "#N/A", "N/A")
+
+# no leading zeros, so codes like '007' stay TEXT
+INT_TEXT_RX = re.compile(r"[+-]?(?:0|[1-9][0-9]*)\Z")
+REAL_TEXT_RX = re.compile(r"[+-]?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?\Z")
+
+def null_token_set(null_tokens):
+    return frozenset(t.strip().upper() for t in null_tokens)
+
+def classify_cell(raw_val, nulls):
+    """
+    Column type a single cell asks for: None (null / null token), 'BOOLEAN',
+    'INTEGER', 'REAL', 'DATE' or 'TEXT'. Numeric / TRUE-FALSE text counts as such.
+    """
+    if raw_val is None:
+        return None
+    val_type = type(raw_val)
+    if val_type is bool:
+        return "BOOLEAN"
+    if val_type is int:
+        return "INTEGER"
+    if val_type is float:
+        return "REAL"
+    if val_type is datetime or val_type is date:
+        return "DATE"
+    if val_type is str:
+        text = raw_val.strip()
+        upper = text.upper()
+        if upper in nulls:
+            return None
+        if INT_TEXT_RX.match(text):
+            return "INTEGER"
+        if REAL_TEXT_RX.match(text):
+            return "REAL"
+        if upper in ("TRUE", "FALSE"):
+            return "BOOLEAN"
+    return "TEXT"
+
+def merge_column_types(type_a, type_b):
+    """Smallest type holding both: None is 'no values yet', INTEGER+REAL => REAL, any other mix => TEXT."""
+    if type_a is None or type_a == type_b:
+        return type_b
+    if type_b is None:
+        return type_a
+    if {type_a, type_b} == {"INTEGER", "REAL"}:
+        return "REAL"
+    return "TEXT"
+
+def infer_column_types(columns, dict_rows, null_tokens=DEFAULT_NULL_TOKENS):
+    """
+    Looks at every value of every column (not just the first sample) and
+    returns {col_name: type}, type None for a column with nothing but nulls.
+    """
+    nulls = null_token_set(null_tokens)
+    types = {}
+    for col_name in columns:
+        # classify each distinct value once - columns repeat a lot; keyed with
+        # the type, as True == 1 == 1.0 would otherwise share one member
+        distinct = {(type(raw_val), raw_val) for raw_val in (row_dict.get(col_name) for row_dict in dict_rows)}
+        col_type = None
+        for kind in {classify_cell(raw_val, nulls) for _val_type, raw_val in distinct}:
+            col_type = merge_column_types(col_type, kind)
+        types[col_name] = col_type
+    return types
+
+def typed_converter(col_type, null_tokens=DEFAULT_NULL_TOKENS):
+    """
+    Converter for a column whose type came from infer_column_types: null tokens
+    become None, the rest is turned into the column's Python/SQLite type.
+    """
+    nulls = null_token_set(null_tokens)
+
+    def text_of(raw_val):
+        if isinstance(raw_val, (datetime, date)):
+            return raw_val.isoformat()
+        return str(raw_val)
+
+    def is_null(raw_val):
+        return raw_val is None or (type(raw_val) is str and raw_val.strip().upper() in nulls)
+
+    if col_type == "INTEGER":
+        def convert(raw_val):
+            return None if is_null(raw_val) else int(raw_val.strip() if type(raw_val) is str else raw_val)
+    elif col_type == "REAL":
+        def convert(raw_val):
+            return None if is_null(raw_val) else float(raw_val.strip() if type(raw_val) is str else raw_val)
+    elif col_type == "BOOLEAN":
+        def convert(raw_val):
+            if is_null(raw_val):
+                return None
+            if type(raw_val) is str:
+                return 1 if raw_val.strip().upper() == "TRUE" else 0
+            return int(raw_val)
+    else:  # DATE, TEXT
+        def convert(raw_val):
+            return None if is_null(raw_val) else text_of(raw_val)
+    # columns repeat a lot => convert each distinct value once (typed: 1, 1.0 and True stay apart)
+    return lru_cache(maxsize=1 << 16, typed=True)(convert)
+
+def compile_sqlite_converters(columns_info, approach, col_types=None, null_tokens=DEFAULT_NULL_TOKENS):
+    """
+    Resolves one converter function per column, once per table, so the insert
+    loop doesn't go through convert_sqlite_value's approach checks per cell.
+    With col_types (typeApproach 'auto', see infer_column_types) each column gets
+    the converter of its type; otherwise each converter gives the same result
+    as convert_sqlite_value(val, approach).
+    """
+    if col_types is not None:
+        return [typed_converter(t, null_tokens) for t in col_types]
+    converter = _text_or_none if approach == "stringAll" else _auto_value
+    return [converter for _ in columns_info]
+
+def read_regions(excel_file, sheet_regions, read_mode="streaming", verbose_merges=False, cache=None):
+    """
+    Reads several regions from one workbook, opening it at most once.
+    sheet_regions = {ws_name: [region_tuple, ...]}; returns {ws_name: [rows per region]},
+    or {ws_name: None} for a sheet the workbook doesn't have.
+    With a SheetCache (see sheet_cache.py), a region is served from its own
+    entry or sliced out of the sheet's cached whole-sheet grid, without
+    parsing. A region missed on a sheet that was read before reads and stores
+    the whole sheet once; otherwise only the missing regions are read (one
+    pass per sheet) and stored.
+    'streaming' opens the workbook read_only=True; 'full' is the legacy
+    edit-mode load, kept as a fallback for workbooks the read-only parser can't size.
+    """
+    results = {}
+    todo = OrderedDict()  # ws_name: (indexes of the regions to read, sheet entry state)
+    for ws_name, regions in sheet_regions.items():
+        results[ws_name] = [None] * len(regions)
+        missing = []
+        for i, region in enumerate(regions):
+            found, grid = cache.get(excel_file, ws_name, region) if cache is not None else (False, None)
+            if found:
+                results[ws_name][i] = grid.rows()
+            else:
+                missing.append(i)
+        state = None
+        if missing and cache is not None:
+            state, sheet_grid = cache.get_sheet(excel_file, ws_name)
+            if state == SHEET_MISSING:
+                results[ws_name] = None
+                continue
+            if sheet_grid is not None:
+                for i in missing:
+                    if sheet_grid.covers(regions[i]):
+                        results[ws_name][i] = sheet_grid.rows(regions[i])
+                missing = [i for i in missing if results[ws_name][i] is None]
+        if missing:
+            todo[ws_name] = (missing, state)
+    if not todo:
+        return results
+
+    with stage("workbook_load", read_mode=read_mode):
+        wb = open_workbook(excel_file, read_mode)
+    try:
+        for ws_name, (missing, state) in todo.items():
+            if ws_name not in wb.sheetnames:
+                results[ws_name] = None
+                if cache is not None:
+                    cache.put_sheet(excel_file, ws_name, SHEET_MISSING)
+                continue
+            ws = wb[ws_name]
+            if state == SHEET_SEEN:
+                sc, sr, _ec, _er = sheet_bounds(ws, None)
+                sheet_grid = SheetGrid.from_rows(read_sheet_region(ws, None, verbose_merges), sc, sr)
+                cache.put_sheet(excel_file, ws_name, SHEET_GRID, sheet_grid)
+                for i in missing:
+                    if sheet_grid.covers(sheet_regions[ws_name][i]):
+                        results[ws_name][i] = sheet_grid.rows(sheet_regions[ws_name][i])
+                missing = [i for i in missing if results[ws_name][i] is None]
+                if not missing:
+                    continue
+            regions = [sheet_regions[ws_name][i] for i in missing]
+            for i, region, rows in zip(missing, regions, read_sheet_regions(ws, regions, verbose_merges)):
+                results[ws_name][i] = rows
+                if cache is not None:
+                    sc, sr, _ec, _er = sheet_bounds(ws, region)
+                    cache.put(excel_file, ws_name, region, SheetGrid.from_rows(rows, sc, sr))
+            if cache is not None and state is None:
+                cache.put_sheet(excel_file, ws_name, SHEET_SEEN)
+    finally:
+        wb.close()
+    return results
+
+def read_region(excel_file, ws_name, region_tuple, read_mode="streaming", verbose_merges=False, cache=None):
+    """
+    Opens the workbook and reads one sheet region (see read_sheet_region / read_regions).
+    Returns None if the sheet is missing.
+    """
+    regions = read_regions(excel_file, {ws_name: [region_tuple]}, read_mode, verbose_merges, cache)[ws_name]
+    return None if regions is None else regions[0]
+
 def read_excel_content(excel_file, config, extra_col_name=None, extra_col_value=None):
     """
-    Loads the Excel file, unmerges, reads the specified sheet, identifies headers,
-    returns (final_header_for_file, all_dicts, col_samples).
+    Loads the Excel file, reads the specified sheet/region (resolving merged cells),
+    identifies headers, returns (final_header_for_file, all_dicts, col_samples).
+
+    'readMode' selects the loader: 'streaming' (default, read-only + early stop)
+    or 'full' (legacy edit-mode load). 'logMergedRanges' prints one line per
+    merged range while resolving. Parsed regions are kept in the sheet cache
+    (see sheet_cache.py) unless 'sheetCache' is false.
     """
-    wb = openpyxl.load_workbook(excel_file, data_only=True, keep_links=False)
     ws_name = config.get("sheetName", "Sheet1")
-    if ws_name not in wb.sheetnames:
+    region_tuple = parse_region(config.get("region"))
+    read_mode = config.get("readMode", "streaming")
+    verbose_merges = config.get("logMergedRanges", False)
+
+    all_rows = read_region(excel_file, ws_name, region_tuple, read_mode, verbose_merges,
+                           sheet_cache_from_config(config))
+
+    if all_rows is None:
         print(f"Warning: File '{excel_file}' has no sheet '{ws_name}'; skipping.")
         return None, None, None
 
-    ws = wb[ws_name]
+    return rows_to_content(all_rows, config, excel_file, extra_col_name, extra_col_value)
 
-    # unmerge all cells so each has correct value
-    unmerge_worksheet(ws)
-
-    region_tuple = parse_region(config.get("region"))
+def rows_to_content(all_rows, config, excel_file, extra_col_name=None, extra_col_value=None):
+    """
+    Turns the rows read from a region into (final_header_for_file, all_dicts, col_samples):
+    the top 'headerRows' build the column names, the rest become {colName: cellValue}.
+    """
     approach = config.get("typeApproach", "stringAll")
     header_rows = config.get("headerRows", 1)
     header_joiner = config.get("headerJoiner", " - ")
 
-    # figure out row/col bounds
-    if region_tuple:
-        sc, sr, ec, er = region_tuple
-    else:
-        sc = ws.min_column - 1
-        sr = ws.min_row - 1
-        ec = ws.max_column - 1
-        er = ws.max_row - 1
-
-    # read all rows in that region
-    all_rows = []
-    for row_idx in range(sr, er + 1):
-        row_cells = []
-        for col_idx in range(sc, ec + 1):
-            cell_val = ws.cell(row=row_idx + 1, column=col_idx + 1).value
-            row_cells.append(cell_val)
-        all_rows.append(row_cells)
-
     if len(all_rows) < header_rows:
         print(f"Warning: Not enough rows for 'headerRows' in file {excel_file}, skipping.")
         return None, None, None
 
+    with stage("build_header", rows_in=len(all_rows)) as s:
+        final_header_for_file, all_dicts, col_samples = build_content(
+            all_rows, header_rows, header_joiner, approach, extra_col_name, extra_col_value)
+        s["rows_out"] = len(all_dicts)
+    return final_header_for_file, all_dicts, col_samples
+
+def build_content(all_rows, header_rows, header_joiner, approach, extra_col_name=None, extra_col_value=None):
+    """rows_to_content once the rows are known to cover the header."""
     # Build combined header from the top 'headerRows'
     num_cols = len(all_rows[0])
     header_labels = []
@@ -302,86 +444,619 @@ def read_excel_content(excel_file, config, extra_col_name=None, extra_col_value=
 
     return final_header_for_file, all_dicts, col_samples
 
-def create_sqlite_table(conn, table_name, columns_info, drop_existing=True):
+def create_sqlite_table(conn, table_name, columns_info, drop_existing=True, col_types=None):
     """
     Creates a table in SQLite given the column names and a sample for type inference.
     columns_info is list of (col_name, sample_val).
+    col_types, if given, are the (already inferred) SQLite types, one per column.
     """
     if drop_existing:
         conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
 
     # Build CREATE TABLE statement with inferred SQLite types
     col_defs = []
-    for col_name, sample_val in columns_info:
-        col_type = guess_sqlite_type(sample_val)
+    for i, (col_name, sample_val) in enumerate(columns_info):
+        col_type = col_types[i] if col_types else guess_sqlite_type(sample_val)
         col_defs.append(f'"{col_name}" {col_type}')
 
     create_stmt = f'CREATE TABLE "{table_name}" (\n  {", ".join(col_defs)}\n)'
     conn.execute(create_stmt)
 
-def insert_into_sqlite(conn, table_name, columns_info, row_dicts, approach):
+DEFAULT_BATCH_SIZE = 5000
+
+# load-time settings used when a config says "loadPragmas": true
+DEFAULT_LOAD_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "cache_size": -65536,   # 64 MB
+    "temp_store": "MEMORY",
+}
+
+@contextmanager
+def load_pragmas(conn, pragmas):
+    """
+    Applies load-time PRAGMAs (journal_mode, synchronous, cache_size, temp_store, ...)
+    for the duration of the block and restores the previous values afterwards.
+    pragmas: dict, True for DEFAULT_LOAD_PRAGMAS, or None/False for no change.
+    """
+    if pragmas is True:
+        pragmas = DEFAULT_LOAD_PRAGMAS
+    if not pragmas:
+        yield
+        return
+
+    # journal_mode can't change inside a transaction
+    if conn.in_transaction:
+        conn.commit()
+    previous = {}
+    for name, value in pragmas.items():
+        previous[name] = conn.execute(f"PRAGMA {name}").fetchone()[0]
+        conn.execute(f"PRAGMA {name} = {value}")
+    try:
+        yield
+    finally:
+        if conn.in_transaction:
+            conn.commit()
+        for name, value in previous.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+
+@contextmanager
+def table_transaction(conn):
+    """
+    One explicit transaction around a table's DROP/CREATE/INSERTs:
+    committed at the end of the block, rolled back on error.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN")
+    try:
+        yield
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def insert_into_sqlite(conn, table_name, columns_info, row_dicts, approach, batch_size=DEFAULT_BATCH_SIZE,
+                       converters=None):
     """
-    Insert the given data (list of dicts) into the SQLite table.
+    Insert the given data (iterable of dicts) into the SQLite table.
     columns_info: list of (col_name, sample_val)
-    row_dicts: list of {col_name -> value}
+    row_dicts: iterable of {col_name -> value}
+    Rows are converted by per-column converters into tuples and sent with
+    executemany() in batches of 'batch_size'. Returns the number of rows inserted.
+    'converters' overrides compile_sqlite_converters(columns_info, approach).
     """
     col_names = [col for (col, _) in columns_info]
     placeholders = ", ".join(["?"] * len(col_names))
     col_list_str = ", ".join(f'"{cn}"' for cn in col_names)
     insert_sql = f'INSERT INTO "{table_name}" ({col_list_str}) VALUES ({placeholders})'
 
-    for row_dict in row_dicts:
-        row_values = []
-        for col_name, _sample in columns_info:
-            raw_val = row_dict.get(col_name)
-            val_for_sqlite = convert_sqlite_value(raw_val, approach)
-            row_values.append(val_for_sqlite)
-        conn.execute(insert_sql, row_values)
+    if converters is None:
+        converters = compile_sqlite_converters(columns_info, approach)
+    if len(set(converters)) == 1:
+        # same converter everywhere (e.g. stringAll) => plain map() per row
+        convert = converters[0]
+        row_tuples = (tuple(map(convert, map(row_dict.get, col_names))) for row_dict in row_dicts)
+    else:
+        row_tuples = (
+            tuple([convert(val) for convert, val in zip(converters, map(row_dict.get, col_names))])
+            for row_dict in row_dicts
+        )
+
+    inserted = 0
+    while True:
+        batch = list(islice(row_tuples, batch_size))
+        if not batch:
+            break
+        conn.executemany(insert_sql, batch)
+        inserted += len(batch)
+    return inserted
+
+def report_insert_rate(table_name, row_count, elapsed):
+    rate = row_count / elapsed if elapsed > 0 else float("inf")
+    print(f"-- Inserted {row_count} rows into '{table_name}' in {elapsed:.3f}s ({rate:,.0f} rows/s)")
 
-def single_excel_to_sqlite(excel_file, config, conn):
+def columns_from_contents(contents, approach):
     """
-    Processes a single Excel file -> create table in SQLite, do inserts.
+    Unifies the headers of one or more files' contents (header, dict_rows, col_samples)
+    into a single columns_info list: the first file's columns in order, then any
+    new column from later files appended as it's first seen.
     """
-    approach = config.get("typeApproach", "stringAll")
-    table_name = config["tableName"]
+    master_col_samples = {}
+    all_colnames_seen = set()
+    master_column_order = []
 
-    final_header_for_file, all_dicts, col_samples_dict = read_excel_content(excel_file, config)
-    if final_header_for_file is None:
-        print(f"-- Skipped file {excel_file}, no sheet or not enough rows.")
-        return
+    for header_for_file, _dict_rows, col_samples_dict in contents:
+        # unify columns
+        for c in header_for_file:
+            if c not in all_colnames_seen:
+                master_column_order.append(c)
+                all_colnames_seen.add(c)
 
-    if col_samples_dict is None:
-        col_samples_dict = {}
+        # gather sample values
+        if approach == "auto" and col_samples_dict:
+            for c_name, c_val in col_samples_dict.items():
+                if c_name not in master_col_samples and c_val is not None:
+                    master_col_samples[c_name] = c_val
 
-    # Build columns_info
+    # Build final columns_info
     columns_info = []
-    for col_name in final_header_for_file:
-        sample_val = col_samples_dict.get(col_name, None) if (approach == "auto") else None
+    for col_name in master_column_order:
+        if approach == "auto":
+            sample_val = master_col_samples.get(col_name, None)
+        else:
+            sample_val = None
         columns_info.append((col_name, sample_val))
+    return columns_info
 
-    # Create table & insert
-    create_sqlite_table(conn, table_name, columns_info, drop_existing=True)
-    insert_into_sqlite(conn, table_name, columns_info, all_dicts, approach)
+def content_column_types(content, config):
+    """Per-file {col: type} for typeApproach 'auto' (None for other approaches)."""
+    if config.get("typeApproach", "stringAll") != "auto" or not content:
+        return None
+    header, dict_rows, _samples = content
+    with stage("infer_types", rows_in=len(dict_rows)):
+        return infer_column_types(header, dict_rows, config.get("nullTokens", DEFAULT_NULL_TOKENS))
+
+def merged_column_types(columns, per_file_types):
+    """Table column types from the per-file ones; all-null columns become TEXT."""
+    col_types = []
+    for col_name in columns:
+        col_type = None
+        for file_types in per_file_types:
+            col_type = merge_column_types(col_type, file_types.get(col_name))
+        col_types.append(col_type or "TEXT")
+    return col_types
+
+DEFAULT_UNPIVOT_DATE_OUTPUT = "%Y-%m-%d"
+
+def unpivot_columns(config, columns):
+    """
+    (id_cols, folded) for config['unpivot']: folded = [(col_name, label)] for every
+    column matching 'columnPattern', in table order. The label is the column name
+    parsed with 'dateFormat' and written with 'dateOutputFormat' (or the name
+    itself without 'dateFormat'). id_cols are 'idColumns', else every other column.
+    """
+    spec = config["unpivot"]
+    pattern = re.compile(spec["columnPattern"])
+    date_format = spec.get("dateFormat")
+    output_format = spec.get("dateOutputFormat", DEFAULT_UNPIVOT_DATE_OUTPUT)
+    folded = []
+    for col_name in columns:
+        if not pattern.search(col_name):
+            continue
+        label = col_name
+        if date_format:
+            try:
+                label = datetime.strptime(col_name, date_format).strftime(output_format)
+            except ValueError:
+                raise ValueError(f"unpivot: column '{col_name}' matches columnPattern "
+                                 f"but not dateFormat '{date_format}'")
+        folded.append((col_name, label))
+    folded_names = {c for c, _ in folded}
+    id_cols = spec.get("idColumns") or [c for c in columns if c not in folded_names]
+    missing = [c for c in id_cols if c not in columns]
+    if missing:
+        raise ValueError(f"unpivot: idColumns not in '{config['tableName']}': {missing}")
+    return id_cols, folded
+
+def insert_unpivoted(conn, config, columns_info, col_types, contents):
+    """
+    Creates config['unpivot']['tableName'], the long form of the table: one row
+    per (source row, folded column) with the id columns, 'nameColumn' (the
+    column's label) and 'valueColumn' (its cell). Rows come straight from the
+    contents being loaded. 'distinct': true drops repeated long rows.
+    Returns the number of rows inserted.
+    """
+    spec = config["unpivot"]
+    approach = config.get("typeApproach", "stringAll")
+    long_table = spec["tableName"]
+    name_col = spec.get("nameColumn", "period")
+    value_col = spec.get("valueColumn", "value")
+    columns = [c for c, _ in columns_info]
+    id_cols, folded = unpivot_columns(config, columns)
+    if not folded:
+        print(f"Warning: unpivot of '{config['tableName']}': no column matches '{spec['columnPattern']}'.")
+
+    samples = dict(columns_info)
+    long_info = [(c, samples[c]) for c in id_cols] + [(name_col, None), (value_col, None)]
+    long_types = None
+    if col_types is not None:
+        types = dict(zip(columns, col_types))
+        value_type = None
+        for col_name, _label in folded:
+            value_type = merge_column_types(value_type, types[col_name])
+        long_types = [types[c] for c in id_cols] + ["TEXT", value_type or "TEXT"]
+    converters = compile_sqlite_converters(long_info, approach, long_types,
+                                           config.get("nullTokens", DEFAULT_NULL_TOKENS))
+
+    # id columns are converted once per source row, then shared by its long rows
+    id_converters = converters[:len(id_cols)]
+    labels = [(col_name, converters[-2](label)) for col_name, label in folded]
+    convert_value = converters[-1]
+
+    def long_rows():
+        for _header, dict_rows, _samples in contents:
+            for row_dict in dict_rows:
+                ids = tuple([convert(row_dict.get(c)) for convert, c in zip(id_converters, id_cols)])
+                for col_name, label in labels:
+                    yield ids + (label, convert_value(row_dict.get(col_name)))
+
+    def distinct(rows):
+        seen = set()
+        for row in rows:
+            if row not in seen:
+                seen.add(row)
+                yield row
+
+    rows = distinct(long_rows()) if spec.get("distinct") else long_rows()
+    create_sqlite_table(conn, long_table, long_info, drop_existing=True, col_types=long_types)
+    col_list_str = ", ".join(f'"{c}"' for c, _ in long_info)
+    insert_sql = f'INSERT INTO "{long_table}" ({col_list_str}) VALUES ({", ".join(["?"] * len(long_info))})'
+    batch_size = config.get("batchSize", DEFAULT_BATCH_SIZE)
+    inserted = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        conn.executemany(insert_sql, batch)
+        inserted += len(batch)
+    return inserted
+
+def load_contents_into_sqlite(conn, config, contents, record=None, per_file_types=None):
+    """
+    Creates config['tableName'] from the contents of one or more files
+    (list of (header, dict_rows, col_samples)) and inserts all their rows,
+    in one transaction for the table. Returns the number of rows inserted
+    per content. 'record(conn, counts)', if given, runs inside the same
+    transaction (used to write the ingest manifest).
+    For typeApproach 'auto' every column's type is inferred from all its values
+    ('per_file_types' if the caller already has them, see content_column_types).
+    With config['unpivot'] the long table is created from the same rows, in the
+    same transaction (see insert_unpivoted).
+    """
+    approach = config.get("typeApproach", "stringAll")
+    table_name = config["tableName"]
+    columns_info = columns_from_contents(contents, approach)
 
-def multi_excel_to_sqlite(config, conn):
+    col_types = None
+    if approach == "auto":
+        if per_file_types is None:
+            per_file_types = [content_column_types(content, config) for content in contents]
+        col_types = merged_column_types([c for c, _ in columns_info], per_file_types)
+    converters = compile_sqlite_converters(columns_info, approach, col_types,
+                                           config.get("nullTokens", DEFAULT_NULL_TOKENS))
+
+    t0 = time.perf_counter()
+    with table_transaction(conn):
+        # rows are converted (typed_converter) as they're inserted, so 'insert' includes conversion
+        with stage("insert", table=table_name, rows_in=sum(len(c[1]) for c in contents)) as s:
+            create_sqlite_table(conn, table_name, columns_info, drop_existing=True, col_types=col_types)
+            counts = [
+                insert_into_sqlite(conn, table_name, columns_info, dict_rows, approach,
+                                   config.get("batchSize", DEFAULT_BATCH_SIZE), converters)
+                for _header, dict_rows, _samples in contents
+            ]
+            s["rows_out"] = sum(counts)
+        elapsed = time.perf_counter() - t0
+        if config.get("unpivot"):
+            t1 = time.perf_counter()
+            with stage("unpivot", table=config["unpivot"]["tableName"]) as s:
+                long_count = insert_unpivoted(conn, config, columns_info, col_types, contents)
+                s["rows_out"] = long_count
+            long_elapsed = time.perf_counter() - t1
+        if record:
+            record(conn, counts)
+    report_insert_rate(table_name, sum(counts), elapsed)
+    if config.get("unpivot"):
+        report_insert_rate(config["unpivot"]["tableName"], long_count, long_elapsed)
+    return counts
+
+INGEST_MANIFEST_TABLE = "_ingest_manifest"
+
+# config keys that don't change what ends up in the table (left out of the config hash)
+RUNTIME_CONFIG_KEYS = ("workers", "batchSize", "loadPragmas", "logMergedRanges", "readMode",
+                       "sheetCache", "sheetCacheDir", "sheetCacheMaxMB")
+
+def ensure_ingest_manifest(conn):
     """
-    Scans a directory for Excel files, merges them into one table in SQLite.
-    If columns differ across files, we unify them (like your old code).
+    One row per (table, source file) loaded: what the file looked like (size, mtime,
+    content hash), which config produced the rows, the file's header (and inferred
+    column types for typeApproach 'auto') and the rowid range its rows got. Incremental loads diff the sources against it.
     """
-    directory = config["directory"]
-    pattern = config.get("filenamePattern")
-    filename_col = config.get("filenameColumnName")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{INGEST_MANIFEST_TABLE}" (
+            table_name      TEXT NOT NULL,
+            source_path     TEXT NOT NULL,
+            size            INTEGER,
+            mtime           REAL,
+            content_hash    TEXT,
+            config_hash     TEXT,
+            partition_value TEXT,
+            columns         TEXT,
+            row_start       INTEGER,
+            row_end         INTEGER,
+            loaded_at       TEXT,
+            column_types    TEXT,
+            PRIMARY KEY (table_name, source_path)
+        )
+    """)
+    # manifests written before column_types existed
+    if "column_types" not in (table_column_names(conn, INGEST_MANIFEST_TABLE) or []):
+        conn.execute(f'ALTER TABLE "{INGEST_MANIFEST_TABLE}" ADD COLUMN column_types TEXT')
+    conn.commit()
+
+def config_hash(config):
+    relevant = {k: v for k, v in config.items() if k not in RUNTIME_CONFIG_KEYS}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()
+
+def file_content_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def source_state(path, previous=None):
+    """
+    (size, mtime, content_hash) of a source file. The hash is only computed
+    when size or mtime differ from the previous manifest entry.
+    """
+    st = os.stat(path)
+    if previous and (previous["size"], previous["mtime"]) == (st.st_size, st.st_mtime):
+        return st.st_size, st.st_mtime, previous["content_hash"]
+    return st.st_size, st.st_mtime, file_content_hash(path)
+
+def read_ingest_manifest(conn, table_name):
+    """Returns {source_path: entry dict} for a table."""
+    cur = conn.execute(f'SELECT * FROM "{INGEST_MANIFEST_TABLE}" WHERE table_name = ?', (table_name,))
+    names = [d[0] for d in cur.description]
+    entries = {}
+    for row in cur:
+        entry = dict(zip(names, row))
+        entry["columns"] = json.loads(entry["columns"] or "[]")
+        entry["column_types"] = json.loads(entry["column_types"]) if entry.get("column_types") else None
+        entries[entry["source_path"]] = entry
+    return entries
+
+def write_ingest_manifest(conn, table_name, entries):
+    conn.executemany(
+        f'INSERT OR REPLACE INTO "{INGEST_MANIFEST_TABLE}" '
+        f'(table_name, source_path, size, mtime, content_hash, config_hash, partition_value, '
+        f'columns, row_start, row_end, loaded_at, column_types) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [(table_name, e["source_path"], e["size"], e["mtime"], e["content_hash"], e["config_hash"],
+          e["partition_value"], json.dumps(e["columns"]), e["row_start"], e["row_end"], e["loaded_at"],
+          json.dumps(e["column_types"]) if e.get("column_types") is not None else None)
+         for e in entries]
+    )
+
+def table_column_names(conn, table_name):
+    """Column names of an existing table, or None if there's no such table."""
+    cols = [r[1] for r in conn.execute(f'PRAGMA table_info("{table_name}")')]
+    return cols or None
+
+def table_column_types(conn, table_name):
+    """Declared column types of an existing table, in column order."""
+    return [r[2] for r in conn.execute(f'PRAGMA table_info("{table_name}")')]
+
+def plan_table_load(conn, config, files, incremental=False):
+    """
+    Decides how to (re)load config['tableName'] from files = [(path, filenameColumnName value)].
+    Returns a plan dict; plan['read'] is the subset of files that must be parsed:
+      'full'        - drop & recreate from every file (default, or nothing usable in the manifest)
+      'incremental' - only new/changed files are read; rows of changed/removed files are
+                      deleted by their filenameColumnName partition, and files sharing a
+                      partition with a changed file are re-read too. Configs without
+                      filenameColumnName, or with 'unpivot', are rebuilt in full when
+                      anything changed.
+      'unchanged'   - nothing to do
+    """
+    table_name = config["tableName"]
+    ensure_ingest_manifest(conn)
+    previous = read_ingest_manifest(conn, table_name)
+    cfg_hash = config_hash(config)
+    states = {path: source_state(path, previous.get(path)) for path, _val in files}
+    plan = {"mode": "full", "read": list(files), "removed": [], "previous": previous,
+            "states": states, "config_hash": cfg_hash}
+
+    if not incremental:
+        return plan
+    if table_column_names(conn, table_name) is None or not previous:
+        print(f"-- '{table_name}': no previous load recorded; full rebuild.")
+        return plan
+    if any(e["config_hash"] != cfg_hash for e in previous.values()):
+        print(f"-- '{table_name}': config changed; full rebuild.")
+        return plan
+
+    paths = {path for path, _val in files}
+    changed = [(path, val) for path, val in files
+               if path not in previous or states[path][2] != previous[path]["content_hash"]]
+    removed = [path for path in previous if path not in paths]
+    plan["removed"] = removed
+    if not changed and not removed:
+        plan["mode"], plan["read"] = "unchanged", []
+        return plan
+
+    if not config.get("filenameColumnName") or config.get("unpivot"):
+        # no partition key to delete a file's rows by (e.g. single-file configs),
+        # or an unpivoted long table that is only ever built in full
+        print(f"-- '{table_name}': sources changed; full rebuild.")
+        return plan
+
+    # a partition shared by several files is deleted as a whole => re-read all of them
+    hit = {val for _path, val in changed}
+    hit |= {previous[path]["partition_value"] for path in removed}
+    hit |= {previous[path]["partition_value"] for path, _val in changed if path in previous}
+    changed_paths = {path for path, _val in changed}
+    changed = [(path, val) for path, val in files if path in changed_paths or val in hit]
+
+    plan["mode"], plan["read"] = "incremental", changed
+    return plan
+
+def manifest_entries(plan, files, contents_by_path, counts_by_path, first_rowid, types_by_path=None):
+    """Manifest entries for the files just loaded, rowid ranges assigned in file order."""
+    loaded_at = datetime.now().isoformat(timespec="seconds")
+    entries = []
+    next_rowid = first_rowid
+    for path, val in files:
+        content = contents_by_path.get(path)
+        count = counts_by_path.get(path, 0)
+        size, mtime, content_hash = plan["states"][path]
+        entries.append({
+            "source_path": path, "size": size, "mtime": mtime, "content_hash": content_hash,
+            "config_hash": plan["config_hash"], "partition_value": val,
+            "columns": content[0] if content else [],
+            "row_start": next_rowid if count else None,
+            "row_end": next_rowid + count - 1 if count else None,
+            "loaded_at": loaded_at,
+            "column_types": (types_by_path or {}).get(path),
+        })
+        next_rowid += count
+    return entries
+
+def apply_table_load(conn, config, files, plan, read_files):
+    """
+    Carries out a plan_table_load() plan. read_files(subset) returns one content
+    (header, dict_rows, col_samples) or None per file. An incremental plan whose
+    files no longer add up to the table's current columns falls back to a full rebuild.
+    """
+    table_name = config["tableName"]
     approach = config.get("typeApproach", "stringAll")
+    previous = plan["previous"]
+    cache = {}
+
+    def read_cached(subset):
+        missing = [f for f in subset if f[0] not in cache]
+        for (path, _val), content in zip(missing, read_files(missing) if missing else []):
+            cache[path] = content
+        return [cache[path] for path, _val in subset]
+
+    if plan["mode"] == "unchanged":
+        # refresh mtimes so the next run can skip hashing again
+        entries = [dict(previous[path], size=plan["states"][path][0], mtime=plan["states"][path][1])
+                   for path, _val in files]
+        write_ingest_manifest(conn, table_name, entries)
+        conn.commit()
+        print(f"-- '{table_name}': {len(files)} source file(s) unchanged; nothing to do.")
+        return
+
+    if plan["mode"] == "incremental":
+        read_cached(plan["read"])
+        reread = {path for path, _val in plan["read"]}
+        headers = [cache[path][0] if path in reread and cache[path] else
+                   ([] if path in reread else previous[path]["columns"])
+                   for path, _val in files]
+        expected = [c for c, _ in columns_from_contents([(h, None, None) for h in headers], approach)]
+        types_by_path = {path: content_column_types(cache[path], config) for path in reread}
+        if expected != table_column_names(conn, table_name):
+            print(f"-- '{table_name}': unified columns changed; full rebuild.")
+        elif approach == "auto" and merged_column_types(expected, [
+                (types_by_path[path] if path in reread else previous[path]["column_types"]) or {}
+                for path, _val in files]) != table_column_types(conn, table_name):
+            print(f"-- '{table_name}': inferred column types changed; full rebuild.")
+        else:
+            apply_incremental(conn, config, files, plan, cache, types_by_path)
+            return
+
+    # full rebuild
+    contents_all = read_cached(files)
+    loaded = [(path, content) for (path, _val), content in zip(files, contents_all) if content]
+    types_by_path = {path: content_column_types(content, config) for path, content in loaded}
+
+    def record(conn, counts):
+        conn.execute(f'DELETE FROM "{INGEST_MANIFEST_TABLE}" WHERE table_name = ?', (table_name,))
+        counts_by_path = {path: n for (path, _content), n in zip(loaded, counts)}
+        write_ingest_manifest(conn, table_name,
+                              manifest_entries(plan, files, cache, counts_by_path, 1, types_by_path))
+
+    if not loaded:
+        print(f"-- No valid Excel data found for '{table_name}'.")
+        return
+    load_contents_into_sqlite(conn, config, [content for _path, content in loaded], record,
+                              [types_by_path[path] for path, _content in loaded])
+
+def apply_incremental(conn, config, files, plan, cache, types_by_path=None):
+    """Deletes the rows of changed/removed files and inserts the re-read ones, in one transaction."""
     table_name = config["tableName"]
+    approach = config.get("typeApproach", "stringAll")
+    partition_col = config.get("filenameColumnName")
+    previous = plan["previous"]
+    reread = [(path, val) for path, val in files if path in {p for p, _v in plan["read"]}]
+    columns_info = [(c, None) for c in table_column_names(conn, table_name)]
+    col_types = table_column_types(conn, table_name) if approach == "auto" else None
+    converters = compile_sqlite_converters(columns_info, approach, col_types,
+                                           config.get("nullTokens", DEFAULT_NULL_TOKENS))
+    partition_converter = converters[[c for c, _ in columns_info].index(partition_col)]
+
+    t0 = time.perf_counter()
+    with table_transaction(conn):
+        stale = [previous[path] for path in plan["removed"]]
+        stale += [previous[path] for path, _val in reread if path in previous]
+        deleted = 0
+        for value in {entry["partition_value"] for entry in stale}:
+            cur = conn.execute(f'DELETE FROM "{table_name}" WHERE "{partition_col}" = ?',
+                               (partition_converter(value),))
+            deleted += max(cur.rowcount, 0)
+        conn.executemany(f'DELETE FROM "{INGEST_MANIFEST_TABLE}" WHERE table_name = ? AND source_path = ?',
+                         [(table_name, path) for path in plan["removed"]])
+
+        first_rowid = (conn.execute(f'SELECT max(rowid) FROM "{table_name}"').fetchone()[0] or 0) + 1
+        counts_by_path = {}
+        with stage("insert", table=table_name, incremental=True,
+                   rows_in=sum(len(cache[path][1]) for path, _val in reread if cache[path])) as s:
+            for path, _val in reread:
+                if cache[path]:
+                    counts_by_path[path] = insert_into_sqlite(
+                        conn, table_name, columns_info, cache[path][1], approach,
+                        config.get("batchSize", DEFAULT_BATCH_SIZE), converters
+                    )
+            s["rows_out"] = sum(counts_by_path.values())
+        write_ingest_manifest(conn, table_name,
+                              manifest_entries(plan, reread, cache, counts_by_path, first_rowid, types_by_path))
+
+    print(f"-- '{table_name}': incremental load of {len(reread)} file(s), "
+          f"{len(plan['removed'])} removed; {deleted} row(s) deleted.")
+    report_insert_rate(table_name, sum(counts_by_path.values()), time.perf_counter() - t0)
+
+def load_table(conn, config, files, read_files, incremental=False):
+    """plan_table_load() + apply_table_load()."""
+    plan = plan_table_load(conn, config, files, incremental)
+    apply_table_load(conn, config, files, plan, read_files)
+
+def read_single_file(config):
+    """read_files callback for load_table(): one read_excel_content() per file."""
+    def read_files(files):
+        results = []
+        for path, _val in files:
+            header, dict_rows, col_samples = read_excel_content(path, config)
+            if header is None:
+                print(f"-- Skipped file {path}, no sheet or not enough rows.")
+            results.append((header, dict_rows, col_samples) if header is not None else None)
+        return results
+    return read_files
+
+def single_excel_to_sqlite(excel_file, config, conn, incremental=False):
+    """
+    Processes a single Excel file -> create table in SQLite, do inserts.
+    With incremental=True the file isn't re-read if the manifest shows it unchanged.
+    """
+    load_table(conn, config, [(excel_file, None)], read_single_file(config), incremental)
+
+def list_source_files(config):
+    """
+    Returns the (full_path, filename_match) pairs of the .xlsx files in
+    config['directory'] matching config['filenamePattern'] (all .xlsx if no pattern).
+    """
+    directory = config["directory"]
+    pattern = config.get("filenamePattern")
 
     if not os.path.isdir(directory):
         raise ValueError(f"Directory '{directory}' not found or not a directory.")
 
     rx = re.compile(pattern) if pattern else None
 
-    # Gather matching files
+    # Gather matching files (sorted, so the load order doesn't depend on the filesystem)
     all_files = []
-    for fname in os.listdir(directory):
+    for fname in sorted(os.listdir(directory)):
         full_path = os.path.join(directory, fname)
         if not os.path.isfile(full_path):
             continue
@@ -397,101 +1072,111 @@ def multi_excel_to_sqlite(config, conn):
 
     if not all_files:
         raise ValueError(f"No .xlsx files matched in '{directory}' with pattern '{pattern}'.")
+    return all_files
 
-    # Prepare to unify columns
-    master_col_samples = {}
-    file_data = []  # each entry => list of rowDict
-    all_colnames_seen = set()
-    master_column_order = []
-    first_data_file_used = False
+def filename_column_value(config, full_path, fmatch):
+    """
+    Value stored in config['filenameColumnName'] for rows of this file:
+    the pattern's single capturing group, else the whole filename.
+    """
+    if not config.get("filenameColumnName"):
+        return None
+    # If the pattern had exactly 1 capturing group
+    if fmatch and fmatch.lastindex == 1:
+        return fmatch.group(1)
+    # fallback => entire filename
+    return os.path.basename(full_path)
+
+def read_file_rows(task):
+    """
+    Process-pool worker for multi_excel_to_sqlite: reads one file and returns
+    (header, rows, col_samples) with rows as tuples in header order (much
+    cheaper to send back than dicts), or None if the file is skipped.
+    task = (full_path, config, extra_col_name, extra_col_value)
+    """
+    full_path, config, extra_col_name, extra_col_value = task
+    print(f"-- Processing file '{full_path}'.")
+    header_for_file, dict_rows, col_samples_dict = read_excel_content(
+        full_path, config, extra_col_name=extra_col_name, extra_col_value=extra_col_value
+    )
+    if header_for_file is None or dict_rows is None:
+        return None
+    rows = [tuple(row_dict.get(c) for c in header_for_file) for row_dict in dict_rows]
+    return header_for_file, rows, col_samples_dict
+
+def map_in_workers(func, tasks, workers):
+    """
+    map(func, tasks) over a process pool of 'workers' processes (default: CPU count).
+    Results come back in task order whichever worker finishes first.
+    Runs in-process when there's a single worker or a single task.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        return list(pool.map(func, tasks))
+
+def read_directory_files(config):
+    """read_files callback for load_table(): files parsed over 'workers' processes."""
+    filename_col = config.get("filenameColumnName")
 
-    for full_path, fmatch in all_files:
+    def read_files(files):
+        tasks = [(path, config, filename_col, val) for path, val in files]
+        contents = []
+        for result in map_in_workers(read_file_rows, tasks, config.get("workers")):
+            if result is None:
+                # means skip
+                contents.append(None)
+                continue
+            header_for_file, rows, col_samples_dict = result
+            contents.append((header_for_file, [dict(zip(header_for_file, r)) for r in rows], col_samples_dict))
+        return contents
+    return read_files
+
+def directory_files(config):
+    """[(path, filenameColumnName value)] of the non-empty matched files, sorted."""
+    files = []
+    for full_path, fmatch in list_source_files(config):
         if os.path.getsize(full_path) == 0:
             print(f"Skipping empty file: {full_path}")
             continue
-    
-        print(f"-- Processing file '{full_path}'.")
         # If there's a capturing group for filename, store that in the row if desired
-        extra_val = None
-        if filename_col:
-            # If the pattern had exactly 1 capturing group
-            if fmatch and fmatch.lastindex == 1:
-                extra_val = fmatch.group(1)
-            else:
-                # fallback => entire filename
-                extra_val = os.path.basename(full_path)
-
-        header_for_file, dict_rows, col_samples_dict = read_excel_content(
-            full_path,
-            config,
-            extra_col_name=filename_col,
-            extra_col_value=extra_val
-        )
-        if header_for_file is None or dict_rows is None:
-            # means skip
-            continue
-
-        # unify columns
-        if not first_data_file_used:
-            master_column_order = header_for_file[:]
-            for c in master_column_order:
-                all_colnames_seen.add(c)
-            first_data_file_used = True
-        else:
-            for c in header_for_file:
-                if c not in all_colnames_seen:
-                    master_column_order.append(c)
-                    all_colnames_seen.add(c)
-
-        # gather sample values
-        if approach == "auto" and col_samples_dict:
-            for c_name, c_val in col_samples_dict.items():
-                if c_name not in master_col_samples and c_val is not None:
-                    master_col_samples[c_name] = c_val
-
-        file_data.append(dict_rows)
-
-    if not first_data_file_used:
-        print(f"-- No valid Excel data found in directory '{directory}'.")
-        return
-
-    # Build final columns_info
-    columns_info = []
-    for col_name in master_column_order:
-        if approach == "auto":
-            sample_val = master_col_samples.get(col_name, None)
-        else:
-            sample_val = None
-        columns_info.append((col_name, sample_val))
-
-    # Create the unified table
-    create_sqlite_table(conn, table_name, columns_info, drop_existing=True)
+        files.append((full_path, filename_column_value(config, full_path, fmatch)))
+    return files
 
-    # Insert all data
-    for dict_rows in file_data:
-        insert_into_sqlite(conn, table_name, columns_info, dict_rows, approach)
+def multi_excel_to_sqlite(config, conn, incremental=False):
+    """
+    Scans a directory for Excel files, merges them into one table in SQLite.
+    If columns differ across files, we unify them (like your old code).
+    Files are parsed in parallel over 'workers' processes (default: CPU count);
+    the table is the same for any worker count.
+    With incremental=True only new/changed files are parsed (see plan_table_load).
+    """
+    load_table(conn, config, directory_files(config), read_directory_files(config), incremental)
 
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: python excel_to_sqlite.py <excel_file> <config_file> [sqlite_db_path]")
+    args = [a for a in sys.argv[1:] if a != "--incremental"]
+    incremental = len(args) != len(sys.argv) - 1
+    if len(args) < 2:
+        print("Usage: python excel_to_sqlite.py <excel_file> <config_file> [sqlite_db_path] [--incremental]")
         sys.exit(1)
 
-    excel_file = sys.argv[1]
-    config_file = sys.argv[2]
+    excel_file = args[0]
+    config_file = args[1]
     # Optionally, let user specify DB path; default "output.db"
-    db_path = sys.argv[3] if len(sys.argv) > 3 else "output.db"
+    db_path = args[2] if len(args) > 2 else "output.db"
 
     config = load_config(config_file)
-    table_name = config["tableName"]
 
     # Connect to SQLite
     conn = sqlite3.connect(db_path)
 
     # Single-file vs. multi-file logic
-    if "directory" in config:
-        multi_excel_to_sqlite(config, conn)
-    else:
-        single_excel_to_sqlite(excel_file, config, conn)
+    with load_pragmas(conn, config.get("loadPragmas")):
+        if "directory" in config:
+            multi_excel_to_sqlite(config, conn, incremental)
+        else:
+            single_excel_to_sqlite(excel_file, config, conn, incremental)
 
     conn.commit()
     conn.close()
@@ -0,0 +1,215 @@
+"""
+Build-time Opex analytics over vf_site_month_opex (sqlite/vfsummary_opex.sql.post),
+computed with NumPy on the site x year x month cost matrix in one pass
+instead of with window functions on every endpoint call:
+
+    vf_site_opex_trend      one row per site, year and month range
+                            min_month..max_month (1 <= min <= max <= 12):
+                            strictly increasing / decreasing flags, first and
+                            last cost, least-squares slope (k GBP / month)
+    vf_site_opex_month      one row per site, year and month: length of the
+                            strictly increasing / decreasing run of monthly
+                            costs ending at that month, and the delta to the
+                            same month of the year before
+    vf_site_opex_forecast   one row per site, base year, growth rate and
+                            forecast year: the annual cost compounded at the
+                            growth rate (forecast_year = base_year is the base)
+
+The trend endpoints (vf/sites/opex/*_trends.sql) look their rows up in
+vf_site_opex_trend by primary key.
+
+Usage:
+    python opex_analytics.py <sqlite_db> [--growth 5,10,23] [--forecast-years 5]
+"""
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from build_stats import BuildStats, stage
+
+DEFAULT_GROWTH_PERCENTS = (5, 10, 23)   # 23 = default annual_growth_percent of opex/summary/forecast.sql
+DEFAULT_FORECAST_YEARS = 5
+MONTHS = 12
+
+# vf_site_month_opex holds costs rounded to 7 decimals; derived values are
+# rounded the same way so they don't carry float noise.
+COST_DIGITS = 7
+FORECAST_DIGITS = 2
+
+TABLES_SQL = """
+DROP TABLE IF EXISTS vf_site_opex_trend;
+CREATE TABLE vf_site_opex_trend (
+    site_code              TEXT    NOT NULL,
+    year                   INTEGER NOT NULL,
+    min_month              INTEGER NOT NULL,
+    max_month              INTEGER NOT NULL,
+    increasing             INTEGER NOT NULL,   -- every month costs more than the one before
+    decreasing             INTEGER NOT NULL,   -- every month costs less than the one before
+    first_cost_k_gbp       REAL    NOT NULL,   -- cost of min_month
+    last_cost_k_gbp        REAL    NOT NULL,   -- cost of max_month
+    slope_k_gbp_per_month  REAL,               -- NULL for a single month
+    PRIMARY KEY (site_code, year, min_month, max_month)
+);
+
+DROP TABLE IF EXISTS vf_site_opex_month;
+CREATE TABLE vf_site_opex_month (
+    site_code        TEXT    NOT NULL,
+    year             INTEGER NOT NULL,
+    month            INTEGER NOT NULL,
+    cost_k_gbp       REAL    NOT NULL,
+    increasing_run   INTEGER NOT NULL,         -- months in the strictly increasing run ending here
+    decreasing_run   INTEGER NOT NULL,
+    yoy_delta_k_gbp  REAL,                     -- NULL when year - 1 has no data
+    PRIMARY KEY (site_code, year, month)
+);
+
+DROP TABLE IF EXISTS vf_site_opex_forecast;
+CREATE TABLE vf_site_opex_forecast (
+    site_code       TEXT    NOT NULL,
+    base_year       INTEGER NOT NULL,
+    growth_percent  REAL    NOT NULL,
+    forecast_year   INTEGER NOT NULL,
+    cost_k_gbp      REAL    NOT NULL,
+    PRIMARY KEY (site_code, base_year, growth_percent, forecast_year)
+);
+"""
+
+
+def load_cost_matrix(conn):
+    """(site codes, years, costs[site, year, month]) from vf_site_month_opex; months without a row are 0."""
+    rows = conn.execute("SELECT site_code, year, month, cost_k_gbp FROM vf_site_month_opex").fetchall()
+    sites = sorted({r[0] for r in rows})
+    years = sorted({r[1] for r in rows})
+    site_ix = {s: i for i, s in enumerate(sites)}
+    year_ix = {y: i for i, y in enumerate(years)}
+    costs = np.zeros((len(sites), len(years), MONTHS))
+    if rows:
+        s, y, m, c = zip(*rows)
+        costs[[site_ix[v] for v in s], [year_ix[v] for v in y], np.array(m) - 1] = c
+    return sites, years, costs
+
+def run_lengths(steps):
+    """
+    Length of the run of True steps ending at each month: steps[..., j] says
+    whether month j + 1 continues month j. Month 0 always starts a run.
+    """
+    month = np.arange(MONTHS)
+    starts = np.concatenate([np.ones(steps.shape[:-1] + (1,), dtype=bool), ~steps], axis=-1)
+    run_start = np.maximum.accumulate(np.where(starts, month, 0), axis=-1)
+    return month - run_start + 1
+
+def month_ranges():
+    """(first, last) month indexes (0-based) of every range with first <= last."""
+    first, last = np.triu_indices(MONTHS)
+    return first, last
+
+def range_slopes(costs, first, last):
+    """Least-squares slope of cost over month for every range, from prefix sums (NaN for one month)."""
+    month = np.arange(1, MONTHS + 1, dtype=float)
+    zero = np.zeros(costs.shape[:-1] + (1,))
+    sum_y = np.concatenate([zero, np.cumsum(costs, axis=-1)], axis=-1)
+    sum_xy = np.concatenate([zero, np.cumsum(costs * month, axis=-1)], axis=-1)
+    sy = sum_y[..., last + 1] - sum_y[..., first]
+    sxy = sum_xy[..., last + 1] - sum_xy[..., first]
+    x_first, x_last = first + 1.0, last + 1.0
+    n = x_last - x_first + 1
+    sx = (x_first + x_last) * n / 2
+    sxx = x_last * (x_last + 1) * (2 * x_last + 1) / 6 - (x_first - 1) * x_first * (2 * x_first - 1) / 6
+    denominator = n * sxx - sx * sx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, (n * sxy - sx * sy) / denominator, np.nan)
+
+def trend_rows(sites, years, costs):
+    steps = np.diff(costs, axis=-1)
+    up_run, down_run = run_lengths(steps > 0), run_lengths(steps < 0)
+    first, last = month_ranges()
+    length = last - first + 1
+    increasing = up_run[..., last] >= length
+    decreasing = down_run[..., last] >= length
+    slopes = np.round(range_slopes(costs, first, last), COST_DIGITS)
+
+    s, y, r = np.indices(increasing.shape).reshape(3, -1)
+    slope = slopes.reshape(-1)
+    return list(zip(
+        np.array(sites, dtype=object)[s], np.array(years)[y].tolist(),
+        (first[r] + 1).tolist(), (last[r] + 1).tolist(),
+        increasing.reshape(-1).astype(int).tolist(), decreasing.reshape(-1).astype(int).tolist(),
+        costs[..., first].reshape(-1).tolist(), costs[..., last].reshape(-1).tolist(),
+        [None if np.isnan(v) else v for v in slope.tolist()],
+    )), up_run, down_run
+
+def month_rows(sites, years, costs, up_run, down_run):
+    yoy = np.full(costs.shape, np.nan)
+    consecutive = np.diff(np.array(years)) == 1
+    yoy[:, 1:][:, consecutive] = np.round(np.diff(costs, axis=1), COST_DIGITS)[:, consecutive]
+
+    s, y, m = np.indices(costs.shape).reshape(3, -1)
+    return list(zip(
+        np.array(sites, dtype=object)[s], np.array(years)[y].tolist(), (m + 1).tolist(),
+        costs.reshape(-1).tolist(), up_run.reshape(-1).tolist(), down_run.reshape(-1).tolist(),
+        [None if np.isnan(v) else v for v in yoy.reshape(-1).tolist()],
+    ))
+
+def forecast_rows(sites, years, costs, growth_percents, forecast_years):
+    base = np.round(costs.sum(axis=-1), FORECAST_DIGITS)                       # [site, year]
+    factors = (1 + np.array(growth_percents, dtype=float)[:, None] / 100) ** np.arange(forecast_years + 1)
+    curves = np.round(base[:, :, None, None] * factors, FORECAST_DIGITS)       # [site, year, rate, offset]
+
+    s, y, g, k = np.indices(curves.shape).reshape(4, -1)
+    base_years = np.array(years)[y]
+    return list(zip(
+        np.array(sites, dtype=object)[s], base_years.tolist(),
+        np.array(growth_percents, dtype=float)[g].tolist(), (base_years + k).tolist(),
+        curves.reshape(-1).tolist(),
+    ))
+
+def build_opex_analytics(conn, growth_percents=DEFAULT_GROWTH_PERCENTS, forecast_years=DEFAULT_FORECAST_YEARS):
+    """(Re)creates the three tables. Returns {table: rows}."""
+    with stage("load_cost_matrix") as s:
+        sites, years, costs = load_cost_matrix(conn)
+        s["rows_out"] = len(sites)
+    with stage("compute", rows_in=len(sites)) as s:
+        trends, up_run, down_run = trend_rows(sites, years, costs)
+        months = month_rows(sites, years, costs, up_run, down_run)
+        forecasts = forecast_rows(sites, years, costs, growth_percents, forecast_years)
+        s["rows_out"] = len(trends) + len(months) + len(forecasts)
+
+    with stage("insert") as s:
+        conn.executescript(TABLES_SQL)
+        conn.executemany("INSERT INTO vf_site_opex_trend VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", trends)
+        conn.executemany("INSERT INTO vf_site_opex_month VALUES (?, ?, ?, ?, ?, ?, ?)", months)
+        conn.executemany("INSERT INTO vf_site_opex_forecast VALUES (?, ?, ?, ?, ?)", forecasts)
+        conn.commit()
+        s["rows_out"] = len(trends) + len(months) + len(forecasts)
+    return {"vf_site_opex_trend": len(trends), "vf_site_opex_month": len(months),
+            "vf_site_opex_forecast": len(forecasts)}
+
+def main():
+    args = sys.argv[1:]
+    growth_percents, forecast_years = DEFAULT_GROWTH_PERCENTS, DEFAULT_FORECAST_YEARS
+    if "--growth" in args:
+        i = args.index("--growth")
+        growth_percents = tuple(float(v) for v in args[i + 1].split(","))
+        del args[i:i + 2]
+    if "--forecast-years" in args:
+        i = args.index("--forecast-years")
+        forecast_years = int(args[i + 1])
+        del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    stats = BuildStats(args[0], "opex_analytics")
+    conn = sqlite3.connect(args[0])
+    t0 = time.perf_counter()
+    counts = build_opex_analytics(conn, growth_percents, forecast_years)
+    conn.close()
+    stats.save()
+    for table, rows in counts.items():
+        print(f"{table:<24} {rows:>8} rows")
+    print(f"Opex analytics built in {time.perf_counter() - t0:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import hashlib
+import json
+import os
+import sys
+import time
+import zlib
+from datetime import date, datetime, time as dtime, timedelta
+
+DEFAULT_CACHE_DIR = ".sheet_cache"
+DEFAULT_MAX_MB = 512
+CACHE_MAGIC = b"VFSC2\n"
+
+# states of a sheet entry (SheetCache.get_sheet)
+SHEET_GRID = "grid"        # the whole sheet (its used range) is stored
+SHEET_MISSING = "missing"  # the workbook has no such sheet
+SHEET_SEEN = "seen"        # regions of it were read and stored, not the whole sheet
+
+PLAIN_TYPES = (str, int, float, bool, type(None))
+
+# cell types JSON has no spelling for: type => (tag, to JSON), tag => from JSON
+CELL_ENCODERS = {
+    datetime: ("datetime", datetime.isoformat),
+    date: ("date", date.isoformat),
+    dtime: ("time", dtime.isoformat),
+    timedelta: ("timedelta", lambda v: [v.days, v.seconds, v.microseconds]),
+}
+CELL_DECODERS = {
+    "datetime": datetime.fromisoformat,
+    "date": date.fromisoformat,
+    "time": dtime.fromisoformat,
+    "timedelta": lambda v: timedelta(*v),
+}
+
+
+class SheetGrid:
+    """
+    A parsed sheet (merges already resolved), stored column-major:
+    columns[c][r] is the cell at 0-based (origin_col + c, origin_row + r).
+    Column-major lists of plain values serialise compactly and reload
+    far faster than re-parsing the sheet XML.
+    """
+
+    def __init__(self, origin_col, origin_row, n_rows, columns):
+        self.origin_col = origin_col
+        self.origin_row = origin_row
+        self.n_rows = n_rows
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, rows, origin_col, origin_row):
+        return cls(origin_col, origin_row, len(rows), [list(col) for col in zip(*rows)])
+
+    def bounds(self):
+        """0-based (sc, sr, ec, er) covered by the grid."""
+        return (self.origin_col, self.origin_row,
+                self.origin_col + len(self.columns) - 1, self.origin_row + self.n_rows - 1)
+
+    def covers(self, region_tuple):
+        """True if the region (None: the used range the grid was read from) is inside the grid."""
+        if region_tuple is None:
+            return True
+        sc, sr, ec, er = region_tuple
+        gsc, gsr, gec, ger = self.bounds()
+        return gsc <= sc and gsr <= sr and ec <= gec and er <= ger
+
+    def rows(self, region_tuple=None):
+        """The region's rows (default the whole grid), as read_sheet_region would return them."""
+        if region_tuple is None:
+            return [list(row) for row in zip(*self.columns)]
+        sc, sr, ec, er = region_tuple
+        r0, r1 = sr - self.origin_row, er - self.origin_row + 1
+        cols = [col[r0:r1] for col in self.columns[sc - self.origin_col:ec - self.origin_col + 1]]
+        return [list(row) for row in zip(*cols)]
+
+    def encode(self):
+        """
+        The grid as JSON-able data: {'columns': ..., 'typed': [[c, r, tag, value], ...]}.
+        Dates and times can't be JSON values; they are left None in the columns
+        and listed in 'typed'. Raises TypeError for any other non-plain cell.
+        """
+        columns, typed = [], []
+        for c, col in enumerate(self.columns):
+            if all(type(v) in PLAIN_TYPES for v in col):
+                columns.append(col)
+                continue
+            col = list(col)
+            for r, v in enumerate(col):
+                if type(v) in PLAIN_TYPES:
+                    continue
+                if type(v) not in CELL_ENCODERS:
+                    raise TypeError(f"can't cache a {type(v).__name__} cell")
+                tag, to_json = CELL_ENCODERS[type(v)]
+                typed.append([c, r, tag, to_json(v)])
+                col[r] = None
+            columns.append(col)
+        return {"columns": columns, "typed": typed}
+
+    @classmethod
+    def decode(cls, data, bounds):
+        """The grid encode() gave 'data' for; ValueError if they don't fit the bounds."""
+        sc, sr, ec, er = bounds
+        columns = data["columns"]
+        n_rows = er - sr + 1
+        if len(columns) != ec - sc + 1 or any(len(col) != n_rows for col in columns):
+            raise ValueError("grid doesn't match its bounds")
+        for c, r, tag, value in data["typed"]:
+            columns[c][r] = CELL_DECODERS[tag](value)
+        return cls(sc, sr, n_rows, columns)
+
+
+class SheetCache:
+    """
+    On-disk cache of SheetGrids, two kinds of entry per workbook content hash:
+
+    - a region entry per (hash, sheet name, region) read, so a cold run
+      parses no more of a sheet than an uncached one;
+    - a sheet entry per (hash, sheet name): the whole sheet (its used
+      range), from which any region inside it is sliced; or a note that the
+      workbook has no such sheet; or that regions of it were read. A region
+      missed on a sheet that was read before (a config being iterated on:
+      a new region, other header rows) reads and stores the whole sheet once,
+      so the next change of region parses nothing.
+
+    One file per entry: a magic line, a JSON header line (source, sheet,
+    region or state, bounds) and the zlib-compressed JSON of the grid
+    (SheetGrid.encode) - data only, so a tampered entry can't run code. An
+    entry that doesn't decode is a miss, and is deleted. Entries are written
+    atomically, so parallel workers can share the directory. The total size
+    is capped; least recently used entries (file mtime, bumped on every hit)
+    are evicted first, once the running total of this process (the directory
+    size at its first write, plus what it wrote since) goes over the cap.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._hashes = {}
+        self._total = None
+
+    def content_hash(self, excel_file):
+        st = os.stat(excel_file)
+        memo_key = (os.path.abspath(excel_file), st.st_size, st.st_mtime_ns)
+        if memo_key not in self._hashes:
+            h = hashlib.sha256()
+            with open(excel_file, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            self._hashes[memo_key] = h.hexdigest()
+        return self._hashes[memo_key]
+
+    def entry_path(self, excel_file, ws_name, region_tuple=None, sheet=False):
+        """The file of a region entry (region None: the used range), or with sheet=True of the sheet entry."""
+        if sheet:
+            key = f"{self.content_hash(excel_file)}\0{ws_name}"
+        else:
+            region = ",".join(map(str, region_tuple)) if region_tuple else "used"
+            key = f"{self.content_hash(excel_file)}\0{ws_name}\0{region}"
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest()[:40] + ".grid")
+
+    def get(self, excel_file, ws_name, region_tuple):
+        """Returns (found, grid) for a region entry."""
+        _header, grid = self._read(self.entry_path(excel_file, ws_name, region_tuple))
+        return grid is not None, grid
+
+    def get_sheet(self, excel_file, ws_name):
+        """Returns (state, grid) of the sheet entry: state None if there is none, grid set for SHEET_GRID."""
+        header, grid = self._read(self.entry_path(excel_file, ws_name, sheet=True))
+        return (header or {}).get("state"), grid
+
+    def put(self, excel_file, ws_name, region_tuple, grid):
+        self._write(self.entry_path(excel_file, ws_name, region_tuple),
+                    {"source": os.path.abspath(excel_file), "sheet": ws_name, "region": region_tuple}, grid)
+
+    def put_sheet(self, excel_file, ws_name, state, grid=None):
+        self._write(self.entry_path(excel_file, ws_name, sheet=True),
+                    {"source": os.path.abspath(excel_file), "sheet": ws_name, "state": state}, grid)
+
+    def _read(self, path):
+        """(header, grid or None) of an entry, (None, None) if there is none or it doesn't decode."""
+        try:
+            with open(path, "rb") as f:
+                if f.readline() != CACHE_MAGIC:
+                    raise ValueError("not a cache entry")
+                header = json.loads(f.readline())
+                bounds, body = header["bounds"], f.read()
+                grid = SheetGrid.decode(json.loads(zlib.decompress(body)), bounds) if bounds else None
+        except FileNotFoundError:
+            return None, None
+        except Exception:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None, None
+        os.utime(path)  # LRU: last use = mtime
+        return header, grid
+
+    def _write(self, path, header, grid):
+        try:
+            payload = zlib.compress(json.dumps(grid.encode()).encode("utf-8"), 1) if grid is not None else b""
+        except TypeError:
+            return  # a cell type the cache can't store: read from the workbook every time
+        os.makedirs(self.directory, exist_ok=True)
+        header = dict(header, bounds=grid.bounds() if grid is not None else None, created=time.time())
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(CACHE_MAGIC)
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            f.write(payload)
+            size = f.tell()
+        os.replace(tmp, path)
+        if self._total is None:
+            self._total = self.total_bytes()
+        else:
+            self._total += size
+        if self._total > self.max_bytes:
+            self.evict()
+
+    def sizes(self):
+        """[(path, size, last_used)] of all entries, least recently used first (stat only)."""
+        out = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".grid"):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        out.append((entry.path, st.st_size, st.st_mtime))
+        except FileNotFoundError:
+            pass
+        out.sort(key=lambda e: e[2])
+        return out
+
+    def total_bytes(self):
+        return sum(size for _p, size, _t in self.sizes())
+
+    def entries(self):
+        """[(path, size, last_used, header)] of all entries, least recently used first."""
+        out = []
+        for path, size, last_used in self.sizes():
+            try:
+                with open(path, "rb") as f:
+                    f.readline()
+                    header = json.loads(f.readline() or b"{}")
+            except (OSError, ValueError):
+                continue
+            out.append((path, size, last_used, header))
+        return out
+
+    def evict(self):
+        """Drops least recently used entries until the cache fits in max_bytes."""
+        entries = self.sizes()
+        total = sum(size for _p, size, _t in entries)
+        for path, size, _last_used in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self._total = total
+
+    def clear(self):
+        removed = 0
+        for path, _size, _last_used, _header in self.entries():
+            os.remove(path)
+            removed += 1
+        return removed
+
+
+_caches = {}
+
+def sheet_cache_from_config(config):
+    """
+    The SheetCache a config should use, or None when caching is off:
+    config 'sheetCache': false, or env VF_SHEET_CACHE=0.
+    Directory / cap: config 'sheetCacheDir' / 'sheetCacheMaxMB', else env
+    VF_SHEET_CACHE_DIR / VF_SHEET_CACHE_MAX_MB, else .sheet_cache / 512 MB.
+    One instance per (directory, cap) and process, so its workbook hashes and
+    size total carry over from config to config.
+    """
+    if config.get("sheetCache", True) is False:
+        return None
+    if os.environ.get("VF_SHEET_CACHE", "1").lower() in ("0", "off", "false", "no"):
+        return None
+    directory = config.get("sheetCacheDir") or os.environ.get("VF_SHEET_CACHE_DIR", DEFAULT_CACHE_DIR)
+    max_mb = config.get("sheetCacheMaxMB") or float(os.environ.get("VF_SHEET_CACHE_MAX_MB", DEFAULT_MAX_MB))
+    key = (os.path.abspath(directory), int(max_mb * 1024 * 1024))
+    if key not in _caches:
+        _caches[key] = SheetCache(directory, key[1])
+    return _caches[key]
+
+
+def print_stats(cache):
+    entries = cache.entries()
+    total = sum(size for _p, size, _t, _h in entries)
+    print(f"Sheet cache: {cache.directory}")
+    print(f"  entries : {len(entries)}")
+    print(f"  size    : {total / 1048576:.1f} MB of {cache.max_bytes / 1048576:.0f} MB cap")
+    for _path, size, last_used, header in reversed(entries):
+        used = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_used))
+        state, region = header.get("state"), header.get("region")
+        if state == SHEET_GRID:
+            where = f"{header.get('sheet')} [whole sheet]"
+        elif state:
+            where = f"{header.get('sheet')} ({state})"
+        else:
+            where = f"{header.get('sheet')} [{','.join(map(str, region)) if region else 'used range'}]"
+        print(f"  {size / 1024:8.1f} KB  {used}  {os.path.basename(header.get('source', '?'))} / {where}")
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "clear"):
+        print("Usage: python sheet_cache.py stats|clear")
+        sys.exit(1)
+
+    cache = sheet_cache_from_config({})
+    if cache is None:
+        print("Sheet cache is disabled (VF_SHEET_CACHE).")
+        return
+    if sys.argv[1] == "stats":
+        print_stats(cache)
+    else:
+        print(f"Removed {cache.clear()} cache entries from {cache.directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Reading a sheet region with its merged cells resolved, shared by
+excel_to_sqlite.py and excel_to_postgres.py.
+
+'streaming' opens the workbook read_only=True, so rows are parsed only up to
+the region's last row. Read-only sheets don't expose merged_cells; their
+<mergeCell> tags are read from the raw sheet XML through openpyxl's private
+ReadOnlyWorksheet._get_source(). open_workbook() only relies on it for the
+openpyxl versions in SOURCE_API_VERSIONS and otherwise falls back to the
+edit-mode ('full') load, which has ws.merged_cells.
+"""
+import re
+from collections import deque
+from itertools import islice
+
+import openpyxl
+from openpyxl.utils import range_boundaries
+from openpyxl.worksheet._read_only import ReadOnlyWorksheet
+
+from build_stats import stage
+
+# openpyxl versions [from, to) whose ReadOnlyWorksheet._get_source() returns the sheet XML stream
+SOURCE_API_VERSIONS = ((2, 6), (4, 0))
+
+
+class MergedCellIndex:
+    """
+    Read-side resolver for merged cells: answers "what value does this cell show"
+    (the top-left value of its merged range) while rows stream past, without
+    unmerging the sheet or writing any cell.
+
+    The index is built once from the sheet's merged ranges, sorted by starting
+    row. resolve() sweeps it row by row: a range becomes active on its first
+    row (where its top-left value is captured) and is retired after its last
+    row, so each row only looks at the column intervals active on that row.
+    """
+
+    def __init__(self, ranges, verbose=False):
+        # (min_col, min_row, max_col, max_row), 1-based, like range_boundaries()
+        self.ranges = sorted(ranges, key=lambda b: (b[1], b[0]))
+        self.verbose = verbose
+
+    def touching(self, min_row, max_row, min_col, max_col):
+        """
+        Returns the index restricted to ranges that intersect the given window (1-based).
+        """
+        return MergedCellIndex(
+            [b for b in self.ranges
+             if b[1] <= max_row and b[3] >= min_row and b[0] <= max_col and b[2] >= min_col],
+            self.verbose,
+        )
+
+    def read_origin(self, min_row, min_col):
+        """
+        Widens a window's top-left corner so it includes the top-left cell of
+        every range in the index => (first_row, first_col), 1-based.
+        """
+        first_row = min([min_row] + [b[1] for b in self.ranges])
+        first_col = min([min_col] + [b[0] for b in self.ranges])
+        return first_row, first_col
+
+    def resolve(self, rows, first_row, first_col):
+        """
+        Takes an iterable of row value lists starting at sheet row 'first_row' /
+        column 'first_col' and yields them with every merged cell filled in place.
+        The top-left cell of each range must be inside the rows (see read_origin).
+        """
+        pending = deque(self.ranges)
+        active = []  # (lo, hi, max_row, value) => row[lo:hi] shows value
+        row_num = first_row
+        for row in rows:
+            if active:
+                active = [a for a in active if a[2] >= row_num]
+
+            # ranges starting on this row => capture their top-left value
+            while pending and pending[0][1] <= row_num:
+                min_col, min_row, max_col, max_row = pending.popleft()
+                lo = min_col - first_col
+                hi = min(max_col - first_col + 1, len(row))
+                value = row[lo] if min_row == row_num else None
+                if self.verbose:
+                    print(f"Merged range ({min_row},{min_col})..({max_row},{max_col}) => top-left value {value!r}")
+                active.append((lo, hi, max_row, value))
+
+            for lo, hi, _max_row, value in active:
+                row[lo:hi] = [value] * (hi - lo)
+
+            yield row
+            row_num += 1
+
+
+def openpyxl_version():
+    return tuple(int(p) for p in re.findall(r"\d+", openpyxl.__version__)[:2])
+
+def source_api_available():
+    """True when read-only sheets can be scanned for <mergeCell> tags (see module docstring)."""
+    lo, hi = SOURCE_API_VERSIONS
+    return lo <= openpyxl_version() < hi and callable(getattr(ReadOnlyWorksheet, "_get_source", None))
+
+def open_workbook(excel_file, read_mode="streaming"):
+    """
+    The workbook opened read_only=True for 'streaming', in edit mode for 'full'
+    (legacy load, also the fallback when source_api_available() is False).
+    """
+    read_only = read_mode != "full" and source_api_available()
+    return openpyxl.load_workbook(excel_file, read_only=read_only, data_only=True, keep_links=False)
+
+# In the sheet XML the merges come after <sheetData> (CT_Worksheet is a
+# sequence), so the cell data has to be passed over, but only with a substring
+# search; the tag regex runs from </sheetData> on and the scan stops at
+# </mergeCells>. (Elements that follow <mergeCells> in the sequence can't end
+# it early: customSheetViews nests pageMargins etc. before it.)
+SHEET_DATA_END_RX = re.compile(rb"</(?:\w+:)?sheetData>|<(?:\w+:)?sheetData\s*/>")
+MERGE_CELL_RX = re.compile(rb'<(?:\w+:)?mergeCell\b[^>]*?\bref="([A-Za-z]+\d+:[A-Za-z]+\d+)"')
+MERGES_END_RX = re.compile(rb"</(?:\w+:)?mergeCells>")
+SCAN_CHUNK = 1 << 20
+SCAN_TAIL = 512
+
+def sheet_data_end(buf):
+    """Offset just past </sheetData> (or <sheetData/>) in buf, or None; only 'sheetData' hits are matched."""
+    i = buf.find(b"sheetData")
+    while i != -1:
+        lt = buf.rfind(b"<", max(0, i - 64), i)
+        m = SHEET_DATA_END_RX.match(buf, lt) if lt != -1 else None
+        if m:
+            return m.end()
+        i = buf.find(b"sheetData", i + 1)
+    return None
+
+def read_merged_ranges(ws):
+    """
+    Returns the merged ranges of a worksheet as (min_col, min_row, max_col, max_row),
+    1-based, like range_boundaries(). Read-only sheets are scanned in chunks
+    (see above), so the sheet XML is never held in memory at once.
+    """
+    if hasattr(ws, "merged_cells"):
+        return [range_boundaries(r.coord) for r in ws.merged_cells.ranges]
+
+    ranges = []
+    buf = b""
+    in_sheet_data = True
+    with ws._get_source() as src:
+        while True:
+            chunk = src.read(SCAN_CHUNK)
+            if not chunk:
+                break
+            buf += chunk
+            if in_sheet_data:
+                end = sheet_data_end(buf)
+                if end is None:
+                    buf = buf[-SCAN_TAIL:]  # the tag may straddle chunks
+                    continue
+                in_sheet_data = False
+                buf = buf[end:]
+            end = MERGES_END_RX.search(buf)
+            last_end = 0
+            for m in MERGE_CELL_RX.finditer(buf, 0, end.start() if end else len(buf)):
+                ranges.append(range_boundaries(m.group(1).decode("ascii")))
+                last_end = m.end()
+            if end:
+                break
+            # keep a small tail in case a tag straddles the chunk boundary
+            buf = buf[max(last_end, len(buf) - SCAN_TAIL):]
+    return ranges
+
+def sheet_bounds(ws, region_tuple):
+    """
+    Returns the 0-based (sc, sr, ec, er) bounds to read: the region if given,
+    else the worksheet's used range.
+    """
+    if region_tuple:
+        return region_tuple
+    if ws.max_row is None or ws.max_column is None:
+        ws.calculate_dimension(force=True)
+    return (ws.min_column - 1, ws.min_row - 1, ws.max_column - 1, ws.max_row - 1)
+
+def iter_sheet_region(ws, region_tuple, verbose_merges=False):
+    """
+    Iterator over the rows of the region (or the used range) of an open
+    worksheet, parsed as they are taken, with merged cells resolved through
+    MergedCellIndex. The merged ranges are read up front.
+
+    Works for read-only and edit-mode sheets alike: rows come from
+    iter_rows(values_only=True), so on a read-only sheet the XML is not parsed
+    past the last row taken. If a merged range starts above/left of the
+    region, the read window is widened to include its top-left cell, then cut
+    back to the region.
+    """
+    sc, sr, ec, er = sheet_bounds(ws, region_tuple)
+
+    with stage("merged_ranges") as s:
+        merges = MergedCellIndex(read_merged_ranges(ws), verbose_merges).touching(sr + 1, er + 1, sc + 1, ec + 1)
+        s["rows_out"] = len(merges.ranges)
+    first_row, first_col = merges.read_origin(sr + 1, sc + 1)
+    width = ec + 2 - first_col
+    n_rows = er + 2 - first_row
+
+    def window_rows():
+        count = 0
+        for row in ws.iter_rows(min_row=first_row, max_row=er + 1,
+                                min_col=first_col, max_col=ec + 1, values_only=True):
+            count += 1
+            yield list(row) if row else [None] * width
+        # read-only mode doesn't pad rows missing at the end of the sheet
+        for _ in range(count, n_rows):
+            yield [None] * width
+
+    # cut the window back to the region; merged cells are filled while the rows stream
+    off_r = sr + 1 - first_row
+    off_c = sc + 1 - first_col
+    resolved = islice(merges.resolve(window_rows(), first_row, first_col), off_r, None)
+    return (row_cells[off_c:] for row_cells in resolved)
+
+def read_sheet_region(ws, region_tuple, verbose_merges=False):
+    """iter_sheet_region as a list of row lists."""
+    rows = iter_sheet_region(ws, region_tuple, verbose_merges)
+    with stage("read_rows") as s:
+        all_rows = list(rows)
+        s["rows_out"] = len(all_rows)
+    return all_rows
+
+def read_sheet_regions(ws, region_tuples, verbose_merges=False):
+    """
+    Reads several regions of one open worksheet in a single pass: the bounding
+    box of all of them is read (and merge-resolved) once, then each region is
+    sliced out of it. Returns one list of row lists per region, in order -
+    the same rows read_sheet_region would return for each region on its own.
+    """
+    bounds = [sheet_bounds(ws, rt) for rt in region_tuples]
+    union = (min(b[0] for b in bounds), min(b[1] for b in bounds),
+             max(b[2] for b in bounds), max(b[3] for b in bounds))
+    union_rows = read_sheet_region(ws, union, verbose_merges)
+
+    out = []
+    for sc, sr, ec, er in bounds:
+        c0, c1 = sc - union[0], ec - union[0] + 1
+        out.append([row[c0:c1] for row in union_rows[sr - union[1]:er - union[1] + 1]])
+    return out
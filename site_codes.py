@@ -0,0 +1,95 @@
+"""
+Site-code expansion for the post-processing scripts: one composite key such
+as 'ABC01-05', 'X, Y & Z' or 'ABC01/02/07' becomes the list of site codes it
+stands for.
+
+    expand_site_codes(key)      JSON array of the site codes of one key,
+                                to be exploded with json_each()
+
+It replaces the recursive-CTE splitter that vfsites.sql.post and
+vfbridge.sql.post used to run, with the same results:
+
+  - ',', '&' and '/' (with surrounding blanks) separate pieces; a trailing
+    empty piece is dropped, empty pieces in the middle are kept
+  - 'PREFIX<start>-<end>' is a numeric range, expanded for the numbers of
+    1..50 inside it, each zero-padded to the width of <start>
+  - 'PREFIX<digits>' keeps the width of its digits; a bare number takes
+    the prefix and width of the last code before it that had a prefix
+    ('ABC01, 2, 3' => ABC01, ABC02, ABC03; 'ABC8-12, 5' => ..., ABC12, ABC05)
+
+Each key is parsed once, in a single pass over its pieces, so the cost
+grows with the key length instead of with the number of delimiters times
+the number of rows of the recursive CTE.
+"""
+import json
+import re
+from functools import lru_cache
+
+KEY_MEMO_SIZE = 4096
+
+# Range numbers outside RANGE_MIN..RANGE_MAX are not expanded (the SQL
+# version joined ranges against a 1..50 number series).
+RANGE_MIN = 1
+RANGE_MAX = 50
+
+# CAST(x AS INT) saturates at the int64 bounds; the padding below follows it.
+SQLITE_INT_MAX = 2 ** 63 - 1
+
+DELIMITER_RX = re.compile(r"\s*[,&/]+\s*", re.ASCII)
+RANGE_RX = re.compile(r"^(.*?)(\d+)\s*[-/]\s*(\d+)$", re.ASCII)
+PREFIXED_RX = re.compile(r"^([^0-9]+)(\d+)$", re.ASCII)
+DIGITS_RX = re.compile(r"^[0-9]+$")
+
+
+def sqlite_int(digits):
+    return min(int(digits), SQLITE_INT_MAX)
+
+def split_pieces(key):
+    """The key's pieces, in order; only a trailing empty piece is dropped."""
+    pieces = DELIMITER_RX.sub(";", key).split(";")
+    if len(pieces) > 1 and pieces[-1] == "":
+        pieces.pop()
+    return pieces
+
+def expand_piece(piece):
+    """A piece with its numeric range (if any) expanded."""
+    m = RANGE_RX.search(piece)
+    if not m:
+        return [piece]
+    prefix, start, end = m.groups()
+    first = max(sqlite_int(start), RANGE_MIN)
+    last = min(sqlite_int(end), RANGE_MAX)
+    return [f"{prefix}{n:0{len(start)}d}" for n in range(first, last + 1)]
+
+@lru_cache(maxsize=KEY_MEMO_SIZE)
+def site_codes(key):
+    """Tuple of the distinct site codes of one key, in key order. NULL => (None,)."""
+    if key is None:
+        return (None,)
+    codes = []
+    active_prefix = active_width = None
+    for piece in split_pieces(str(key)):
+        next_active = None
+        for expanded in expand_piece(piece):
+            m = PREFIXED_RX.search(expanded)
+            if m:
+                prefix, digits = m.groups()
+                codes.append(f"{prefix}{sqlite_int(digits):0{len(digits)}d}")
+                next_active = (prefix, len(digits))  # a range's last code sets the width
+            elif active_prefix is not None and DIGITS_RX.search(expanded):
+                codes.append(f"{active_prefix}{sqlite_int(expanded):0{active_width}d}")
+            else:
+                codes.append(expanded)
+        if next_active is not None:
+            active_prefix, active_width = next_active
+    return tuple(dict.fromkeys(codes))
+
+def expand_site_codes(key):
+    return json.dumps(site_codes(key))
+
+def register_site_code_functions(conn):
+    """Registers expand_site_codes() on a sqlite3 connection."""
+    conn.create_function("expand_site_codes", 1, expand_site_codes, deterministic=True)
+
+def cache_info():
+    return {"keys": site_codes.cache_info()}
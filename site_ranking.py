@@ -0,0 +1,279 @@
+"""
+Multi-criteria site ranking over a built database (build_everything.sh).
+
+load_site_features() reads the capacity, space, Opex and lease features of
+every vfsites site into one column-oriented NumPy matrix (NaN = no value),
+once. rank_sites() then scores the sites for a set of weights and
+constraints and returns the top N, without sorting all of them:
+
+    features = load_site_features("output.db", year=2024)
+    top = rank_sites(features,
+                     weights={"remaining_power_capacity_in_kw": 2, "free_sections": 1,
+                              "total_cost_in_k_gbp": -1},
+                     constraints={"remaining_power_capacity_in_kw": (50, None)},
+                     top_n=20)
+
+Scoring: each weighted feature is min-max normalised over the sites that
+pass the constraints; the score is the weighted sum. A negative weight
+ranks low values first (costs). A site without a value for a weighted
+feature counts as the worst site on it; it fails any constraint on it
+(as NULL does in the endpoints' filters). Ties are broken by site code.
+
+The features follow the joins of vf/sites/combined.sql; where a site
+matches several capacity / space rows, the largest value is kept.
+
+Usage:
+    python site_ranking.py <sqlite_db> --weights feature=weight[,...] [--min feature=value[,...]]
+        [--max feature=value[,...]] [--top 20] [--year 2024] [--months 1-12] [--repeat 1000]
+"""
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from db_snapshot import open_snapshot
+from sqlite_regexp import register_regexp_functions
+
+DEFAULT_YEAR = 2024
+DEFAULT_TOP_N = 20
+
+CAPACITY_FEATURES = ("remaining_power_capacity_in_kw", "running_load_in_kw",
+                     "total_allocated_in_kw", "remaining_power_80_of_n_in_kw")
+SPACE_FEATURES = ("free_sections", "free_sections_percentage", "total_sections",
+                  "free_sections_area", "location_free_area")
+OPEX_FEATURES = ("total_cost_in_k_gbp",)
+LEASE_FEATURES = ("days_until_lease_end", "lease_at_risk")
+FEATURES = CAPACITY_FEATURES + SPACE_FEATURES + OPEX_FEATURES + LEASE_FEATURES
+
+# One query, one row per vfsites site (NULL = no value), columns in FEATURES
+# order. The CTEs follow the joins of vf/sites/combined.sql. 'sites' and
+# 'space_rows' are materialised so the site / space keys (and the Python
+# regexp_replace) are computed once per row, not once per pair the space
+# join compares.
+FEATURES_SQL = """
+WITH sites AS MATERIALIZED (
+    SELECT DISTINCT site_code, UPPER(TRIM(site_code)) AS site,
+        UPPER(TRIM(regexp_replace(site_code, ' (.*)', ''))) AS code
+    FROM vfsites
+    WHERE site_code IS NOT NULL
+),
+capacity AS (
+    SELECT site_code, MAX(remaining) AS remaining, MAX(running) AS running,
+        MAX(allocated) AS allocated, MAX(remaining_80) AS remaining_80
+    FROM (
+        SELECT s.site_code, c.remaining_power_capacity_in_kw AS remaining, c.running_load_in_kw AS running,
+            c.total_allocated_in_kw AS allocated, c.remaining_power_80_of_n_in_kw AS remaining_80
+        FROM vfsites s
+            INNER JOIN vf_fixed_capacity_site c
+                ON c.area_code_key = trim(replace(replace(upper(s.site_code), '(GROUND FLOOR)', ''), 'ROOM', ''))
+        WHERE s.site_type NOT IN ('MTX', 'LTC')
+        UNION ALL
+        SELECT s.site_code, c.remaining_power_capacity_in_kw, c.running_load_in_kw,
+            c.total_allocated_in_kw, c.remaining_power_80_of_n_in_kw
+        FROM vfsites s
+            INNER JOIN vf_mobile_capacity_site c
+                ON s.site_code = c.mtx
+                OR (s.site_code NOT IN ('XGL001 (BMGMTX)', 'BKLN06') AND s.site_name = c.mtx_site_name)
+        WHERE s.site_type IN ('MTX', 'LTC')
+    )
+    GROUP BY site_code
+),
+-- the space join of combined_with_space; 'code' is the site code up to its first blank
+space_rows AS MATERIALIZED (
+    SELECT UPPER(TRIM(gen_site_code)) AS gen, UPPER(TRIM(site_code)) AS site, free_sections,
+        free_section_percentage, total_sections, free_sections_area, location_free_area
+    FROM vf_space_site
+),
+space AS (
+    SELECT s.site_code, MAX(sb.free_sections) AS free_sections,
+        MAX(sb.free_section_percentage) * 100 AS free_sections_percentage, MAX(sb.total_sections) AS total_sections,
+        MAX(sb.free_sections_area) AS free_sections_area, MAX(sb.location_free_area) AS location_free_area
+    FROM sites s
+        INNER JOIN space_rows sb
+            ON (sb.gen IS NOT NULL AND (s.site = sb.gen OR s.code = sb.gen))
+            OR ((sb.gen IS NULL OR (s.site != sb.gen AND s.code != sb.gen))
+                AND (s.site = sb.site
+                    OR (s.code = sb.site AND sb.site != 'BKLN05' AND s.site != 'BKLN05 EXT ROOM')))
+    GROUP BY s.site_code
+),
+-- a site without any Opex reading (every month imputed) has no cost, not 0
+opex AS (
+    SELECT site_code, CASE WHEN MIN(imputed) = 1 THEN NULL ELSE SUM(cost_k_gbp) END AS total_cost
+    FROM vf_site_month_opex
+    WHERE year = :year AND month BETWEEN :min_month AND :max_month
+    GROUP BY site_code
+),
+-- combined_with_ownership_codes_unique_records: the current (started) lease
+-- with the latest end, then the latest start, per site
+lease AS (
+    SELECT site_code, julianday(lease_end) - julianday(:now) AS days_until_lease_end,
+        CASE WHEN upper(trim(at_risk)) = 'AT RISK' THEN 1 ELSE 0 END AS lease_at_risk
+    FROM (
+        SELECT site_code, at_risk, lease_end,
+            ROW_NUMBER() OVER (PARTITION BY site_code ORDER BY lease_end DESC, lease_start DESC) AS rn
+        FROM (
+            SELECT s.site_code, o.at_risk, o.lease_start, o.lease_end
+            FROM vfsites s
+                INNER JOIN vfbridge b ON upper(trim(b.site_code)) = upper(trim(s.site_code))
+                INNER JOIN ownership o
+                    ON o.property_reference_2 = regexp_replace(b.bridge_site_code, '(.*)\\_', '')
+                    AND upper(trim(o.business_division)) = 'TECHNOLOGY'
+            UNION
+            SELECT s.site_code, o.at_risk, o.lease_start, o.lease_end
+            FROM vfsites s
+                INNER JOIN ownership o
+                    ON s.postcode = o.postcode AND upper(trim(o.business_division)) = 'TECHNOLOGY'
+        )
+        WHERE lease_start <= :now
+    )
+    WHERE rn = 1
+)
+SELECT s.site_code,
+    c.remaining, c.running, c.allocated, c.remaining_80,
+    sp.free_sections, sp.free_sections_percentage, sp.total_sections, sp.free_sections_area, sp.location_free_area,
+    o.total_cost,
+    l.days_until_lease_end, l.lease_at_risk
+FROM sites s
+    LEFT JOIN capacity c ON c.site_code = s.site_code
+    LEFT JOIN space sp ON sp.site_code = s.site_code
+    LEFT JOIN opex o ON o.site_code = s.site_code
+    LEFT JOIN lease l ON l.site_code = s.site_code
+ORDER BY s.site_code
+"""
+
+class SiteFeatures:
+    """The feature matrix of all sites: matrix[i, column[name]] is site_codes[i]'s value."""
+
+    def __init__(self, site_codes, matrix):
+        self.site_codes = np.array(site_codes, dtype=object)
+        self.matrix = np.asfortranarray(matrix)     # column-oriented: one feature is contiguous
+        self.column = {name: j for j, name in enumerate(FEATURES)}
+
+    def values(self, name):
+        if name not in self.column:
+            raise ValueError(f"unknown feature '{name}' (one of: {', '.join(FEATURES)})")
+        return self.matrix[:, self.column[name]]
+
+def load_site_features(db_path, year=DEFAULT_YEAR, min_month=1, max_month=12, now=None):
+    """Reads the features of every vfsites site; Opex is summed over min_month..max_month of 'year'."""
+    now = (now or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    conn = open_snapshot(db_path)
+    register_regexp_functions(conn)
+    rows = conn.execute(FEATURES_SQL, {"year": year, "min_month": min_month, "max_month": max_month,
+                                       "now": now}).fetchall()
+    conn.close()
+    site_codes = [code for code, *_values in rows]
+    matrix = np.array([values for _code, *values in rows], dtype=float).reshape(len(rows), len(FEATURES))
+    return SiteFeatures(site_codes, matrix)
+
+def candidate_mask(features, constraints):
+    """Sites passing every (minimum, maximum) constraint; None = unbounded, NaN fails."""
+    mask = np.ones(len(features.site_codes), dtype=bool)
+    for name, (lo, hi) in (constraints or {}).items():
+        values = features.values(name)
+        with np.errstate(invalid="ignore"):
+            if lo is not None:
+                mask &= values >= lo
+            if hi is not None:
+                mask &= values <= hi
+    return mask
+
+def scores(features, weights, rows):
+    """Weighted sum of the min-max normalised features of the given rows."""
+    total = np.zeros(len(rows))
+    for name, weight in weights.items():
+        values = features.values(name)[rows]
+        present = ~np.isnan(values)
+        if weight == 0 or not present.any():
+            continue
+        lo, hi = values[present].min(), values[present].max()
+        normalised = (values - lo) / (hi - lo) if hi > lo else np.where(present, 1.0, np.nan)
+        # no value => the worst site on this feature
+        total += weight * np.where(present, normalised, 0.0 if weight > 0 else 1.0)
+    return total
+
+def top_rows(score, n):
+    """
+    Indexes of the n best scores, best first, ties by index - that is by site
+    code, as site_codes and the candidate rows are both sorted. The index is
+    the imaginary part of the argpartition key (complex values order by real,
+    then imaginary part), so tied sites need no extra pass; only the n picked
+    are sorted.
+    """
+    key = -score + 1j * np.arange(len(score))
+    best = np.argpartition(key, n - 1)[:n] if n < len(score) else np.arange(len(score))
+    return best[np.argsort(key[best])]
+
+def rank_sites(features, weights, constraints=None, top_n=DEFAULT_TOP_N):
+    """[(site_code, score, {feature: value})] of the top_n sites, best first."""
+    rows = np.flatnonzero(candidate_mask(features, constraints))
+    if not len(rows) or top_n <= 0:
+        return []
+    score = scores(features, weights, rows)
+    codes = features.site_codes[rows]
+    shown = list(dict.fromkeys(list(weights) + list(constraints or {})))
+    ranked = []
+    for i in top_rows(score, top_n):
+        row = rows[i]
+        ranked.append((codes[i], float(score[i]),
+                       {name: features.matrix[row, features.column[name]] for name in shown}))
+    return ranked
+
+def parse_pairs(text, cast=float):
+    """'a=1,b=-2' => {'a': 1.0, 'b': -2.0}."""
+    pairs = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _sep, value = item.partition("=")
+        pairs[name.strip()] = cast(value)
+    return pairs
+
+def main():
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--weights", "--min", "--max", "--top", "--year", "--months", "--repeat"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    if not args or "--weights" not in options:
+        print(__doc__)
+        sys.exit(1)
+
+    weights = parse_pairs(options["--weights"])
+    constraints = {}
+    for name, value in parse_pairs(options.get("--min", "")).items():
+        constraints[name] = (value, None)
+    for name, value in parse_pairs(options.get("--max", "")).items():
+        constraints[name] = (constraints.get(name, (None, None))[0], value)
+    top_n = int(options.get("--top", DEFAULT_TOP_N))
+    min_month, _sep, max_month = options.get("--months", "1-12").partition("-")
+
+    t0 = time.perf_counter()
+    features = load_site_features(args[0], int(options.get("--year", DEFAULT_YEAR)),
+                                  int(min_month), int(max_month or min_month))
+    print(f"Loaded {len(features.site_codes)} sites x {len(FEATURES)} features in {time.perf_counter() - t0:.3f}s")
+
+    try:
+        t0 = time.perf_counter()
+        ranked = rank_sites(features, weights, constraints, top_n)
+        first_ms = (time.perf_counter() - t0) * 1000
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    shown = list(dict.fromkeys(list(weights) + list(constraints)))
+    print(f"{'#':>3} {'site_code':<20} {'score':>8} " + " ".join(f"{name[:22]:>22}" for name in shown))
+    for n, (code, score, values) in enumerate(ranked, 1):
+        print(f"{n:>3} {code:<20} {score:>8.4f} " + " ".join(f"{values[name]:>22.2f}" for name in shown))
+    print(f"{len(ranked)} site(s) ranked in {first_ms:.2f}ms")
+
+    repeat = int(options.get("--repeat", 0))
+    if repeat:
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            rank_sites(features, weights, constraints, top_n)
+        print(f"{repeat} re-rankings: {(time.perf_counter() - t0) * 1000 / repeat:.3f}ms each")
+
+if __name__ == "__main__":
+    main()
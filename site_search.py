@@ -0,0 +1,44 @@
+"""
+Trigrams for the substring filters of the endpoints (site_name, address,
+comments, power_resilience: 'upper(col) ILIKE %term%').
+
+    search_trigrams(text)   JSON array of the distinct trigrams of the
+                            upper-cased text, to be exploded with json_each()
+
+sqlite/vfsites_search.sql.post writes them to vfsites_trigram, indexed on
+(field, trigram). A row can only contain a term if it has every trigram of
+the term, so the templates look the candidate sites up there and keep the
+ILIKE for the final word; terms shorter than 3 characters or holding LIKE
+wildcards are matched by the ILIKE alone.
+
+SQLite's upper() folds ASCII only; fold() upper-cases like the endpoints'
+upper() does, one character for one, so positions line up.
+"""
+import json
+from functools import lru_cache
+
+TRIGRAM = 3
+TEXT_MEMO_SIZE = 4096
+
+
+def fold(text):
+    """Upper-cased, one character per character (a character whose upper case is longer is kept)."""
+    return "".join(u if len(u) == 1 else c for c, u in ((c, c.upper()) for c in text))
+
+@lru_cache(maxsize=TEXT_MEMO_SIZE)
+def trigrams(text):
+    """Tuple of the distinct trigrams of the folded text, in text order. NULL / short => ()."""
+    if text is None:
+        return ()
+    folded = fold(str(text))
+    return tuple(dict.fromkeys(folded[i:i + TRIGRAM] for i in range(len(folded) - TRIGRAM + 1)))
+
+def search_trigrams(text):
+    return json.dumps(trigrams(text))
+
+def register_search_functions(conn):
+    """Registers search_trigrams() on a sqlite3 connection."""
+    conn.create_function("search_trigrams", 1, search_trigrams, deterministic=True)
+
+def cache_info():
+    return {"texts": trigrams.cache_info()}
@@ -0,0 +1,266 @@
+"""
+Dependency-aware execution of the post-processing scripts (sqlite/*.sql.post)
+for apply_sql_scripts.py.
+
+The DAG comes from what each script writes (CREATE TABLE / INSERT INTO /
+UPDATE / DELETE FROM / DROP TABLE / CREATE INDEX ON targets) and reads (the
+known table names in its statements, comments and string literals left out):
+a script depends on every script before it in name order that writes a table
+it reads or writes, or reads a table it writes. Any order the DAG allows thus
+builds the same tables as name order. TEMP tables belong to the script that
+creates them.
+
+With more than one worker, scripts whose dependencies are done run
+concurrently, each in a worker process on its own scratch database with the
+build database attached read-only. When a script finishes, its tables and
+indexes are copied into the build database (in WAL mode meanwhile, so the copy
+doesn't wait for the readers) and its dependents can start. With one worker
+the scripts run in name order on the build database itself.
+
+Statements run one at a time, so a failure names the script, line and
+statement; the first one stops the run (nothing more is started or merged).
+"""
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from build_indexes import LEADING_COMMENTS_RX, split_statements
+from build_stats import BUILD_STATS_TABLE, adopt, recording, stage
+from site_codes import register_site_code_functions
+from site_search import register_search_functions
+from sqlite_regexp import register_regexp_functions
+
+WRITE_RX = re.compile(
+    r'\b(?:CREATE\s+(?:TEMP\s+|TEMPORARY\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?|INSERT\s+(?:OR\s+\w+\s+)?INTO\s+|'
+    r'UPDATE\s+(?:OR\s+\w+\s+)?|DELETE\s+FROM\s+|DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?|'
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?"?\w+"?\s+ON\s+)"?(\w+)"?', re.IGNORECASE)
+TEMP_RX = re.compile(r'\bCREATE\s+(?:TEMP|TEMPORARY)\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?"?(\w+)"?', re.IGNORECASE)
+CREATE_RX = re.compile(r'\bCREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?"?(\w+)"?', re.IGNORECASE)
+DROP_RX = re.compile(r'\bDROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?"?(\w+)"?', re.IGNORECASE)
+NOISE_RX = re.compile(r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'", re.DOTALL)
+WORD_RX = re.compile(r"[A-Za-z_]\w*")
+
+
+def register_functions(conn, extension_path=None, verbose=True):
+    """The SQL functions the scripts use; the regexp extension replaces the built-in REGEXP when it loads."""
+    register_regexp_functions(conn)                            # built-in REGEXP functions (sqlite_regexp.py)
+    register_site_code_functions(conn)                         # expand_site_codes() (site_codes.py)
+    register_search_functions(conn)                            # search_trigrams() (site_search.py)
+
+    # The nalgeon/regexp extension is optional: when it's given and this Python's
+    # sqlite3 can load extensions, its functions replace the built-in ones.
+    if not extension_path:
+        if verbose:
+            print("Using built-in regexp functions.")
+        return
+    try:
+        conn.enable_load_extension(True)
+        conn.load_extension(os.path.abspath(extension_path))
+        conn.enable_load_extension(False)
+        if verbose:
+            print(f"Using regexp extension {extension_path}")
+    except (AttributeError, sqlite3.OperationalError) as e:
+        if verbose:
+            print(f"Regexp extension not loaded ({e}); using built-in regexp functions.")
+
+def list_scripts(sql_dir):
+    """*.sql and *.sql.post of sql_dir, in name order."""
+    return sorted(list(sql_dir.glob("*.sql")) + list(sql_dir.glob("*.sql.post")), key=lambda p: p.name)
+
+def analyze_script(path):
+    """
+    {'name', 'path', 'statements', 'writes', 'creates', 'drops', 'temps', 'words'} of one script;
+    'words' are all identifiers outside comments and literals (reads are those naming tables).
+    """
+    statements = split_statements(path.read_text(encoding="utf-8"))
+    text = NOISE_RX.sub(" ", "".join(s for _line, s in statements))
+    temps = set(TEMP_RX.findall(text))
+    return {
+        "name": path.name,
+        "path": str(path),
+        "statements": statements,
+        "writes": set(WRITE_RX.findall(text)) - temps,
+        "creates": set(CREATE_RX.findall(text)) - temps,
+        "drops": set(DROP_RX.findall(text)) - temps,
+        "temps": temps,
+        "words": set(WORD_RX.findall(text)) - temps,
+    }
+
+def script_graph(scripts, source_tables=()):
+    """
+    Fills each script's 'reads' (tables among its words) and returns
+    {name: {earlier name: tables linking them}}, the scripts it depends on.
+    """
+    known = set(source_tables).union(*(s["writes"] for s in scripts))
+    for s in scripts:
+        s["reads"] = (s["words"] & known) - s["writes"]
+    deps = {}
+    for j, later in enumerate(scripts):
+        deps[later["name"]] = {}
+        for earlier in scripts[:j]:
+            linked = (later["reads"] | later["writes"]) & earlier["writes"] | later["writes"] & earlier["reads"]
+            if linked:
+                deps[later["name"]][earlier["name"]] = linked
+    return deps
+
+def critical_path(scripts, deps, seconds):
+    """(seconds, [names]) of the longest chain of dependent scripts; a script without timing counts 0."""
+    finish, via = {}, {}
+    for s in scripts:  # name order is a topological order
+        name = s["name"]
+        before = max(deps[name], key=lambda d: finish[d], default=None)
+        finish[name] = (finish[before] if before else 0.0) + seconds.get(name, 0.0)
+        via[name] = before
+    if not finish:
+        return 0.0, []
+    name = max(finish, key=finish.get)
+    total, path = finish[name], []
+    while name:
+        path.append(name)
+        name = via[name]
+    return total, path[::-1]
+
+def last_timings(conn):
+    """{script: wall seconds} of the latest apply_sql_scripts run recorded in _build_stats ({} if none)."""
+    try:
+        rows = conn.execute(f'SELECT stage, wall_s FROM "{BUILD_STATS_TABLE}" '
+                            f"WHERE step = 'apply_sql_scripts' AND depth = 0 AND stage != 'merge' ORDER BY rowid").fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return dict(rows)
+
+def print_dag(scripts, deps, seconds):
+    """Scripts with their reads, writes and dependencies, the levels that can run together and the critical path."""
+    level = {}
+    for s in scripts:
+        level[s["name"]] = 1 + max((level[d] for d in deps[s["name"]]), default=-1)
+        print(f"{s['name']}  (level {level[s['name']]}"
+              + (f", {seconds[s['name']]:.2f}s last build" if s["name"] in seconds else "") + ")")
+        print(f"    writes     {', '.join(sorted(s['writes'])) or '-'}")
+        print(f"    reads      {', '.join(sorted(s['reads'])) or '-'}")
+        for dep, tables in deps[s["name"]].items():
+            print(f"    after      {dep}  ({', '.join(sorted(tables))})")
+    print("Levels (scripts in a level can run concurrently):")
+    for n in range(max(level.values(), default=-1) + 1):
+        print(f"  {n}: {', '.join(name for name, lv in level.items() if lv == n)}")
+    total, path = critical_path(scripts, deps, seconds)
+    if seconds:
+        serial = sum(seconds.get(s["name"], 0.0) for s in scripts)
+        print(f"Critical path: {' -> '.join(path)}  ({total:.2f}s of {serial:.2f}s serial, last build)")
+    else:
+        print(f"Critical path: {' -> '.join(critical_path(scripts, deps, {s['name']: 1.0 for s in scripts})[1])}"
+              "  (no timings recorded yet, by script count)")
+
+def run_statements(conn, script):
+    """Runs a script statement by statement; a failure raises RuntimeError naming the script, line and statement."""
+    for line_no, statement in script["statements"]:
+        try:
+            conn.execute(statement)
+        except sqlite3.Error as e:
+            body = LEADING_COMMENTS_RX.sub("", statement, count=1).strip()
+            raise RuntimeError(f"{script['name']}:{line_no}: {e}\n{body}") from None
+
+def table_rows(conn, tables, schema="main"):
+    existing = {name for (name,) in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'")}
+    return sum(conn.execute(f'SELECT COUNT(*) FROM {schema}."{t}"').fetchone()[0] for t in tables & existing)
+
+def run_serial(conn, scripts):
+    """Name order on one connection (the build database)."""
+    conn.isolation_level = None
+    for script in scripts:
+        print(f"→ {script['name']}")
+        # rows_out: rows in the tables the script creates
+        with stage(script["name"], bytes_in=os.path.getsize(script["path"])) as s:
+            run_statements(conn, script)
+            s["rows_out"] = table_rows(conn, script["creates"])
+
+def run_in_scratch(task):
+    """
+    Process-pool worker: one script on scratch database 'scratch_path', with
+    the build database attached read-only as 'src'. Tables the script drops
+    get an empty stand-in in the scratch database first, so the unqualified
+    DROP lands there instead of on 'src'. Returns (name, stages).
+    """
+    db_path, script, scratch_path, extension_path = task
+    with recording() as stages:
+        with stage(script["name"], bytes_in=os.path.getsize(script["path"])) as s:
+            conn = sqlite3.connect(f"file:{scratch_path}", uri=True, isolation_level=None)
+            register_functions(conn, extension_path, verbose=False)
+            conn.execute("ATTACH DATABASE ? AS src", (f"file:{db_path}?mode=ro",))
+            source = {name for (name,) in conn.execute("SELECT name FROM src.sqlite_master WHERE type = 'table'")}
+            for table in script["drops"] & source:
+                conn.execute(f'CREATE TABLE main."{table}" (stand_in INTEGER)')
+            run_statements(conn, script)
+            s["rows_out"] = table_rows(conn, script["creates"])
+            conn.close()
+    return script["name"], stages
+
+def merge_scratch(conn, script, scratch_path):
+    """
+    Copies a script's scratch tables (same DDL, rows in rowid order) and their
+    indexes into the build database, replacing the old ones, in one
+    transaction; tables it dropped without re-creating are dropped too.
+    """
+    conn.execute("ATTACH DATABASE ? AS scratch", (scratch_path,))
+    try:
+        objects = conn.execute("SELECT type, name, tbl_name, sql FROM scratch.sqlite_master "
+                               "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+                               "ORDER BY type = 'table' DESC, rowid").fetchall()
+        tables = [name for kind, name, _t, _sql in objects if kind == "table"]
+        conn.execute("BEGIN")
+        try:
+            for table in (script["drops"] - set(tables)) | set(tables):
+                conn.execute(f'DROP TABLE IF EXISTS main."{table}"')
+            for kind, name, _table, sql in objects:
+                if kind != "table":
+                    conn.execute(f'DROP {kind.upper()} IF EXISTS main."{name}"')
+                conn.execute(sql)  # unqualified => main (looked up before 'scratch')
+                if kind == "table":
+                    conn.execute(f'INSERT INTO main."{name}" SELECT * FROM scratch."{name}" ORDER BY rowid')
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.execute("DETACH DATABASE scratch")
+
+def run_parallel(conn, db_path, scripts, deps, workers, extension_path=None):
+    """
+    Runs every script as soon as the scripts it depends on are merged, on
+    'workers' processes; merges each one into 'conn' (the build database) as it finishes.
+    """
+    conn.isolation_level = None
+    previous_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.execute("PRAGMA journal_mode = WAL")
+    scratch_dir = tempfile.mkdtemp(prefix=".scripts_", dir=os.path.dirname(os.path.abspath(db_path)))
+    by_name = {s["name"]: s for s in scripts}
+    merged, running = set(), {}
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(scripts)))
+    try:
+        while len(merged) < len(scripts):
+            for s in scripts:
+                name = s["name"]
+                if name not in merged and name not in running.values() and all(d in merged for d in deps[name]):
+                    print(f"→ {name}")
+                    scratch_path = os.path.join(scratch_dir, f"{name}.db")
+                    running[pool.submit(run_in_scratch, (db_path, s, scratch_path, extension_path))] = name
+            done, _pending = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                _name, stages = future.result()  # the first failure propagates from here
+                adopt(stages)
+                with stage("merge", script=name) as s:
+                    merge_scratch(conn, by_name[name], os.path.join(scratch_dir, f"{name}.db"))
+                    s["rows_out"] = table_rows(conn, by_name[name]["creates"])
+                merged.add(name)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        conn.execute(f"PRAGMA journal_mode = {previous_mode}")
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def script_seconds(records):
+    """{script: wall seconds} from this run's build stages."""
+    return {r["stage"]: r["wall_s"] for r in records if r["depth"] == 0 and r["stage"] != "merge"}
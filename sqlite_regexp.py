@@ -0,0 +1,80 @@
+"""
+Pure-Python stand-ins for the nalgeon/sqlean `regexp` extension functions
+used by the post-processing scripts, so they run on Python builds whose
+sqlite3 module can't load extensions.
+
+    X REGEXP P  /  regexp(P, X)        1 if P matches somewhere in X
+    regexp_like(X, P)                  same, argument order of sqlean
+    regexp_substr(X, P)                first match of P in X
+    regexp_capture(X, P [, n])         group n (default 0) of the first match
+    regexp_replace(X, P, R)            every match replaced by R ($1..$9 = groups)
+
+NULL in => NULL out. Patterns are compiled with re.ASCII so \\d, \\w, \\s mean
+what they mean in PCRE2 (sqlean's engine).
+
+Compiled patterns sit in a bounded LRU cache, and the last searches are
+memoised on (pattern, text): the three regexp_capture() calls per row that
+vfsites.sql.post makes on the same piece run the regex once.
+"""
+import re
+from functools import lru_cache
+
+PATTERN_CACHE_SIZE = 256
+SEARCH_MEMO_SIZE = 4096
+
+REPLACEMENT_GROUP_RX = re.compile(r"\$(\d)")
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(pattern):
+    return re.compile(pattern, re.ASCII)
+
+@lru_cache(maxsize=SEARCH_MEMO_SIZE)
+def search(pattern, text):
+    return compile_pattern(pattern).search(text)
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def python_replacement(replacement):
+    """sqlean's '$1' group references => re.sub's '\\g<1>' (other backslashes kept literal)."""
+    return REPLACEMENT_GROUP_RX.sub(r"\\g<\1>", replacement.replace("\\", "\\\\"))
+
+def regexp(pattern, text):
+    if pattern is None or text is None:
+        return None
+    return 1 if search(pattern, str(text)) else 0
+
+def regexp_like(text, pattern):
+    return regexp(pattern, text)
+
+def regexp_substr(text, pattern):
+    if pattern is None or text is None:
+        return None
+    m = search(pattern, str(text))
+    return m.group(0) if m else None
+
+def regexp_capture(text, pattern, n=0):
+    if pattern is None or text is None:
+        return None
+    m = search(pattern, str(text))
+    if not m or n is None or not 0 <= n <= m.re.groups:
+        return None
+    return m.group(n)
+
+def regexp_replace(text, pattern, replacement):
+    if pattern is None or text is None:
+        return None
+    if replacement is None:
+        return None
+    return compile_pattern(pattern).sub(python_replacement(replacement), str(text))
+
+def register_regexp_functions(conn):
+    """Registers the functions above on a sqlite3 connection (REGEXP operator included)."""
+    conn.create_function("regexp", 2, regexp, deterministic=True)
+    conn.create_function("regexp_like", 2, regexp_like, deterministic=True)
+    conn.create_function("regexp_substr", 2, regexp_substr, deterministic=True)
+    conn.create_function("regexp_capture", 2, regexp_capture, deterministic=True)
+    conn.create_function("regexp_capture", 3, regexp_capture, deterministic=True)
+    conn.create_function("regexp_replace", 3, regexp_replace, deterministic=True)
+
+def cache_info():
+    return {"patterns": compile_pattern.cache_info(), "searches": search.cache_info()}
@@ -0,0 +1,386 @@
+"""
+Local executor for the vf/*.sql endpoint templates, to load-test and profile
+them without the RAW gateway.
+
+    executor = TemplateExecutor("output.db")
+    columns, rows = executor.execute("vf/sites/capacity.sql", {"network_domain": "mobile"})
+    print(format_stats(executor.stats()))
+
+The built SQLite database is copied once into a DuckDB snapshot file (schema
+'vdf', the endpoint_sql.py macros, an environment.secrets stand-in) that is
+then opened read-only; a pool of connections to it serves the requests.
+
+    - parameters: parsed from the @param/@type/@default headers, coerced to
+      their declared type, defaults filled in
+    - prepared statements: each template (and user blacklist variant) is
+      rewritten for DuckDB and PREPAREd once per pooled connection, then
+      EXECUTEd with the bound values
+    - result cache: LRU of RESULT_CACHE_SIZE entries keyed by (template,
+      normalised parameters, build id)
+    - build id: size and mtime of the SQLite file, checked on every call; a
+      rebuild loads a new snapshot and drops the result cache. The old
+      snapshot's database is closed and its file removed once the last
+      connection borrowed from it is released
+    - latency histograms per template (log buckets, cache hits counted apart)
+
+Usage:
+    python template_executor.py <built.db> <template.sql> [name=value ...] [--repeat 20] [--pool 4]
+                                [--no-result-cache] [--cache-dir DIR]
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import duckdb
+
+from endpoint_sql import (BLACKLIST_GUARD_RX, PARAM_TYPES, blacklisted, cte_query, load_sqlite_database,
+                          parameterize_template, parse_params, prepare_duckdb, sql_literal, to_duckdb)
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+POOL_SIZE = 4
+RESULT_CACHE_SIZE = 256
+
+# upper bounds of the latency buckets, ms (the last one is open)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+TRUE_STRINGS = ("true", "t", "1", "yes", "y")
+
+
+class LatencyHistogram:
+    """Counts of latencies per LATENCY_BUCKETS_MS bucket, with the totals to report from."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total, self.total_s, self.max_s = 0, 0.0, 0.0
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        i = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if ms <= bound), len(LATENCY_BUCKETS_MS))
+        self.counts[i] += 1
+        self.total += 1
+        self.total_s += seconds
+        self.max_s = max(self.max_s, seconds)
+
+    def quantile_ms(self, q):
+        """Upper bound of the bucket holding quantile q (max for the open bucket); None when empty."""
+        if not self.total:
+            return None
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= q * self.total:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_s * 1000
+        return self.max_s * 1000
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "mean_ms": self.total_s * 1000 / self.total if self.total else None,
+            "p50_ms": self.quantile_ms(0.50),
+            "p95_ms": self.quantile_ms(0.95),
+            "p99_ms": self.quantile_ms(0.99),
+            "max_ms": self.max_s * 1000,
+            "buckets": dict(zip([f"<={b}ms" for b in LATENCY_BUCKETS_MS] + ["more"], self.counts)),
+        }
+
+
+def build_id(sqlite_path):
+    """Changes whenever the database file is rebuilt or replaced (a publish swaps in a new inode)."""
+    st = os.stat(sqlite_path)
+    return f"{st.st_ino}-{st.st_size}-{st.st_mtime_ns}"
+
+def coerce_value(value, param_type):
+    """A parameter value (e.g. a query-string text) as the Python value of its declared type."""
+    if value is None:
+        return None
+    duck_type = PARAM_TYPES.get(param_type, "VARCHAR")
+    if duck_type == "BOOLEAN":
+        return value if isinstance(value, bool) else str(value).strip().lower() in TRUE_STRINGS
+    if duck_type in ("INTEGER", "BIGINT"):
+        return int(value)
+    if duck_type == "DOUBLE":
+        return float(value)
+    return str(value)
+
+
+class Template:
+    """One vf/*.sql file: its text and declared parameters, re-read when the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime_ns = os.stat(path).st_mtime_ns
+        with open(path, "r", encoding="utf-8") as f:
+            self.sql = f.read()
+        self.params = parse_params(self.sql)
+        self.blacklist_kinds = tuple(dict.fromkeys(m.group(1) for m in BLACKLIST_GUARD_RX.finditer(self.sql)))
+
+    def bind(self, values):
+        """{name: value} of every declared parameter, coerced, declared default where not given."""
+        values = values or {}
+        unknown = set(values) - set(self.params)
+        if unknown:
+            raise ValueError(f"{self.path}: unknown parameter(s) {', '.join(sorted(unknown))}")
+        return {name: coerce_value(values[name] if name in values else p["default"], p["type"])
+                for name, p in self.params.items()}
+
+    def duckdb_sql(self, guards, cte=None):
+        """
+        (PREPARE-able DuckDB SQL, parameter names) with the blacklist guards
+        resolved to 'guards'; cut after CTE 'cte' when given (see cte_query()).
+        """
+        resolved = dict(zip(self.blacklist_kinds, guards))
+        sql = BLACKLIST_GUARD_RX.sub(lambda m: "true" if resolved[m.group(1)] else "false",
+                                     cte_query(self.sql, cte) if cte else self.sql)
+        sql, names = parameterize_template(sql, self.params)
+        return to_duckdb(sql), names
+
+
+class PooledConnection:
+    """A read-only DuckDB connection and the statements PREPAREd on it."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.prepared = {}   # (template path, mtime, cte, guards) => (statement name, parameter names)
+
+
+class Snapshot:
+    """
+    One snapshot file opened read-only: its idle pooled connections and the
+    number borrowed. A replaced snapshot stays open while any are borrowed;
+    'replaced' also means its file goes when it is closed.
+    """
+
+    def __init__(self, path, pool_size):
+        self.path = path
+        self.db = duckdb.connect(path, read_only=True)
+        self.idle = [PooledConnection(self.db.cursor()) for _ in range(pool_size)]
+        self.borrowed = 0
+        self.replaced = False
+
+    def close_idle(self):
+        for pooled in self.idle:
+            pooled.conn.close()
+        self.idle = []
+
+    def close(self):
+        self.close_idle()
+        self.db.close()
+        if self.replaced and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class TemplateExecutor:
+    def __init__(self, sqlite_path, template_dir=REPO_DIR, pool_size=POOL_SIZE,
+                 result_cache_size=RESULT_CACHE_SIZE, cache_dir=None, secrets=None):
+        self.sqlite_path = os.path.abspath(sqlite_path)
+        self.template_dir = template_dir
+        self.pool_size = pool_size
+        self.result_cache_size = result_cache_size
+        self.cache_dir = cache_dir or tempfile.gettempdir()
+        self.secrets = dict(secrets or {})   # environment.secrets stand-in, {name: secret}
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)   # a pooled connection came back / the pool changed
+        self._templates = {}
+        self._results = OrderedDict()
+        self._histograms = {}
+        self._hits, self._misses = {}, {}
+        self._build_id = None
+        self._snapshot = None
+        self._ensure_current()
+
+    # -- snapshot and pool ---------------------------------------------------
+
+    def snapshot_path(self, current_build_id):
+        key = hashlib.sha1(repr((self.sqlite_path, current_build_id, sorted(self.secrets.items()))).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"vdf_{key[:16]}.duckdb")
+
+    def _write_snapshot(self, path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        duck = duckdb.connect(tmp)
+        load_sqlite_database(self.sqlite_path, duck)
+        prepare_duckdb(duck)
+        if self.secrets:
+            duck.executemany("INSERT INTO environment.secrets VALUES (?, ?)", list(self.secrets.items()))
+        duck.close()
+        os.replace(tmp, path)
+
+    def _ensure_current(self):
+        """Loads a new snapshot and pool when the database was rebuilt since the last call."""
+        current = build_id(self.sqlite_path)
+        if current == self._build_id:
+            return
+        with self._lock:
+            if current == self._build_id:
+                return
+            path = self.snapshot_path(current)
+            t0 = time.perf_counter()
+            if not os.path.exists(path):
+                self._write_snapshot(path)
+                print(f"DuckDB snapshot {path} written in {time.perf_counter() - t0:.2f}s")
+            old = self._snapshot
+            self._snapshot, self._build_id = Snapshot(path, self.pool_size), current
+            self._results.clear()
+            if old is not None:
+                # idle connections to the old snapshot close now; the database
+                # and its file when the last borrowed one is released
+                old.replaced = old.path != path
+                old.close_idle()
+                if not old.borrowed:
+                    old.close()
+            self._released.notify_all()   # waiters take from the new pool
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows an idle connection to the current snapshot, waiting for one
+        to be released if all are out; the snapshot is re-read after every
+        wait, so a waiter moves on to the new pool after a rebuild.
+        """
+        with self._released:
+            while not self._snapshot.idle:
+                self._released.wait()
+            snapshot = self._snapshot
+            pooled = snapshot.idle.pop()
+            snapshot.borrowed += 1
+        try:
+            yield pooled
+        finally:
+            with self._released:
+                snapshot.borrowed -= 1
+                if snapshot is self._snapshot:
+                    snapshot.idle.append(pooled)
+                    self._released.notify()
+                else:
+                    pooled.conn.close()
+                    if not snapshot.borrowed:
+                        snapshot.close()
+
+    # -- templates -----------------------------------------------------------
+
+    def template(self, path):
+        full = path if os.path.isabs(path) else os.path.join(self.template_dir, path)
+        cached = self._templates.get(path)
+        if cached is None or cached.mtime_ns != os.stat(full).st_mtime_ns:
+            cached = self._templates[path] = Template(full)
+        return cached
+
+    def _run(self, pooled, template, path, cte, bound):
+        conn = pooled.conn
+        guards = tuple(not blacklisted(conn, kind, bound.get("userid")) for kind in template.blacklist_kinds)
+        key = (path, template.mtime_ns, cte, guards)
+        if key not in pooled.prepared:
+            sql, names = template.duckdb_sql(guards, cte)
+            name = f"vf_{len(pooled.prepared)}"
+            conn.execute(f"PREPARE {name} AS {sql}")
+            pooled.prepared[key] = (name, names)
+        name, names = pooled.prepared[key]
+        args = ", ".join(sql_literal(bound[n], template.params[n]["type"]) for n in names)
+        cur = conn.execute(f"EXECUTE {name}({args})" if names else f"EXECUTE {name}")
+        return [d[0] for d in cur.description], cur.fetchall()
+
+    def execute(self, path, values=None, use_cache=True, cte=None):
+        """
+        (column names, rows) of one template run with the given parameter
+        values; of its CTE 'cte' when given, for templates DuckDB can't run whole.
+        """
+        t0 = time.perf_counter()
+        self._ensure_current()
+        template = self.template(path)
+        bound = template.bind(values)
+        key = (path, template.mtime_ns, cte, tuple(sorted(bound.items())), self._build_id)
+        with self._lock:
+            result = self._results.get(key) if use_cache else None
+            if result is not None:
+                self._results.move_to_end(key)
+        hit = result is not None
+        if not hit:
+            with self.connection() as pooled:
+                result = self._run(pooled, template, path, cte, bound)
+            if use_cache and self.result_cache_size:
+                with self._lock:
+                    self._results[key] = result
+                    while len(self._results) > self.result_cache_size:
+                        self._results.popitem(last=False)
+        self._record(f"{path} [{cte}]" if cte else path, time.perf_counter() - t0, hit)
+        return result
+
+    # -- statistics ----------------------------------------------------------
+
+    def _record(self, path, seconds, hit):
+        with self._lock:
+            self._histograms.setdefault(path, LatencyHistogram()).observe(seconds)
+            counts = self._hits if hit else self._misses
+            counts[path] = counts.get(path, 0) + 1
+
+    def stats(self):
+        """{template: latency summary, with 'result_cache_hits' / 'misses'}."""
+        with self._lock:
+            return {path: dict(h.summary(), result_cache_hits=self._hits.get(path, 0),
+                               misses=self._misses.get(path, 0))
+                    for path, h in sorted(self._histograms.items())}
+
+    def reset_stats(self):
+        with self._lock:
+            self._histograms.clear()
+            self._hits.clear()
+            self._misses.clear()
+
+    def close(self):
+        with self._lock:
+            if self._snapshot is not None:
+                self._snapshot.close()
+                self._snapshot = None
+
+
+def format_stats(stats):
+    lines = [f"{'template':<40} {'calls':>6} {'hits':>6} {'mean':>9} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>9}  (ms)"]
+    for path, s in stats.items():
+        q = lambda v: f"{v:>7.0f}" if v is not None else f"{'-':>7}"
+        lines.append(f"{path:<40} {s['count']:>6} {s['result_cache_hits']:>6} {s['mean_ms']:>9.2f} "
+                     f"{q(s['p50_ms'])} {q(s['p95_ms'])} {q(s['p99_ms'])} {s['max_ms']:>9.2f}")
+    return "\n".join(lines)
+
+def main():
+    args = sys.argv[1:]
+    if len(args) < 2:
+        print(__doc__)
+        sys.exit(1)
+    repeat, pool_size, use_cache, cache_dir = 1, POOL_SIZE, True, None
+    if "--repeat" in args:
+        i = args.index("--repeat")
+        repeat = int(args[i + 1])
+        del args[i:i + 2]
+    if "--pool" in args:
+        i = args.index("--pool")
+        pool_size = int(args[i + 1])
+        del args[i:i + 2]
+    if "--cache-dir" in args:
+        i = args.index("--cache-dir")
+        cache_dir = args[i + 1]
+        del args[i:i + 2]
+    if "--no-result-cache" in args:
+        args.remove("--no-result-cache")
+        use_cache = False
+
+    db, template, pairs = args[0], args[1], args[2:]
+    values = dict(pair.split("=", 1) for pair in pairs)
+    executor = TemplateExecutor(db, pool_size=pool_size, cache_dir=cache_dir)
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        columns, rows = executor.execute(template, values, use_cache=use_cache)
+        timings.append(time.perf_counter() - t0)
+    print(f"{template}: {len(rows)} rows x {len(columns)} columns")
+    print(f"first call {timings[0] * 1000:.2f}ms"
+          + (f", then best {min(timings[1:]) * 1000:.2f}ms over {repeat - 1}" if repeat > 1 else ""))
+    print(format_stats(executor.stats()))
+    executor.close()
+
+if __name__ == "__main__":
+    main()
@@ -54,6 +54,10 @@
 -- @type page_size integer
 -- @default page_size 500
 
+-- @param cursor keyset paging: '' for the first page, then the next_cursor of the last row of the previous page. When given, page is ignored and page_size counts sites; all rows of a site are on the same page.
+-- @type cursor varchar
+-- @default cursor null
+
 -- @param remaining_power_capacity_in_kw_minimum minimum remaining power capacity
 -- @type remaining_power_capacity_in_kw_minimum DECIMAL
 -- @default remaining_power_capacity_in_kw_minimum NULL
@@ -104,151 +108,53 @@
 
 -- @return Vodafone Sites with Combined Fixed/Mobile Power Capacity Filters.
 
-WITH mobile_aggr_capacity AS (
-	SELECT mtx, 
-		(sum(CAST(remaining_element_capability_a AS FLOAT))*54.5/1000) as aggr_remaining_power_capacity_kw,
-		(sum(CAST(element_load_a_19_01_25 AS FLOAT))*54.5/1000) as aggr_running_load_kw,
-		(sum(CAST(reserved_a AS FLOAT)+CAST(forecast_a AS FLOAT))*54.5/1000) as aggr_total_allocated_kw,
-		(sum(CAST(reserved_a AS FLOAT))*54.5/1000) as aggr_reserved_load_kw,
-        (sum(CAST(forecast_a AS FLOAT))*54.5/1000) as aggr_forecasted_load_kw
-	FROM vdf.mtx_capacity
-	GROUP BY mtx
+WITH vf_mobile_capacity AS (
+    -- per-MTX capacity, materialised at build time (sqlite/vfsummary.sql.post)
+    SELECT mtx, mtx_site_name,
+        remaining_power_capacity_in_kw,
+        running_load_in_kw,
+        total_allocated_in_kw,
+        reserved_load_in_kw,
+        forecasted_load_in_kw,
+        remaining_power_80_of_n_in_kw,
+        current_type
+    FROM vdf.vf_mobile_capacity_site
 ),
-vf_mobile_capacity AS (
-    SELECT a.mtx, 
-        a.aggr_remaining_power_capacity_kw as remaining_power_capacity_in_kw,
-        a.aggr_running_load_kw as running_load_in_kw,
-        a.aggr_total_allocated_kw as total_allocated_in_kw,
-        a.aggr_reserved_load_kw as reserved_load_in_kw,
-        a.aggr_forecasted_load_kw as forecasted_load_in_kw,
-        NULL as remaining_power_80_of_n_in_kw,
-        'DC' as current_type
-    FROM mobile_aggr_capacity a
-    UNION
-    -- corner case #1: BKLN06
-    select
-    'BKLN06' as mtx,
-    (
-        select CAST(room_capablility_kw as DECIMAL)
-        from vdf.mtx_capacity_bkln06_room_capability
-        where trim(col1_c1)='BKLN06'
-        limit 1
-    )
-    -
-    (
-        select CAST(totals as DECIMAL)
-        from vdf.mtx_capacity_bkln06
-        where trim(col1_c1)='kW Allocated'
-        limit 1
-    ) as remaining_power_capacity_in_kw,
-    (
-        select CAST(totals as DECIMAL)
-        FROM vdf.mtx_capacity_bkln06
-        where trim(col1_c1)='kW Measured'
-    ) as running_load_in_kw,
-    (
-        select CAST(totals as DECIMAL)
-        FROM vdf.mtx_capacity_bkln06
-        where trim(col1_c1)='kW Allocated'
-    ) as total_allocated_in_kw,
-    NULL as reserved_load_in_kw,
-    NULL as forecasted_load_in_kw,
-    NULL as remaining_power_80_of_n_in_kw,
-    'AC' as current_type
-    UNION
-    -- corner case #2: XGL001
-    select
-        'XGL001 (BMGMTX)' as mtx, 
-        (
-            select CAST(room_capablility_kw as DECIMAL)
-            from vdf.mtx_capacity_xgl001_room_capability
-            where trim(col1_c1)='XGL001'
-            limit 1
-        )
-        -
-        (
-            select CAST(totals as DECIMAL)
-            from vdf.mtx_capacity_xgl001
-            where trim(col1_c1)='kW Allocated'
-            limit 1
-        ) as remaining_power_capacity_in_kw,
-        (
-            select  CAST(totals as DECIMAL)
-            FROM vdf.mtx_capacity_xgl001
-            where trim(col1_c1)='kW Measured'
-        ) as running_load_in_kw,
-        (
-            select  CAST(totals as DECIMAL)
-            FROM vdf.mtx_capacity_xgl001
-            where trim(col1_c1)='kW Allocated'
-        ) as total_allocated_in_kw,
-        NULL as reserved_load_in_kw,
-        NULL as forecasted_load_in_kw,
-        NULL as remaining_power_80_of_n_in_kw,
-        'AC' as current_type
-
+vf_fixed_capacity AS (
+    -- per-equipment-area capacity, materialised at build time (sqlite/vfsummary.sql.post)
+    SELECT general_equipment_area_code, area_code_key,
+        remaining_element_capability_in_amber,
+        remaining_power_capacity_in_kw,
+        running_load_in_kw,
+        remaining_power_80_of_n_in_kw,
+        forecasted_load_in_kw,
+        reserved_load_in_kw,
+        total_allocated_in_kw
+    FROM vdf.vf_fixed_capacity_site
 ),
-fixed_aggr_capacity AS (
-    SELECT general_equipment_area_code, general_system_name,
-        (
-            CASE 
-                WHEN power_kw_load_remaining_after_total_allocated_inc__f6fe184e IS NULL 
-						OR UPPER(power_kw_load_remaining_after_total_allocated_inc__f6fe184e) != '#N/A' 
-                    THEN CAST(power_kw_load_remaining_after_total_allocated_inc__f6fe184e AS FLOAT)
-                ELSE 0
-            END
-        ) as power_kw_load_remaining_after_total_allocated,
-        (
-            CASE 
-                WHEN power_actual_load_kw IS NULL 
-						OR UPPER(power_actual_load_kw) != '#N/A' 
-                    THEN CAST(power_actual_load_kw AS FLOAT)
-                ELSE 0
-            END
-        ) as power_actual_load_kw,
-        (
-            CASE 
-                WHEN cv.kw_power_remaining_80_of_n IS NULL 
-						OR UPPER(kw_power_remaining_80_of_n) != '#N/A' 
-                    THEN CAST(kw_power_remaining_80_of_n AS FLOAT)
-                ELSE 0
-            END
-        ) as kw_power_remaining_80_of_n,
-        (
-            CASE 
-                WHEN cv.total_allocated_load_kw IS NULL 
-						OR UPPER(total_allocated_load_kw) != '#N/A' 
-                    THEN CAST(total_allocated_load_kw AS FLOAT)
-                ELSE 0
-            END
-        ) as total_allocated_load_kw
-    FROM vdf.fixed_capacity c
-        INNER JOIN vdf.fixed_capacity_cover cv 
-            ON c.general_system_name=cv.brag_0_black_0_10_red_10_25_amber_25_green
+search_terms AS (
+  -- Substring filters: each search term, its trigrams, and the sites having
+  -- all of them (vfsites_trigram, built by sqlite/vfsites_search.sql.post).
+  -- Terms shorter than 3 characters or holding LIKE wildcards are left to
+  -- the ILIKE filters alone; those still decide for every site.
+  SELECT field, UPPER(term) AS term
+  FROM (VALUES ('site_name', :site_name), ('address', :site_address),
+               ('comments', :comments), ('power_resilience', :power_resilience)) AS t(field, term)
+  WHERE LENGTH(term) >= 3
+    AND STRPOS(term, '%') = 0 AND STRPOS(term, '_') = 0 AND STRPOS(term, '\') = 0
 ),
-vf_fixed_capacity_avg AS (
-    select 
-        MAX(fc.general_equipment_area_code) as general_equipment_area_code, 
-        fc.general_equipment_area_code || trim(regexp_replace(regexp_replace(replace(general_system_name,' (DO NOT CONNECT LOADS)',''), '[AaBb]$', '', 'g'), 'SYS[ ]*[AaBb]', 'SYS', 'g')) as minus_compl,
-        AVG(fc.power_kw_load_remaining_after_total_allocated) as remaining_power_capacity_in_kw,
-        SUM(fc.power_actual_load_kw) as running_load_in_kw,
-        SUM(fc.kw_power_remaining_80_of_n) as remaining_power_80_of_n_in_kw,
-        SUM(fc.total_allocated_load_kw) as total_allocated_load_kw
-    FROM fixed_aggr_capacity as fc
-    GROUP BY minus_compl
+search_trigrams AS (
+  SELECT DISTINCT st.field, SUBSTR(st.term, g, 3) AS trigram
+  FROM search_terms st
+    CROSS JOIN generate_series(1, LENGTH(st.term) - 2) AS g
 ),
-vf_fixed_capacity AS (
-    select 
-        general_equipment_area_code, 
-        CAST(NULL as FLOAT) remaining_element_capability_in_amber,
-        SUM(remaining_power_capacity_in_kw) as remaining_power_capacity_in_kw,
-        SUM(running_load_in_kw) as running_load_in_kw,
-        SUM(remaining_power_80_of_n_in_kw) as remaining_power_80_of_n_in_kw,
-        CAST(NULL as FLOAT) as forecasted_load_in_kw,
-        CAST(NULL as FLOAT) as reserved_load_in_kw,
-        SUM(total_allocated_load_kw) as total_allocated_in_kw
-    FROM vf_fixed_capacity_avg as fc
-    GROUP BY general_equipment_area_code
+search_sites AS (
+  SELECT tg.site_code
+  FROM search_trigrams q
+    INNER JOIN vdf.vfsites_trigram tg
+      ON tg.field = q.field AND tg.trigram = q.trigram
+  GROUP BY tg.site_code
+  HAVING COUNT(*) = (SELECT COUNT(*) FROM search_trigrams)
 ),
 split_site_codes AS (
   SELECT TRIM(x) AS code
@@ -307,6 +213,8 @@ filtered_sites AS (
 			(:restricted=true AND UPPER(vfsites.restricted) = 'TRUE') OR
 			(:restricted=false AND UPPER(vfsites.restricted) = 'FALSE'))
 		AND (:power_resilience IS NULL OR UPPER(vfsites.power_resilience) ILIKE CONCAT('%',:power_resilience,'%'))
+        AND (NOT EXISTS (SELECT 1 FROM search_trigrams) OR vfsites.site_code IN (SELECT site_code FROM search_sites))
+        AND (:cursor IS NULL OR vfsites.site_code > SPLIT_PART(:cursor, '|', 2))
         AND (
             :network_domain IS NULL
             OR (UPPER(:network_domain) = 'MOBILE' AND vfsites.site_type IN ('MTX','LTC'))
@@ -323,7 +231,7 @@ combined AS (
         round(CAST(fc.remaining_power_80_of_n_in_kw AS DECIMAL), 1) as remaining_power_80_of_n_in_kw
     FROM filtered_sites s 
         LEFT OUTER JOIN vf_fixed_capacity fc 
-            ON upper(trim(fc.general_equipment_area_code)) = trim(replace(replace(upper(s.site_code), '(GROUND FLOOR)', ''), 'ROOM', ''))
+            ON fc.area_code_key = trim(replace(replace(upper(s.site_code), '(GROUND FLOOR)', ''), 'ROOM', ''))
     WHERE site_type NOT IN ('MTX','LTC')
     
     -- GROUP BY rollup(fc.general_equipment_area_code, fc.general_system_name)
@@ -339,9 +247,10 @@ combined AS (
     FROM filtered_sites 
         LEFT OUTER JOIN vf_mobile_capacity
         ON filtered_sites.site_code=vf_mobile_capacity.mtx 
-            OR (filtered_sites.site_code NOT IN ('XGL001 (BMGMTX)', 'BKLN06') AND filtered_sites.site_name=trim(split_part(vf_mobile_capacity.mtx, ' TXO', 1)))
+            OR (filtered_sites.site_code NOT IN ('XGL001 (BMGMTX)', 'BKLN06') AND filtered_sites.site_name=vf_mobile_capacity.mtx_site_name)
     WHERE (filtered_sites.site_type='LTC' OR filtered_sites.site_type='MTX')
-)
+),
+page_rows AS (
 SELECT distinct *
 FROM combined
 WHERE
@@ -357,5 +266,20 @@ WHERE
     AND (:forecasted_load_in_kw_maximum IS NULL OR forecasted_load_in_kw<=:forecasted_load_in_kw_maximum)
     AND (:remaining_power_80_of_n_in_kw_minimum IS NULL OR remaining_power_80_of_n_in_kw>=:remaining_power_80_of_n_in_kw_minimum)
     AND (:remaining_power_80_of_n_in_kw_maximum IS NULL OR remaining_power_80_of_n_in_kw<=:remaining_power_80_of_n_in_kw_maximum)
-LIMIT COALESCE(:page_size, 500)
-OFFSET (COALESCE(:page, 1) - 1) * COALESCE(:page_size, 500);
+),
+-- Keyset paging (:cursor given): the first page_size sites after the cursor
+-- site, with all of their rows. site_code > cursor is also pushed down into
+-- filtered_sites, where the vfsites(site_code) index serves it.
+cursor_page AS (
+  SELECT DISTINCT site_code
+  FROM page_rows
+  WHERE :cursor IS NOT NULL AND site_code > SPLIT_PART(:cursor, '|', 2)
+  ORDER BY site_code
+  LIMIT COALESCE(:page_size, 500)
+)
+SELECT page_rows.*, CONCAT('|', page_rows.site_code) AS next_cursor
+FROM page_rows
+WHERE :cursor IS NULL OR page_rows.site_code IN (SELECT site_code FROM cursor_page)
+ORDER BY page_rows.site_code
+LIMIT CASE WHEN :cursor IS NULL THEN COALESCE(:page_size, 500) END
+OFFSET CASE WHEN :cursor IS NULL THEN (COALESCE(:page, 1) - 1) * COALESCE(:page_size, 500) ELSE 0 END;
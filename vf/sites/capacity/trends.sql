@@ -10,6 +10,10 @@
 -- @type page_size integer
 -- @default page_size 500
 
+-- @param cursor keyset paging: '' for the first page, then the next_cursor of the last row of the previous page. When given, page is ignored and page_size counts sites; all rows of a site are on the same page.
+-- @type cursor varchar
+-- @default cursor null
+
 -- @param userid user identifier injected for authorization and data redaction purposes.
 -- @type userid varchar
 -- @default userid NULL
@@ -36,108 +40,34 @@ WITH user_blacklist_opex AS (
   FROM environment.secrets,
        unnest(string_to_array(secret, ',')) id
   WHERE name = 'user-blacklist-lease' AND id = :userid
-), mobile_aggr_capacity AS (
-	SELECT mtx, TO_DATE(upper(trim(file_date)), '01 MON YY') as file_date,
-		(sum(CAST(remaining_element_capability_a AS FLOAT))*54.5/1000) as aggr_remaining_power_capacity_kw,
-		(sum(CAST(
-                COALESCE(element_load_a_28_01_24,element_load_a_25_02_24,element_load_a_24_03_24,
-                element_load_a_28_04_24,element_load_a_26_05_24,element_load_a_23_06_24,
-                element_load_a_28_07_24,element_load_a_18_08_24,element_load_a_29_09_24,
-                element_load_a_20_10_24,element_load_a_24_11_24,element_load_a_22_12_24)
-            AS FLOAT))*54.5/1000) as aggr_running_load_kw,
-		(sum(CAST(reserved_a AS FLOAT)+CAST(forecast_a AS FLOAT))*54.5/1000) as aggr_total_allocated_kw,
-		(sum(CAST(reserved_a AS FLOAT))*54.5/1000) as aggr_reserved_load_kw,
-        (sum(CAST(forecast_a AS FLOAT))*54.5/1000) as aggr_forecasted_load_kw
-	FROM vdf.historic_mtx_capacity
-	GROUP BY mtx, file_date
 ),
+-- Monthly snapshots per MTX / equipment area, aggregated at build time
+-- (sqlite/vfsummary_capacity_history.sql.post); file_date is 'YYYY-MM-01'.
 vf_mobile_capacity AS (
-    SELECT a.mtx, 
-        ARRAY_AGG(a.aggr_remaining_power_capacity_kw order by file_date) as remaining_power_capacity_in_kw,
-        ARRAY_AGG(a.aggr_running_load_kw order by file_date) as running_load_in_kw,
-        ARRAY_AGG(a.aggr_total_allocated_kw order by file_date) as total_allocated_in_kw,
-        ARRAY_AGG(a.aggr_reserved_load_kw order by file_date) as reserved_load_in_kw,
-        ARRAY_AGG(a.aggr_forecasted_load_kw order by file_date) as forecasted_load_in_kw,
-        ARRAY_AGG(CAST(NULL AS FLOAT)) as remaining_power_80_of_n_in_kw,
+    SELECT series_key as mtx,
+        ARRAY_AGG(remaining_power_capacity_in_kw order by file_date) as remaining_power_capacity_in_kw,
+        ARRAY_AGG(running_load_in_kw order by file_date) as running_load_in_kw,
+        ARRAY_AGG(total_allocated_in_kw order by file_date) as total_allocated_in_kw,
+        ARRAY_AGG(reserved_load_in_kw order by file_date) as reserved_load_in_kw,
+        ARRAY_AGG(forecasted_load_in_kw order by file_date) as forecasted_load_in_kw,
+        ARRAY_AGG(remaining_power_80_of_n_in_kw order by file_date) as remaining_power_80_of_n_in_kw,
         'DC' as current_type
-    FROM mobile_aggr_capacity a
-    GROUP BY mtx
-),
-fixed_aggr_capacity AS (
-    SELECT general_equipment_area_code, general_system_name, TO_DATE(upper(trim(c.file_date)), 'YYMM01') as file_date,
-        (
-            CASE 
-                WHEN power_kw_load_remaining_after_total_allocated_inc__f6fe184e IS NULL 
-						OR UPPER(power_kw_load_remaining_after_total_allocated_inc__f6fe184e) != '#N/A' 
-                    THEN CAST(power_kw_load_remaining_after_total_allocated_inc__f6fe184e AS FLOAT)
-                ELSE 0
-            END
-        ) as power_kw_load_remaining_after_total_allocated,
-        (
-            CASE 
-                WHEN power_actual_load_kw IS NULL 
-						OR UPPER(power_actual_load_kw) != '#N/A' 
-                    THEN CAST(power_actual_load_kw AS FLOAT)
-                ELSE 0
-            END
-        ) as power_actual_load_kw,
-        (
-            CASE 
-                WHEN cv.kw_power_remaining_80_of_n IS NULL 
-						OR UPPER(kw_power_remaining_80_of_n) != '#N/A' 
-                    THEN CAST(kw_power_remaining_80_of_n AS FLOAT)
-                ELSE 0
-            END
-        ) as kw_power_remaining_80_of_n,
-        (
-            CASE 
-                WHEN cv.total_allocated_load_kw IS NULL 
-						OR UPPER(total_allocated_load_kw) != '#N/A' 
-                    THEN CAST(total_allocated_load_kw AS FLOAT)
-                ELSE 0
-            END
-        ) as total_allocated_load_kw
-    FROM vdf.historic_fixed_capacity c
-        INNER JOIN vdf.historic_fixed_capacity_cover cv 
-            ON c.general_system_name=cv.brag_0_black_0_10_red_10_25_amber_25_green AND c.file_date=cv.file_date
-),
-vf_fixed_capacity_avg AS (
-    select 
-        MAX(fc.general_equipment_area_code) as general_equipment_area_code, 
-        fc.general_equipment_area_code || trim(regexp_replace(regexp_replace(replace(general_system_name,' (DO NOT CONNECT LOADS)',''), '[AaBb]$', '', 'g'), 'SYS[ ]*[AaBb]', 'SYS', 'g')) as minus_compl,
-        file_date,
-        AVG(fc.power_kw_load_remaining_after_total_allocated) as remaining_power_capacity_in_kw,
-        SUM(fc.power_actual_load_kw) as running_load_in_kw,
-        SUM(fc.kw_power_remaining_80_of_n) as remaining_power_80_of_n_in_kw,
-        SUM(fc.total_allocated_load_kw) as total_allocated_load_kw
-    FROM fixed_aggr_capacity as fc
-    GROUP BY minus_compl, file_date
-),
-vf_fixed_capacity_sum AS (
-    select 
-        general_equipment_area_code, file_date,
-        CAST(NULL as FLOAT) as remaining_element_capability_in_amber,
-        SUM(remaining_power_capacity_in_kw) as remaining_power_capacity_in_kw,
-        SUM(running_load_in_kw) as running_load_in_kw,
-        SUM(remaining_power_80_of_n_in_kw) as remaining_power_80_of_n_in_kw,
-        CAST(NULL as FLOAT) as forecasted_load_in_kw,
-        CAST(NULL as FLOAT) as reserved_load_in_kw,
-        SUM(total_allocated_load_kw) as total_allocated_in_kw
-    FROM vf_fixed_capacity_avg as fc
-    GROUP BY general_equipment_area_code, file_date
+    FROM vdf.vf_capacity_snapshot
+    WHERE domain = 'mobile'
+    GROUP BY series_key
 ),
 vf_fixed_capacity AS (
     select 
-        general_equipment_area_code,
-        ARRAY_AGG(remaining_element_capability_in_amber order by file_date) as remaining_element_capability_in_amber,
+        series_key as general_equipment_area_code,
         ARRAY_AGG(remaining_power_capacity_in_kw order by file_date) as remaining_power_capacity_in_kw,
         ARRAY_AGG(running_load_in_kw order by file_date) as running_load_in_kw,
         ARRAY_AGG(remaining_power_80_of_n_in_kw order by file_date) as remaining_power_80_of_n_in_kw,
         ARRAY_AGG(forecasted_load_in_kw order by file_date) as forecasted_load_in_kw,
         ARRAY_AGG(reserved_load_in_kw order by file_date) as reserved_load_in_kw,
         ARRAY_AGG(total_allocated_in_kw order by file_date) as total_allocated_in_kw
-    FROM vf_fixed_capacity_sum as fc
-    GROUP BY general_equipment_area_code
+    FROM vdf.vf_capacity_snapshot
+    WHERE domain = 'fixed'
+    GROUP BY series_key
 ),
 split_site_codes AS (
   SELECT TRIM(x) AS code
@@ -158,6 +88,7 @@ filtered_sites AS (
       :site_codes IS NULL 
       OR UPPER(TRIM(site_code)) IN (SELECT UPPER(TRIM(code)) FROM split_site_codes)
     )
+    AND (:cursor IS NULL OR vfsites.site_code > SPLIT_PART(:cursor, '|', 2))
 ),
 combined AS (
     select s.*, -- fc.general_equipment_area_code, fc.general_system_name, 
@@ -187,9 +118,25 @@ combined AS (
         ON filtered_sites.site_code=vf_mobile_capacity.mtx 
             OR (filtered_sites.site_code NOT IN ('XGL001 (BMGMTX)', 'BKLN06') AND filtered_sites.site_name=trim(split_part(vf_mobile_capacity.mtx, ' TXO', 1)))
     WHERE (filtered_sites.original_site_type='LTC' OR filtered_sites.original_site_type='MTX')
-)
+),
+page_rows AS (
 SELECT distinct *
 FROM combined
 WHERE NOT EXISTS(SELECT * FROM user_blacklist_capacity) -- redact all non-capacity users
-LIMIT COALESCE(:page_size, 500)
-OFFSET (COALESCE(:page, 1) - 1) * COALESCE(:page_size, 500);
+),
+-- Keyset paging (:cursor given): the first page_size sites after the cursor
+-- site, with all of their rows. site_code > cursor is also pushed down into
+-- filtered_sites, where the vfsites(site_code) index serves it.
+cursor_page AS (
+  SELECT DISTINCT site_code
+  FROM page_rows
+  WHERE :cursor IS NOT NULL AND site_code > SPLIT_PART(:cursor, '|', 2)
+  ORDER BY site_code
+  LIMIT COALESCE(:page_size, 500)
+)
+SELECT page_rows.*, CONCAT('|', page_rows.site_code) AS next_cursor
+FROM page_rows
+WHERE :cursor IS NULL OR page_rows.site_code IN (SELECT site_code FROM cursor_page)
+ORDER BY page_rows.site_code
+LIMIT CASE WHEN :cursor IS NULL THEN COALESCE(:page_size, 500) END
+OFFSET CASE WHEN :cursor IS NULL THEN (COALESCE(:page, 1) - 1) * COALESCE(:page_size, 500) ELSE 0 END;
@@ -54,6 +54,10 @@
 -- @type page_size integer
 -- @default page_size 500
 
+-- @param cursor keyset paging: '' for the first page, then the next_cursor of the last row of the previous page. When given, page is ignored and page_size counts sites; all rows of a site are on the same page.
+-- @type cursor varchar
+-- @default cursor null
+
 -- @param remaining_power_capacity_in_kw_minimum minimum remaining power capacity
 -- @type remaining_power_capacity_in_kw_minimum DECIMAL
 -- @default remaining_power_capacity_in_kw_minimum NULL
@@ -257,260 +261,47 @@ WITH user_blacklist_opex AS (
   FROM environment.secrets,
        unnest(string_to_array(secret, ',')) id
   WHERE name = 'user-blacklist-lease' AND id = :userid
-), mobile_aggr_capacity AS (
-	SELECT mtx, 
-		(sum(CAST(remaining_element_capability_a AS FLOAT))*54.5/1000) as aggr_remaining_power_capacity_kw,
-		(sum(CAST(element_load_a_19_01_25 AS FLOAT))*54.5/1000) as aggr_running_load_kw,
-		(sum(CAST(reserved_a AS FLOAT)+CAST(forecast_a AS FLOAT))*54.5/1000) as aggr_total_allocated_kw,
-		(sum(CAST(reserved_a AS FLOAT))*54.5/1000) as aggr_reserved_load_kw,
-        (sum(CAST(forecast_a AS FLOAT))*54.5/1000) as aggr_forecasted_load_kw
-	FROM vdf.mtx_capacity
-	GROUP BY mtx
 ),
 vf_mobile_capacity AS (
-    SELECT a.mtx, 
-        a.aggr_remaining_power_capacity_kw as remaining_power_capacity_in_kw,
-        a.aggr_running_load_kw as running_load_in_kw,
-        a.aggr_total_allocated_kw as total_allocated_in_kw,
-        a.aggr_reserved_load_kw as reserved_load_in_kw,
-        a.aggr_forecasted_load_kw as forecasted_load_in_kw,
-        NULL as remaining_power_80_of_n_in_kw,
-        'DC' as current_type
-    FROM mobile_aggr_capacity a
-    UNION
-    -- corner case #1: BKLN06
-    select
-    'BKLN06' as mtx,
-    (
-        select CAST(room_capablility_kw as DECIMAL)
-        from vdf.mtx_capacity_bkln06_room_capability
-        where trim(col1_c1)='BKLN06'
-        limit 1
-    )
-    -
-    (
-        select CAST(totals as DECIMAL)
-        from vdf.mtx_capacity_bkln06
-        where trim(col1_c1)='kW Allocated'
-        limit 1
-    ) as remaining_power_capacity_in_kw,
-    (
-        select CAST(totals as DECIMAL)
-        FROM vdf.mtx_capacity_bkln06
-        where trim(col1_c1)='kW Measured'
-    ) as running_load_in_kw,
-    (
-        select CAST(totals as DECIMAL)
-        FROM vdf.mtx_capacity_bkln06
-        where trim(col1_c1)='kW Allocated'
-    ) as total_allocated_in_kw,
-    NULL as reserved_load_in_kw,
-    NULL as forecasted_load_in_kw,
-    NULL as remaining_power_80_of_n_in_kw,
-    'AC' as current_type
-    UNION
-    -- corner case #2: XGL001
-    select
-        'XGL001 (BMGMTX)' as mtx, 
-        (
-            select CAST(room_capablility_kw as DECIMAL)
-            from vdf.mtx_capacity_xgl001_room_capability
-            where trim(col1_c1)='XGL001'
-            limit 1
-        )
-        -
-        (
-            select CAST(totals as DECIMAL)
-            from vdf.mtx_capacity_xgl001
-            where trim(col1_c1)='kW Allocated'
-            limit 1
-        ) as remaining_power_capacity_in_kw,
-        (
-            select  CAST(totals as DECIMAL)
-            FROM vdf.mtx_capacity_xgl001
-            where trim(col1_c1)='kW Measured'
-        ) as running_load_in_kw,
-        (
-            select  CAST(totals as DECIMAL)
-            FROM vdf.mtx_capacity_xgl001
-            where trim(col1_c1)='kW Allocated'
-        ) as total_allocated_in_kw,
-        NULL as reserved_load_in_kw,
-        NULL as forecasted_load_in_kw,
-        NULL as remaining_power_80_of_n_in_kw,
-        'AC' as current_type
-
-),
-fixed_aggr_capacity AS (
-    SELECT general_equipment_area_code, general_system_name,
-        (
-            CASE 
-                WHEN power_kw_load_remaining_after_total_allocated_inc__f6fe184e IS NULL 
-						OR UPPER(power_kw_load_remaining_after_total_allocated_inc__f6fe184e) != '#N/A' 
-                    THEN CAST(power_kw_load_remaining_after_total_allocated_inc__f6fe184e AS FLOAT)
-                ELSE 0
-            END
-        ) as power_kw_load_remaining_after_total_allocated,
-        (
-            CASE 
-                WHEN power_actual_load_kw IS NULL 
-						OR UPPER(power_actual_load_kw) != '#N/A' 
-                    THEN CAST(power_actual_load_kw AS FLOAT)
-                ELSE 0
-            END
-        ) as power_actual_load_kw,
-        (
-            CASE 
-                WHEN cv.kw_power_remaining_80_of_n IS NULL 
-						OR UPPER(kw_power_remaining_80_of_n) != '#N/A' 
-                    THEN CAST(kw_power_remaining_80_of_n AS FLOAT)
-                ELSE 0
-            END
-        ) as kw_power_remaining_80_of_n,
-        (
-            CASE 
-                WHEN cv.total_allocated_load_kw IS NULL 
-						OR UPPER(total_allocated_load_kw) != '#N/A' 
-                    THEN CAST(total_allocated_load_kw AS FLOAT)
-                ELSE 0
-            END
-        ) as total_allocated_load_kw
-    FROM vdf.fixed_capacity c
-        INNER JOIN vdf.fixed_capacity_cover cv 
-            ON c.general_system_name=cv.brag_0_black_0_10_red_10_25_amber_25_green
-),
-vf_fixed_capacity_avg AS (
-    select 
-        MAX(fc.general_equipment_area_code) as general_equipment_area_code, 
-        fc.general_equipment_area_code || trim(regexp_replace(regexp_replace(replace(general_system_name,' (DO NOT CONNECT LOADS)',''), '[AaBb]$', '', 'g'), 'SYS[ ]*[AaBb]', 'SYS', 'g')) as minus_compl,
-        AVG(fc.power_kw_load_remaining_after_total_allocated) as remaining_power_capacity_in_kw,
-        SUM(fc.power_actual_load_kw) as running_load_in_kw,
-        SUM(fc.kw_power_remaining_80_of_n) as remaining_power_80_of_n_in_kw,
-        SUM(fc.total_allocated_load_kw) as total_allocated_load_kw
-    FROM fixed_aggr_capacity as fc
-    GROUP BY minus_compl
+    -- per-MTX capacity, materialised at build time (sqlite/vfsummary.sql.post)
+    SELECT mtx, mtx_site_name,
+        remaining_power_capacity_in_kw,
+        running_load_in_kw,
+        total_allocated_in_kw,
+        reserved_load_in_kw,
+        forecasted_load_in_kw,
+        remaining_power_80_of_n_in_kw,
+        current_type
+    FROM vdf.vf_mobile_capacity_site
 ),
 vf_fixed_capacity AS (
-    select 
-        general_equipment_area_code, 
-        CAST(NULL as FLOAT) remaining_element_capability_in_amber,
-        SUM(remaining_power_capacity_in_kw) as remaining_power_capacity_in_kw,
-        SUM(running_load_in_kw) as running_load_in_kw,
-        SUM(remaining_power_80_of_n_in_kw) as remaining_power_80_of_n_in_kw,
-        CAST(NULL as FLOAT) as forecasted_load_in_kw,
-        CAST(NULL as FLOAT) as reserved_load_in_kw,
-        SUM(total_allocated_load_kw) as total_allocated_in_kw
-    FROM vf_fixed_capacity_avg as fc
-    GROUP BY general_equipment_area_code
+    -- per-equipment-area capacity, materialised at build time (sqlite/vfsummary.sql.post)
+    SELECT general_equipment_area_code, area_code_key,
+        remaining_element_capability_in_amber,
+        remaining_power_capacity_in_kw,
+        running_load_in_kw,
+        remaining_power_80_of_n_in_kw,
+        forecasted_load_in_kw,
+        reserved_load_in_kw,
+        total_allocated_in_kw
+    FROM vdf.vf_fixed_capacity_site
 ),
-sites_excluded_duplicate_non_identical_numbers AS (
-    select distinct site_code --, col1_c1, count(distinct quantity), string_agg(distinct quantity, ',')
-    from vdf."space"
-    where col1_c1 IS NOT NULL AND quantity NOT LIKE '% W' AND site_code!='BKLN05'
-    group by site_code, col1_c1
-    having count(distinct quantity)>1
-), space_pivot AS (
-    SELECT
-        site_code,
-        -- Parse the '3' from "3/78" when col1_c1 = 'Total free sections:'
-        (
-          CASE WHEN col1_c1 = 'Total free sections:' 
-               THEN split_part(quantity, '/', 1)::int 
-          END
-        ) AS free_sections,
-
-        (
-          CASE WHEN col1_c1 = 'Total free sections:' 
-               THEN free_section_percentage::decimal 
-          END
-        ) AS free_section_percentage,
-
-        -- Parse the '75' from "75/78" when col1_c1 = 'Total occupied sections:'
-        (
-          CASE WHEN col1_c1 = 'Total occupied sections:' 
-               THEN split_part(quantity, '/', 1)::int 
-          END
-        ) AS occupied_sections,
-
-        -- Parse the '0' from "0/78" when col1_c1 = 'Total reserved sections:'
-        (
-          CASE WHEN col1_c1 = 'Total reserved sections:' 
-               THEN split_part(quantity, '/', 1)::int 
-          END
-        ) AS reserved_sections,
-
-        -- Parse the '78' from "0/78" => total possible sections
-        (
-          CASE WHEN col1_c1 = 'Total reserved sections:' 
-               THEN split_part(quantity, '/', 2)::int 
-          END
-        ) AS total_sections,
-
-        -- e.g. "3.452 m^2" => parse numeric portion => 3.452
-        (
-          CASE WHEN col1_c1 = 'Total free sections:' 
-               THEN regexp_replace(area, '[^0-9\\.]+', '', 'g')::numeric 
-          END
-        ) AS free_sections_area,
-
-        (
-          CASE WHEN col1_c1 = 'Total occupied sections:' 
-               THEN regexp_replace(area, '[^0-9\\.]+', '', 'g')::numeric 
-          END
-        ) AS occupied_sections_area,
-
-        (
-          CASE WHEN col1_c1 = 'Total Lines Capability' 
-               THEN regexp_replace(area, '[^0-9\\.]+', '', 'g')::numeric 
-          END
-        ) AS lines_capability,
-
-        (
-          CASE WHEN col1_c1 = 'Total Location Capability' 
-               THEN regexp_replace(area, '[^0-9\\.]+', '', 'g')::numeric 
-          END
-        ) AS location_capability,
-
-        (
-          CASE WHEN col1_c1 = 'Total Location Free Area' 
-               THEN regexp_replace(area, '[^0-9\\.]+', '', 'g')::numeric 
-          END
-        ) AS location_free_area,
-
-        (
-          CASE WHEN col1_c1 = 'Total Location Occupied Area' 
-               THEN regexp_replace(area, '[^0-9\\.]+', '', 'g')::numeric 
-          END
-        ) AS location_occupied_area,
-
-        (
-          CASE 
-            WHEN col1_c1 LIKE 'Room%' 
-            THEN regexp_replace(
-                   regexp_replace(col1_c1, '^Room ', ''), 
-                   ' on .*', ''
-                 )
-          END
-        ) AS gen_site_code
-
-    FROM vdf.vfspace
-    WHERE site_code NOT IN (select site_code from sites_excluded_duplicate_non_identical_numbers)
-), space_base AS (
-    SELECT site_code, 
-        MAX(free_sections) AS free_sections,
-        MAX(free_section_percentage) AS free_section_percentage,
-        MAX(occupied_sections) AS occupied_sections,
-        MAX(reserved_sections) AS reserved_sections,
-        MAX(total_sections) AS total_sections,
-        MAX(free_sections_area) AS free_sections_area,
-        MAX(occupied_sections_area) AS occupied_sections_area,
-        MAX(lines_capability) AS lines_capability,
-        MAX(location_capability) AS location_capability,
-        MAX(location_free_area) AS location_free_area,
-        MAX(location_occupied_area) AS location_occupied_area,
-        MAX(gen_site_code) AS gen_site_code
-    FROM space_pivot
-    GROUP BY site_code
+space_base AS (
+    -- per-site space sections / areas, materialised at build time (sqlite/vfsummary.sql.post)
+    SELECT site_code,
+        free_sections,
+        free_section_percentage,
+        occupied_sections,
+        reserved_sections,
+        total_sections,
+        free_sections_area,
+        occupied_sections_area,
+        lines_capability,
+        location_capability,
+        location_free_area,
+        location_occupied_area,
+        gen_site_code
+    FROM vdf.vf_space_site
 ),
 unique_postal_codes AS (
     SELECT postcode
@@ -518,6 +309,30 @@ unique_postal_codes AS (
     GROUP BY postcode
     HAVING count(*)=1
 ),
+search_terms AS (
+  -- Substring filters: each search term, its trigrams, and the sites having
+  -- all of them (vfsites_trigram, built by sqlite/vfsites_search.sql.post).
+  -- Terms shorter than 3 characters or holding LIKE wildcards are left to
+  -- the ILIKE filters alone; those still decide for every site.
+  SELECT field, UPPER(term) AS term
+  FROM (VALUES ('site_name', :site_name), ('address', :site_address),
+               ('comments', :comments), ('power_resilience', :power_resilience)) AS t(field, term)
+  WHERE LENGTH(term) >= 3
+    AND STRPOS(term, '%') = 0 AND STRPOS(term, '_') = 0 AND STRPOS(term, '\') = 0
+),
+search_trigrams AS (
+  SELECT DISTINCT st.field, SUBSTR(st.term, g, 3) AS trigram
+  FROM search_terms st
+    CROSS JOIN generate_series(1, LENGTH(st.term) - 2) AS g
+),
+search_sites AS (
+  SELECT tg.site_code
+  FROM search_trigrams q
+    INNER JOIN vdf.vfsites_trigram tg
+      ON tg.field = q.field AND tg.trigram = q.trigram
+  GROUP BY tg.site_code
+  HAVING COUNT(*) = (SELECT COUNT(*) FROM search_trigrams)
+),
 split_site_codes AS (
   SELECT TRIM(x) AS code
   FROM regexp_split_to_table(COALESCE(:site_codes, ''), ',') AS x
@@ -608,6 +423,8 @@ filtered_sites AS (
 			(:restricted=true AND UPPER(vfsites.restricted) = 'TRUE') OR
 			(:restricted=false AND UPPER(vfsites.restricted) = 'FALSE'))
 		AND (:power_resilience IS NULL OR UPPER(vfsites.power_resilience) ILIKE CONCAT('%',:power_resilience,'%'))
+        AND (NOT EXISTS (SELECT 1 FROM search_trigrams) OR vfsites.site_code IN (SELECT site_code FROM search_sites))
+        AND (:cursor IS NULL OR :topN IS NOT NULL OR vfsites.site_code > SPLIT_PART(:cursor, '|', 2))
         AND (
             :network_domain IS NULL
             OR (UPPER(:network_domain) = 'MOBILE' AND vfsites.site_type IN ('MTX','LTC'))
@@ -625,7 +442,7 @@ combined_with_capacity_tmp AS (
     FROM filtered_sites s 
         LEFT OUTER JOIN vf_fixed_capacity fc 
             ON NOT EXISTS(SELECT * FROM user_blacklist_capacity) -- redact all non-capacity users
-            AND upper(trim(fc.general_equipment_area_code)) = trim(replace(replace(upper(s.site_code), '(GROUND FLOOR)', ''), 'ROOM', ''))
+            AND fc.area_code_key = trim(replace(replace(upper(s.site_code), '(GROUND FLOOR)', ''), 'ROOM', ''))
     WHERE original_site_type NOT IN ('MTX','LTC')
     
     -- GROUP BY rollup(fc.general_equipment_area_code, fc.general_system_name)
@@ -642,7 +459,7 @@ combined_with_capacity_tmp AS (
         LEFT OUTER JOIN vf_mobile_capacity
         ON NOT EXISTS(SELECT * FROM user_blacklist_capacity) -- redact all non-capacity users
           AND (filtered_sites.site_code=vf_mobile_capacity.mtx 
-              OR (filtered_sites.site_code NOT IN ('XGL001 (BMGMTX)', 'BKLN06') AND filtered_sites.site_name=trim(split_part(vf_mobile_capacity.mtx, ' TXO', 1)))
+              OR (filtered_sites.site_code NOT IN ('XGL001 (BMGMTX)', 'BKLN06') AND filtered_sites.site_name=vf_mobile_capacity.mtx_site_name)
           ) 
     WHERE (filtered_sites.original_site_type='LTC' OR filtered_sites.original_site_type='MTX')
 ),
@@ -933,12 +750,42 @@ combined_with_opex AS (
         not(co.site_code='BDEN04' AND free_sections=0) -- outlier due to BDE 2025-02-20 (space file)
     ORDER BY
         -- If topN is provided, sort by total_cost DESC; otherwise sort by site_code ASC
+        -- (site_code also breaks cost ties, so topN and the pages are stable)
         suppl_a DESC,
-        suppl_b ASC
-    LIMIT CASE WHEN :topN IS NOT NULL THEN :topN ELSE 1000 END
+        site_code ASC
+    -- the 1000-row fallback counts rows, not sites, so it would cut a site
+    -- off mid-way; with a cursor the paging below bounds the result instead
+    LIMIT CASE WHEN :topN IS NOT NULL THEN :topN WHEN :cursor IS NULL THEN 1000 END
+),
+-- Keyset paging (:cursor given): the first page_size sites after the cursor,
+-- with all of their rows. Sites are ordered by (cost DESC, site_code) with
+-- topN, else by site_code, and the cursor is '<cost>|<site_code>'. Without
+-- topN, site_code > cursor is also pushed down into filtered_sites, where
+-- the vfsites(site_code) index serves it.
+cursor_page AS (
+  SELECT site_code
+  FROM combined_with_opex
+  WHERE :cursor IS NOT NULL
+  GROUP BY site_code
+  HAVING (:topN IS NULL AND site_code > SPLIT_PART(:cursor, '|', 2))
+    OR (:topN IS NOT NULL AND (
+      NULLIF(SPLIT_PART(:cursor, '|', 1), '') IS NULL
+      OR MAX(suppl_a) < CAST(NULLIF(SPLIT_PART(:cursor, '|', 1), '') AS DECIMAL)
+      OR (MAX(suppl_a) = CAST(NULLIF(SPLIT_PART(:cursor, '|', 1), '') AS DECIMAL)
+          AND site_code > SPLIT_PART(:cursor, '|', 2))
+    ))
+  ORDER BY MAX(suppl_a) DESC, site_code
+  LIMIT COALESCE(:page_size, 500)
 )
-SELECT *
+SELECT combined_with_opex.*,
+  CONCAT(MAX(suppl_a) OVER (PARTITION BY site_code), '|', site_code) AS next_cursor
 FROM combined_with_opex 
 -- WHERE (:topN IS NULL OR :site_codes IS NULL OR UPPER(TRIM(combined_with_opex.site_code)) IN (SELECT UPPER(TRIM(code)) FROM split_site_codes))
-LIMIT COALESCE(:page_size, 500)
-OFFSET (COALESCE(:page, 1) - 1) * COALESCE(:page_size, 500);
+WHERE :cursor IS NULL OR site_code IN (SELECT site_code FROM cursor_page)
+-- with a cursor, sites in cursor order with their rows together, so the last
+-- row's next_cursor is the page's last site
+ORDER BY CASE WHEN :cursor IS NOT NULL THEN MAX(suppl_a) OVER (PARTITION BY site_code) END DESC,
+  CASE WHEN :cursor IS NOT NULL THEN site_code END,
+  suppl_a DESC, site_code
+LIMIT CASE WHEN :cursor IS NULL THEN COALESCE(:page_size, 500) END
+OFFSET CASE WHEN :cursor IS NULL THEN (COALESCE(:page, 1) - 1) * COALESCE(:page_size, 500) ELSE 0 END;
@@ -76,6 +76,30 @@ unique_postal_codes AS (
   GROUP BY postcode
   HAVING COUNT(*) = 1
 ),
+search_terms AS (
+  -- Substring filters: each search term, its trigrams, and the sites having
+  -- all of them (vfsites_trigram, built by sqlite/vfsites_search.sql.post).
+  -- Terms shorter than 3 characters or holding LIKE wildcards are left to
+  -- the ILIKE filters alone; those still decide for every site.
+  SELECT field, UPPER(term) AS term
+  FROM (VALUES ('site_name', :site_name), ('address', :site_address),
+               ('comments', :comments), ('power_resilience', :power_resilience)) AS t(field, term)
+  WHERE LENGTH(term) >= 3
+    AND STRPOS(term, '%') = 0 AND STRPOS(term, '_') = 0 AND STRPOS(term, '\') = 0
+),
+search_trigrams AS (
+  SELECT DISTINCT st.field, SUBSTR(st.term, g, 3) AS trigram
+  FROM search_terms st
+    CROSS JOIN generate_series(1, LENGTH(st.term) - 2) AS g
+),
+search_sites AS (
+  SELECT tg.site_code
+  FROM search_trigrams q
+    INNER JOIN vdf.vfsites_trigram tg
+      ON tg.field = q.field AND tg.trigram = q.trigram
+  GROUP BY tg.site_code
+  HAVING COUNT(*) = (SELECT COUNT(*) FROM search_trigrams)
+),
 split_site_codes AS (
   SELECT TRIM(x) AS code
   FROM regexp_split_to_table(COALESCE(:site_codes, ''), ',') AS x
@@ -166,6 +190,7 @@ filtered_sites AS (
       :power_resilience IS NULL
       OR UPPER(power_resilience) ILIKE CONCAT('%', UPPER(:power_resilience), '%')
     )
+    AND (NOT EXISTS (SELECT 1 FROM search_trigrams) OR vfsites.site_code IN (SELECT site_code FROM search_sites))
     AND (
       :network_domain IS NULL
       OR (UPPER(:network_domain) = 'MOBILE' AND site_type IN ('MTX','LTC'))
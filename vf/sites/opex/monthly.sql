@@ -94,11 +94,29 @@ WITH user_blacklist_opex AS (
 -------------------------------------------------------------------
 -- 1. Potential helper sets
 -------------------------------------------------------------------
-unique_postal_codes AS (
-  SELECT postcode
-  FROM vdf.vfsites
-  GROUP BY postcode
-  HAVING COUNT(*) = 1
+search_terms AS (
+  -- Substring filters: each search term, its trigrams, and the sites having
+  -- all of them (vfsites_trigram, built by sqlite/vfsites_search.sql.post).
+  -- Terms shorter than 3 characters or holding LIKE wildcards are left to
+  -- the ILIKE filters alone; those still decide for every site.
+  SELECT field, UPPER(term) AS term
+  FROM (VALUES ('site_name', :site_name), ('address', :site_address),
+               ('comments', :comments), ('power_resilience', :power_resilience)) AS t(field, term)
+  WHERE LENGTH(term) >= 3
+    AND STRPOS(term, '%') = 0 AND STRPOS(term, '_') = 0 AND STRPOS(term, '\') = 0
+),
+search_trigrams AS (
+  SELECT DISTINCT st.field, SUBSTR(st.term, g, 3) AS trigram
+  FROM search_terms st
+    CROSS JOIN generate_series(1, LENGTH(st.term) - 2) AS g
+),
+search_sites AS (
+  SELECT tg.site_code
+  FROM search_trigrams q
+    INNER JOIN vdf.vfsites_trigram tg
+      ON tg.field = q.field AND tg.trigram = q.trigram
+  GROUP BY tg.site_code
+  HAVING COUNT(*) = (SELECT COUNT(*) FROM search_trigrams)
 ),
 split_site_codes AS (
   SELECT TRIM(x) AS code
@@ -190,6 +208,7 @@ filtered_sites AS (
       :power_resilience IS NULL
       OR UPPER(power_resilience) ILIKE CONCAT('%', UPPER(:power_resilience), '%')
     )
+    AND (NOT EXISTS (SELECT 1 FROM search_trigrams) OR vfsites.site_code IN (SELECT site_code FROM search_sites))
     AND (
       :network_domain IS NULL
       OR (UPPER(:network_domain) = 'MOBILE' AND site_type IN ('MTX','LTC'))
@@ -224,22 +243,11 @@ site_months_joined_tmp AS (
       END
     ) AS cost_k_gbp
   FROM site_months sm
-  /* Join bridging, so we can match site_code to vfopex.sitecode via vfbridge: */
-  INNER JOIN vdf.vfbridge b
-    ON UPPER(TRIM(b.site_code)) = UPPER(TRIM(sm.site_code))
-    OR (b.postcode=sm.postcode AND b.postcode IN (
-      select postcode from unique_postal_codes)
-    )
-    OR (
-       b.site_code IS NOT NULL
-       AND (
-         TRIM(sm.site_code) LIKE CONCAT('%(', UPPER(TRIM(b.site_code)), ')%')
-       )
-       OR (UPPER(TRIM(b.site_code)) ~ CONCAT(sm.site_code, '\\s*[,&].*'))
-       OR (UPPER(TRIM(b.site_code)) ~ CONCAT('.*[,&]\\s*', sm.site_code))
-    )
+  /* site_code => vfopex.sitecode, resolved at build time (sqlite/vfsummary_opex.sql.post): */
+  INNER JOIN vdf.vf_site_bridge b
+    ON b.site_code = sm.site_code
   INNER JOIN vdf.vfopex o
-    ON UPPER(TRIM(b.bridge_site_code)) = UPPER(TRIM(o.sitecode))
+    ON b.bridge_key = UPPER(TRIM(o.sitecode))
     AND DATE_PART('year',  CAST(o.reading_date AS DATE))  = :year
     AND DATE_PART('month', CAST(o.reading_date AS DATE)) = sm.month_num
 ),
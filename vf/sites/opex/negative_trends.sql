@@ -91,11 +91,29 @@ WITH user_blacklist_opex AS (
 --------------------------------------------------------------------
 -- 1. Filter Sites
 --------------------------------------------------------------------
-unique_postal_codes AS (
-  SELECT postcode
-  FROM vdf.vfsites
-  GROUP BY postcode
-  HAVING COUNT(*)=1
+search_terms AS (
+  -- Substring filters: each search term, its trigrams, and the sites having
+  -- all of them (vfsites_trigram, built by sqlite/vfsites_search.sql.post).
+  -- Terms shorter than 3 characters or holding LIKE wildcards are left to
+  -- the ILIKE filters alone; those still decide for every site.
+  SELECT field, UPPER(term) AS term
+  FROM (VALUES ('site_name', :site_name), ('address', :site_address),
+               ('comments', :comments), ('power_resilience', :power_resilience)) AS t(field, term)
+  WHERE LENGTH(term) >= 3
+    AND STRPOS(term, '%') = 0 AND STRPOS(term, '_') = 0 AND STRPOS(term, '\') = 0
+),
+search_trigrams AS (
+  SELECT DISTINCT st.field, SUBSTR(st.term, g, 3) AS trigram
+  FROM search_terms st
+    CROSS JOIN generate_series(1, LENGTH(st.term) - 2) AS g
+),
+search_sites AS (
+  SELECT tg.site_code
+  FROM search_trigrams q
+    INNER JOIN vdf.vfsites_trigram tg
+      ON tg.field = q.field AND tg.trigram = q.trigram
+  GROUP BY tg.site_code
+  HAVING COUNT(*) = (SELECT COUNT(*) FROM search_trigrams)
 ),
 split_site_codes AS (
   SELECT TRIM(x) AS code
@@ -176,6 +194,7 @@ filtered_sites AS (
       :power_resilience IS NULL
       OR UPPER(power_resilience) ILIKE CONCAT('%', UPPER(:power_resilience), '%')
     )
+    AND (NOT EXISTS (SELECT 1 FROM search_trigrams) OR vfsites.site_code IN (SELECT site_code FROM search_sites))
     AND (
       :network_domain IS NULL
       OR (
@@ -190,123 +209,45 @@ filtered_sites AS (
 ),
 
 --------------------------------------------------------------------
--- 2. Month Range + CROSS JOIN => site_months
---------------------------------------------------------------------
-month_range AS (
-  SELECT generate_series(:min_month, :max_month) AS month_num
-),
-site_months AS (
-  SELECT fs.site_code, mr.month_num
-  FROM filtered_sites fs
-  CROSS JOIN month_range mr
-),
-
---------------------------------------------------------------------
--- 3. Retrieve monthly cost directly from vfopex (already imputed).
---    If there are truly no cost rows, we consider cost=0 for that month.
---------------------------------------------------------------------
-site_month_costs AS (
-  SELECT
-    sm.site_code,
-    sm.month_num,
-    SUM(
-      CASE WHEN o.reading_value IS NOT NULL
-           THEN CAST(o.reading_value AS DECIMAL)*0.25/1000
-           ELSE 0
-      END
-    ) AS cost_k_gbp
-  FROM site_months sm
-  LEFT JOIN vdf.vfbridge b
-    ON UPPER(TRIM(b.site_code))=UPPER(TRIM(sm.site_code))
-    OR (
-      b.postcode IN (SELECT postcode FROM unique_postal_codes)
-      AND b.postcode=(
-        SELECT fs.postcode FROM filtered_sites fs
-        WHERE fs.site_code=sm.site_code
-        LIMIT 1
-      )
-    )
-    OR (
-      b.site_code IS NOT NULL
-      AND (
-        TRIM(sm.site_code) LIKE CONCAT('%(', UPPER(TRIM(b.site_code)), ')%')
-      )
-      OR (UPPER(TRIM(b.site_code)) ~ CONCAT(sm.site_code,'\\s*[,&].*'))
-      OR (UPPER(TRIM(b.site_code)) ~ CONCAT('.*[,&]\\s*',sm.site_code))
-    )
-  LEFT JOIN vdf.vfopex o
-    ON UPPER(TRIM(b.bridge_site_code))=UPPER(TRIM(o.sitecode))
-    AND DATE_PART('year',  CAST(o.reading_date AS DATE)) = :year
-    AND DATE_PART('month', CAST(o.reading_date AS DATE))=sm.month_num
-  GROUP BY sm.site_code, sm.month_num
-),
-
---------------------------------------------------------------------
--- 4. ordered_costs => each row with cost_k_gbp plus LEAD(cost_k_gbp)
---    We'll check if next_cost < cost_k_gbp => negative slope
---------------------------------------------------------------------
-ordered_costs AS (
-  SELECT
-    site_code,
-    month_num,
-    cost_k_gbp,
-    LEAD(cost_k_gbp) OVER (
-      PARTITION BY site_code
-      ORDER BY month_num
-    ) AS next_cost
-  FROM site_month_costs
-),
-
---------------------------------------------------------------------
--- 5. negative_trend_sites => check strict decreasing
---    => "BOOL_AND(next_cost < cost_k_gbp OR next_cost IS NULL)"
+-- 2. Trend of each site over min_month..max_month of :year, looked up in
+--    vf_site_opex_trend (built by opex_analytics.py from vf_site_month_opex).
+--    A site without a row (a year without Opex data) costs 0 every month,
+--    which is a strict trend of one month only.
 --------------------------------------------------------------------
 negative_trend_sites AS (
-  SELECT site_code
-  FROM ordered_costs
-  GROUP BY site_code
-  HAVING BOOL_AND(
-    (next_cost < cost_k_gbp) OR (next_cost IS NULL)
-  )
-),
-
---------------------------------------------------------------------
--- 6. min_max_costs => find first & last cost for each site to measure drop%
---------------------------------------------------------------------
-min_max_costs AS (
   SELECT
-    site_code,
-    FIRST_VALUE(cost_k_gbp) OVER w AS first_cost,
-    LAST_VALUE(cost_k_gbp)  OVER w AS last_cost
-  FROM site_month_costs
-  WINDOW w AS (
-    PARTITION BY site_code
-    ORDER BY month_num
-    ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
-  )
+    fs.site_code,
+    COALESCE(CAST(t.first_cost_k_gbp AS DECIMAL), 0) AS first_cost,
+    COALESCE(CAST(t.last_cost_k_gbp AS DECIMAL), 0)  AS last_cost
+  FROM filtered_sites fs
+  LEFT JOIN vdf.vf_site_opex_trend t
+    ON t.site_code=fs.site_code
+    AND t.year=:year
+    AND t.min_month=:min_month
+    AND t.max_month=:max_month
+  WHERE COALESCE(t.decreasing=1, :min_month=:max_month)
 ),
 
 --------------------------------------------------------------------
--- 7. Combine => final with drop_percentage
+-- 3. Combine => final with drop_percentage
 --------------------------------------------------------------------
 trend_with_drop AS (
   SELECT distinct
     nts.site_code,
-    mmc.first_cost,
-    mmc.last_cost,
+    nts.first_cost,
+    nts.last_cost,
     CASE
-      WHEN mmc.first_cost=0 THEN NULL
+      WHEN nts.first_cost=0 THEN NULL
       ELSE ROUND(
-        ((mmc.first_cost - mmc.last_cost)/mmc.first_cost)*100,
+        ((nts.first_cost - nts.last_cost)/nts.first_cost)*100,
         2
       )
     END AS drop_percentage
   FROM negative_trend_sites nts
-  JOIN min_max_costs mmc USING (site_code)
 )
 
 --------------------------------------------------------------------
--- 8. Return strictly decreasing sites plus drop info
+-- 4. Return strictly decreasing sites plus drop info
 --------------------------------------------------------------------
 SELECT distinct
   site_code,
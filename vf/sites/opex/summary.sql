@@ -80,12 +80,30 @@
 
 -- @return a list of site codes along with a related cost in thousands of British Pounds
 
-WITH unique_postal_codes AS (
-    SELECT postcode
-    FROM vdf.vfsites
-    GROUP BY postcode
-    HAVING count(*)=1
-), 
+WITH search_terms AS (
+  -- Substring filters: each search term, its trigrams, and the sites having
+  -- all of them (vfsites_trigram, built by sqlite/vfsites_search.sql.post).
+  -- Terms shorter than 3 characters or holding LIKE wildcards are left to
+  -- the ILIKE filters alone; those still decide for every site.
+  SELECT field, UPPER(term) AS term
+  FROM (VALUES ('site_name', :site_name), ('address', :site_address),
+               ('comments', :comments), ('power_resilience', :power_resilience)) AS t(field, term)
+  WHERE LENGTH(term) >= 3
+    AND STRPOS(term, '%') = 0 AND STRPOS(term, '_') = 0 AND STRPOS(term, '\') = 0
+),
+search_trigrams AS (
+  SELECT DISTINCT st.field, SUBSTR(st.term, g, 3) AS trigram
+  FROM search_terms st
+    CROSS JOIN generate_series(1, LENGTH(st.term) - 2) AS g
+),
+search_sites AS (
+  SELECT tg.site_code
+  FROM search_trigrams q
+    INNER JOIN vdf.vfsites_trigram tg
+      ON tg.field = q.field AND tg.trigram = q.trigram
+  GROUP BY tg.site_code
+  HAVING COUNT(*) = (SELECT COUNT(*) FROM search_trigrams)
+),
 split_site_codes AS (
   SELECT TRIM(x) AS code
   FROM regexp_split_to_table(COALESCE(:site_codes, ''), ',') AS x
@@ -143,6 +161,7 @@ filtered_sites AS (
 			(:restricted=true AND UPPER(vfsites.restricted) = 'TRUE') OR
 			(:restricted=false AND UPPER(vfsites.restricted) = 'FALSE'))
 		AND (:power_resilience IS NULL OR UPPER(vfsites.power_resilience) ILIKE CONCAT('%',:power_resilience,'%'))
+        AND (NOT EXISTS (SELECT 1 FROM search_trigrams) OR vfsites.site_code IN (SELECT site_code FROM search_sites))
         AND (
             :network_domain IS NULL
             OR (UPPER(:network_domain) = 'MOBILE' AND vfsites.site_type IN ('MTX','LTC'))
@@ -163,16 +182,9 @@ base_data AS (
         -- vfbridge.postcode as bridge_postcode, vfbridge.site_code as site_ref, 
         total_cost_in_k_gbp
     FROM filtered_sites
-        inner join vdf.vfbridge on upper(trim(vfbridge.site_code))=filtered_sites.site_code
-            OR (vfbridge.postcode=filtered_sites.postcode AND vfbridge.postcode IN (
-                select postcode from unique_postal_codes)
-            )
-            OR (vfbridge.site_code IS NOT NULL AND (
-                trim(filtered_sites.site_code) LIKE concat('%(',upper(trim(vfbridge.site_code)),')%'))
-                OR (upper(trim(vfbridge.site_code)) ~ concat(filtered_sites.site_code,'\\s*[,&].*'))
-                OR (upper(trim(vfbridge.site_code)) ~ concat('.*[,&]\\s*',filtered_sites.site_code))
-            )
-        inner join filtered_vfopex on upper(trim(vfbridge.bridge_site_code))=upper(trim(filtered_vfopex.sitecode))
+        -- site_code => vfopex.sitecode, resolved at build time (sqlite/vfsummary_opex.sql.post)
+        inner join vdf.vf_site_bridge vfbridge on vfbridge.site_code=filtered_sites.site_code
+        inner join filtered_vfopex on vfbridge.bridge_key=upper(trim(filtered_vfopex.sitecode))
     WHERE (:min_cost IS NULL OR total_cost_in_k_gbp>:min_cost) 
         AND 
         (:max_cost IS NULL OR total_cost_in_k_gbp<:max_cost)
@@ -86,6 +86,10 @@
 -- @type page_size integer
 -- @default page_size 50
 
+-- @param cursor keyset paging: '' for the first page, then the next_cursor of the last row of the previous page. When given, page is ignored and page_size counts sites; all rows of a site are on the same page.
+-- @type cursor varchar
+-- @default cursor null
+
 -- @param userid user identifier injected for authorization and data redaction purposes.
 -- @type userid varchar
 -- @default userid NULL
@@ -113,11 +117,30 @@ WITH user_blacklist_opex AS (
   FROM environment.secrets,
        unnest(string_to_array(secret, ',')) id
   WHERE name = 'user-blacklist-lease' AND id = :userid
-), unique_postal_codes AS (
-    SELECT postcode
-    FROM vdf.vfsites
-    GROUP BY postcode
-    HAVING COUNT(*)=1
+),
+search_terms AS (
+  -- Substring filters: each search term, its trigrams, and the sites having
+  -- all of them (vfsites_trigram, built by sqlite/vfsites_search.sql.post).
+  -- Terms shorter than 3 characters or holding LIKE wildcards are left to
+  -- the ILIKE filters alone; those still decide for every site.
+  SELECT field, UPPER(term) AS term
+  FROM (VALUES ('site_name', :site_name), ('address', :site_address),
+               ('comments', :comments), ('power_resilience', :power_resilience)) AS t(field, term)
+  WHERE LENGTH(term) >= 3
+    AND STRPOS(term, '%') = 0 AND STRPOS(term, '_') = 0 AND STRPOS(term, '\') = 0
+),
+search_trigrams AS (
+  SELECT DISTINCT st.field, SUBSTR(st.term, g, 3) AS trigram
+  FROM search_terms st
+    CROSS JOIN generate_series(1, LENGTH(st.term) - 2) AS g
+),
+search_sites AS (
+  SELECT tg.site_code
+  FROM search_trigrams q
+    INNER JOIN vdf.vfsites_trigram tg
+      ON tg.field = q.field AND tg.trigram = q.trigram
+  GROUP BY tg.site_code
+  HAVING COUNT(*) = (SELECT COUNT(*) FROM search_trigrams)
 ),
 split_site_codes AS (
   SELECT TRIM(x) AS code
@@ -196,6 +219,8 @@ filtered_sites AS (
         :power_resilience IS NULL
         OR UPPER(power_resilience) ILIKE CONCAT('%', :power_resilience, '%')
       )
+      AND (NOT EXISTS (SELECT 1 FROM search_trigrams) OR vfsites.site_code IN (SELECT site_code FROM search_sites))
+      AND (:cursor IS NULL OR :topN IS NOT NULL OR vfsites.site_code > SPLIT_PART(:cursor, '|', 2))
       AND (
         :network_domain IS NULL
         OR (UPPER(:network_domain)='MOBILE' AND site_type IN ('MTX','LTC'))
@@ -219,19 +244,11 @@ base_data AS (
       fs.*,
       fv.base_cost_k_gbp
     FROM filtered_sites fs
-    JOIN vdf.vfbridge b
-      ON UPPER(TRIM(b.site_code))=UPPER(TRIM(fs.site_code))
-         OR (b.postcode = fs.postcode AND b.postcode IN (SELECT postcode FROM unique_postal_codes))
-         OR (
-           b.site_code IS NOT NULL
-           AND (
-             fs.site_code ILIKE CONCAT('%(',b.site_code,')%')
-             OR (UPPER(TRIM(b.site_code))~CONCAT(fs.site_code,'\\s*[,&].*'))
-             OR (UPPER(TRIM(b.site_code))~CONCAT('.*[,&]\\s*',fs.site_code))
-           )
-         )
+    -- site_code => vfopex.sitecode, resolved at build time (sqlite/vfsummary_opex.sql.post)
+    JOIN vdf.vf_site_bridge b
+      ON b.site_code=fs.site_code
     JOIN filtered_vfopex fv
-      ON UPPER(TRIM(b.bridge_site_code))=UPPER(TRIM(fv.sitecode))
+      ON b.bridge_key=UPPER(TRIM(fv.sitecode))
     -- ORDER / LIMIT logic for topN is below
 ),
 -- 4) Filter out min_cost / max_cost. Also do topN ordering.
@@ -243,7 +260,8 @@ base_data_filtered AS (
       AND (:max_cost IS NULL OR base_data.base_cost_k_gbp < :max_cost)
     ORDER BY
       CASE WHEN :topN IS NOT NULL THEN base_data.base_cost_k_gbp END DESC,
-      CASE WHEN :topN IS NULL THEN base_data.site_code END ASC
+      -- site_code also breaks cost ties, so topN and the pages are stable
+      base_data.site_code ASC
     LIMIT CASE WHEN :topN IS NOT NULL THEN :topN ELSE 1000 END
 ),
 -- 5. Forecast next X years using geometric growth at annual_growth_percent.
@@ -262,8 +280,9 @@ forecasted_years AS (
       ) AS forecasted_cost_k_gbp
     FROM base_data_filtered bd
     CROSS JOIN generate_series(1, COALESCE(:forecast_years,0)) AS g
-)
+),
 -- 6. Final SELECT then union of base year + the future years 
+page_rows AS (
 SELECT 
   bd.site_code,bd.site_name,bd.site_type,bd.site_category,bd.region,bd.status,bd.address,bd.postcode,
   bd.gis_migrated,bd.floorplans,bd.location,bd.comments,bd.restricted,bd.freehold_leasehold,bd.power_resilience,
@@ -281,6 +300,20 @@ SELECT
   fy.forecasted_cost_k_gbp
 FROM forecasted_years fy
 WHERE NOT EXISTS(SELECT * FROM user_blacklist_opex) -- redact all non-opex users
-ORDER BY site_code, forecast_year
-LIMIT :page_size
-OFFSET (:page - 1)*:page_size;
+),
+-- Keyset paging (:cursor given): the first page_size sites after the cursor
+-- site, with all of their rows. Without topN, site_code > cursor is also pushed
+-- down into filtered_sites, where the vfsites(site_code) index serves it.
+cursor_page AS (
+  SELECT DISTINCT site_code
+  FROM page_rows
+  WHERE :cursor IS NOT NULL AND site_code > SPLIT_PART(:cursor, '|', 2)
+  ORDER BY site_code
+  LIMIT :page_size
+)
+SELECT page_rows.*, CONCAT('|', page_rows.site_code) AS next_cursor
+FROM page_rows
+WHERE :cursor IS NULL OR page_rows.site_code IN (SELECT site_code FROM cursor_page)
+ORDER BY page_rows.site_code, page_rows.forecast_year
+LIMIT CASE WHEN :cursor IS NULL THEN :page_size END
+OFFSET CASE WHEN :cursor IS NULL THEN (:page - 1) * :page_size ELSE 0 END;
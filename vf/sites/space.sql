@@ -58,6 +58,10 @@
 -- @type page_size integer
 -- @default page_size 500
 
+-- @param cursor keyset paging: '' for the first page, then the next_cursor of the last row of the previous page. When given, page is ignored and page_size counts sites; all rows of a site are on the same page.
+-- @type cursor varchar
+-- @default cursor null
+
 -- @param free_sections_minimum min number of free sections
 -- @type free_sections_minimum integer
 -- @default free_sections_minimum null
@@ -255,7 +259,31 @@ WITH sites_excluded_duplicate_non_identical_numbers AS (
         MAX(gen_site_code) AS gen_site_code
     FROM space_pivot
     GROUP BY site_code
-), split_site_codes AS (
+), search_terms AS (
+  -- Substring filters: each search term, its trigrams, and the sites having
+  -- all of them (vfsites_trigram, built by sqlite/vfsites_search.sql.post).
+  -- Terms shorter than 3 characters or holding LIKE wildcards are left to
+  -- the ILIKE filters alone; those still decide for every site.
+  SELECT field, UPPER(term) AS term
+  FROM (VALUES ('site_name', :site_name), ('address', :site_address),
+               ('comments', :comments), ('power_resilience', :power_resilience)) AS t(field, term)
+  WHERE LENGTH(term) >= 3
+    AND STRPOS(term, '%') = 0 AND STRPOS(term, '_') = 0 AND STRPOS(term, '\') = 0
+),
+search_trigrams AS (
+  SELECT DISTINCT st.field, SUBSTR(st.term, g, 3) AS trigram
+  FROM search_terms st
+    CROSS JOIN generate_series(1, LENGTH(st.term) - 2) AS g
+),
+search_sites AS (
+  SELECT tg.site_code
+  FROM search_trigrams q
+    INNER JOIN vdf.vfsites_trigram tg
+      ON tg.field = q.field AND tg.trigram = q.trigram
+  GROUP BY tg.site_code
+  HAVING COUNT(*) = (SELECT COUNT(*) FROM search_trigrams)
+),
+split_site_codes AS (
   SELECT TRIM(x) AS code
   FROM regexp_split_to_table(COALESCE(:site_codes, ''), ',') AS x
 ),
@@ -337,6 +365,8 @@ filtered_sites AS (
           OR UPPER(vfsites.power_resilience) 
                ILIKE CONCAT('%', UPPER(:power_resilience), '%')
         )
+        AND (NOT EXISTS (SELECT 1 FROM search_trigrams) OR vfsites.site_code IN (SELECT site_code FROM search_sites))
+        AND (:cursor IS NULL OR vfsites.site_code > SPLIT_PART(:cursor, '|', 2))
         AND (
             :network_domain IS NULL
             OR (
@@ -511,8 +541,24 @@ combined AS (
           :location_occupied_area_maximum IS NULL 
           OR sb.location_occupied_area<=:location_occupied_area_maximum
         )
-)
+),
+page_rows AS (
 SELECT *
 FROM combined
-LIMIT COALESCE(:page_size, 500)
-OFFSET (COALESCE(:page, 1) - 1) * COALESCE(:page_size, 500);
+),
+-- Keyset paging (:cursor given): the first page_size sites after the cursor
+-- site, with all of their rows. site_code > cursor is also pushed down into
+-- filtered_sites, where the vfsites(site_code) index serves it.
+cursor_page AS (
+  SELECT DISTINCT site_code
+  FROM page_rows
+  WHERE :cursor IS NOT NULL AND site_code > SPLIT_PART(:cursor, '|', 2)
+  ORDER BY site_code
+  LIMIT COALESCE(:page_size, 500)
+)
+SELECT page_rows.*, CONCAT('|', page_rows.site_code) AS next_cursor
+FROM page_rows
+WHERE :cursor IS NULL OR page_rows.site_code IN (SELECT site_code FROM cursor_page)
+ORDER BY page_rows.site_code
+LIMIT CASE WHEN :cursor IS NULL THEN COALESCE(:page_size, 500) END
+OFFSET CASE WHEN :cursor IS NULL THEN (COALESCE(:page, 1) - 1) * COALESCE(:page_size, 500) ELSE 0 END;
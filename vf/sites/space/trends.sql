@@ -10,6 +10,10 @@
 -- @type page_size integer
 -- @default page_size 500
 
+-- @param cursor keyset paging: '' for the first page, then the next_cursor of the last row of the previous page. When given, page is ignored and page_size counts sites; all rows of a site are on the same page.
+-- @type cursor varchar
+-- @default cursor null
+
 -- @param userid user identifier injected for authorization and data redaction purposes.
 -- @type userid varchar
 -- @default userid NULL
@@ -65,6 +69,7 @@ filtered_sites AS (
       :site_codes IS NULL 
       OR UPPER(TRIM(site_code)) IN (SELECT UPPER(TRIM(code)) FROM split_site_codes)
     )
+    AND (:cursor IS NULL OR vfsites.site_code > SPLIT_PART(:cursor, '|', 2))
 ),
 combined AS (
     select s.*, free_sections_monthly_trend_2024
@@ -72,9 +77,25 @@ combined AS (
         LEFT OUTER JOIN fixed_historic fc 
             ON upper(trim(fc.general_equipment_area_code)) = trim(replace(replace(upper(s.site_code), '(GROUND FLOOR)', ''), 'ROOM', ''))
     WHERE original_site_type NOT IN ('MTX','LTC')
-)
+),
+page_rows AS (
 SELECT distinct *
 FROM combined
 WHERE NOT EXISTS(SELECT * FROM user_blacklist_space) -- redact all non-space users
-LIMIT COALESCE(:page_size, 500)
-OFFSET (COALESCE(:page, 1) - 1) * COALESCE(:page_size, 500);
+),
+-- Keyset paging (:cursor given): the first page_size sites after the cursor
+-- site, with all of their rows. site_code > cursor is also pushed down into
+-- filtered_sites, where the vfsites(site_code) index serves it.
+cursor_page AS (
+  SELECT DISTINCT site_code
+  FROM page_rows
+  WHERE :cursor IS NOT NULL AND site_code > SPLIT_PART(:cursor, '|', 2)
+  ORDER BY site_code
+  LIMIT COALESCE(:page_size, 500)
+)
+SELECT page_rows.*, CONCAT('|', page_rows.site_code) AS next_cursor
+FROM page_rows
+WHERE :cursor IS NULL OR page_rows.site_code IN (SELECT site_code FROM cursor_page)
+ORDER BY page_rows.site_code
+LIMIT CASE WHEN :cursor IS NULL THEN COALESCE(:page_size, 500) END
+OFFSET CASE WHEN :cursor IS NULL THEN (COALESCE(:page, 1) - 1) * COALESCE(:page_size, 500) ELSE 0 END;